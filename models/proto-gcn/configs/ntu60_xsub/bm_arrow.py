@@ -58,3 +58,4 @@ total_epochs = 5
 checkpoint_config = dict(interval=1)
 evaluation = dict(interval=1, metrics=['top_k_accuracy'])
 log_config = dict(interval=100, hooks=[dict(type='TextLoggerHook')])
+resource_config = dict(interval=1.)
@@ -1,9 +1,11 @@
-from mmcv.engine import multi_gpu_test, single_gpu_test
+from mmcv.engine import single_gpu_test
 
+from .export import build_export_model, default_input_shape
 from .inference import inference_recognizer, init_recognizer
+from .test import multi_gpu_test
 from .train import init_random_seed, train_model
 
 __all__ = [
     'train_model', 'init_recognizer', 'inference_recognizer', 'multi_gpu_test',
-    'single_gpu_test', 'init_random_seed'
+    'single_gpu_test', 'init_random_seed', 'build_export_model', 'default_input_shape'
 ]
@@ -0,0 +1,28 @@
+from mmcv.runner import load_checkpoint
+
+from protogcn.models import build_model
+from protogcn.utils import Graph, cache_checkpoint
+
+
+def default_input_shape(cfg):
+    """Get the input shape (N, num_clips, M, T, V, C) of the test pipeline."""
+    num_clips, clip_len = 1, 100
+    for step in cfg.data.test.pipeline:
+        if step['type'] == 'UniformSampleDecode':
+            num_clips, clip_len = step.get('num_clips', 1), step['clip_len']
+    in_channels = cfg.model.backbone.get('in_channels', 3)
+    num_person = cfg.model.backbone.get('num_person', 2)
+    num_joints = Graph(**cfg.model.backbone.graph_cfg).num_node
+    return (1, num_clips, num_person, clip_len, num_joints, in_channels)
+
+
+def build_export_model(cfg, checkpoint=None, average_clips=None):
+    """Build the recognizer in eval mode on CPU, with ``forward`` bound to ``forward_export``."""
+    model = build_model(cfg.model)
+    if checkpoint is not None:
+        load_checkpoint(model, cache_checkpoint(checkpoint), map_location='cpu')
+    if average_clips is not None:
+        model.test_cfg['average_clips'] = average_clips
+    model = model.cpu().eval()
+    model.forward = model.forward_export
+    return model
@@ -15,7 +15,7 @@ from protogcn.models import build_recognizer
 from protogcn.utils import cache_checkpoint
 
 
-def init_recognizer(config, checkpoint=None, device='cuda:0', **kwargs):
+def init_recognizer(config, checkpoint=None, device=None, **kwargs):
     """Initialize a recognizer from config file.
 
     Args:
@@ -23,8 +23,9 @@ def init_recognizer(config, checkpoint=None, device='cuda:0', **kwargs):
             object.
         checkpoint (str | None, optional): Checkpoint path/url. If set to None,
             the model will not load any weights. Default: None.
-        device (str | :obj:`torch.device`): The desired device of returned
-            tensor. Default: 'cuda:0'.
+        device (str | :obj:`torch.device` | None): The desired device of
+            returned tensor. None means 'cuda:0' if it is available,
+            otherwise 'cpu'. Default: None.
 
     Returns:
         nn.Module: The constructed recognizer.
@@ -48,6 +49,8 @@ def init_recognizer(config, checkpoint=None, device='cuda:0', **kwargs):
         checkpoint = cache_checkpoint(checkpoint)
         load_checkpoint(model, checkpoint, map_location='cpu')
     model.cfg = config
+    if device is None:
+        device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
     model.to(device)
     model.eval()
     return model
@@ -0,0 +1,81 @@
+import mmcv
+import time
+import torch
+import torch.nn as nn
+from mmcv.engine import collect_results_cpu
+from mmcv.runner import get_dist_info
+from torch.utils.data import DataLoader
+from typing import Optional
+
+from protogcn.core import ScoreSink, collect_results_gpu
+
+
+def multi_gpu_test(model: nn.Module,
+                   data_loader: DataLoader,
+                   tmpdir: Optional[str] = None,
+                   gpu_collect: bool = False,
+                   sink: Optional[ScoreSink] = None) -> Optional[list]:
+    """Test model with multiple gpus.
+    This method tests model with multiple gpus and collects the results
+    under two different modes: gpu and cpu modes. By setting
+    ``gpu_collect=True``, it gathers the results as tensors with the
+    collectives of the process group (NCCL or gloo), by sample index. On cpu
+    mode it saves the results on different gpus to ``tmpdir`` and collects
+    them by the rank 0 worker.
+    Args:
+        model (nn.Module): Model to be tested.
+        data_loader (nn.Dataloader): Pytorch data loader.
+        tmpdir (str): Path of directory to save the temporary results from
+            different gpus under cpu mode.
+        gpu_collect (bool): Option to use either gpu or cpu to collect results.
+        sink (ScoreSink | None): If given, the results of every batch are written to the sink at the ids of their
+            samples, and nothing is kept or collected.
+    Returns:
+        list: The prediction results, None with a sink.
+    """
+    model.eval()
+    results = []
+    dataset = data_loader.dataset
+    rank, world_size = get_dist_info()
+    # optional: save graphs for visualization
+    # save_graph = []
+    if sink is not None:
+        # the test sampler strides the (padded) sample ids over the ranks, the padding repeats the first samples
+        indices = [idx for i, idx in enumerate(data_loader.sampler) if rank + i * world_size < len(dataset)]
+        position = 0
+
+    if rank == 0:
+        prog_bar = mmcv.ProgressBar(len(dataset))
+    time.sleep(2)  # This line can prevent deadlock problem in some cases.
+    for i, data in enumerate(data_loader):
+        with torch.inference_mode():
+            result = model(return_loss=False, **data) 
+            # result, get_graph = model(return_loss=False, **data)
+        if sink is None:
+            results.extend(result)
+        else:
+            batch_indices = indices[position:position + len(result)]
+            sink.update(batch_indices, result[:len(batch_indices)])
+            position += len(result)
+        # save_graph.append(get_graph)
+        
+        if rank == 0:
+            batch_size = len(result)
+            batch_size_all = batch_size * world_size
+            if batch_size_all + prog_bar.completed > len(dataset):
+                batch_size_all = len(dataset) - prog_bar.completed
+            for _ in range(batch_size_all):
+                prog_bar.update()
+
+    # collect results from all ranks
+    if sink is not None:
+        return None
+    if gpu_collect:
+        result_from_ranks = collect_results_gpu(results, len(dataset), list(data_loader.sampler))
+    else:
+        result_from_ranks = collect_results_cpu(results, len(dataset), tmpdir)
+
+    # graph_data = np.array(save_graph)
+    # np.save('graph.npy', graph_data)
+    
+    return result_from_ranks
@@ -6,11 +6,13 @@ import torch
 import torch.distributed as dist
 from mmcv.engine import multi_gpu_test
 from mmcv.parallel import MMDistributedDataParallel
-from mmcv.runner import DistSamplerSeedHook, EpochBasedRunner, OptimizerHook, build_optimizer, get_dist_info
+from mmcv.runner import DistSamplerSeedHook, OptimizerHook, build_optimizer, build_runner, get_dist_info
 
-from ..core import DistEvalHook
+from ..core import (AmpOptimizerHook, AsyncEvalHook, DistEvalHook, IterCheckpointHook, IterProfilerHook,
+                    LogVarsReduceHook, PrometheusHook, ResourceMonitorHook)
 from ..datasets import build_dataloader, build_dataset
-from ..utils import cache_checkpoint, get_root_logger
+from ..models import Distiller
+from ..utils import cache_checkpoint, get_device, get_root_logger
 
 
 def init_random_seed(seed=None, device='cuda'):
@@ -66,6 +68,12 @@ def train_model(model,
             Default: None
     """
     logger = get_root_logger(log_level=cfg.get('log_level', 'INFO'))
+    device = get_device(cfg.get('device', None))
+
+    # the epoch-based runner runs cfg.total_epochs, the iteration-based one
+    # cfg.runner.max_iters
+    runner_cfg = cfg.get('runner', dict(type='EpochBasedRunner'))
+    iter_based = runner_cfg['type'] == 'IterBasedRunner'
 
     # prepare data loaders
     dataset = dataset if isinstance(dataset, (list, tuple)) else [dataset]
@@ -74,39 +82,72 @@ def train_model(model,
         videos_per_gpu=cfg.data.get('videos_per_gpu', 1),
         workers_per_gpu=cfg.data.get('workers_per_gpu', 1),
         persistent_workers=cfg.data.get('persistent_workers', False),
-        seed=cfg.seed)
+        infinite_sampler=cfg.data.get('infinite_sampler', iter_based),
+        pin_memory=device == 'cuda',
+        seed=cfg.seed,
+        # the workers of an epoch resumed by IterCheckpointHook are re-seeded
+        epoch_seed=cfg.get('iter_checkpoint_config', None) is not None)
     dataloader_setting = dict(dataloader_setting,
                               **cfg.data.get('train_dataloader', {}))
 
     data_loaders = [
         build_dataloader(ds, **dataloader_setting) for ds in dataset
     ]
+    if iter_based and dataloader_setting['infinite_sampler']:
+        # the runner iterates over the endless DataLoader, not over the epochs
+        data_loaders = [x.data_loader for x in data_loaders]
+
+    # mixed precision: the forward runs under autocast with the given dtype, by default float16 on cuda and bfloat16
+    # (without loss scaling) on cpu, where float16 autocast is slow or unsupported
+    fp16_cfg = cfg.get('fp16', None)
+    if fp16_cfg is not None:
+        fp16_cfg = dict(fp16_cfg)
+        model.amp_dtype = getattr(torch, fp16_cfg.pop('dtype', 'float16' if device == 'cuda' else 'bfloat16'))
+
+    # distillation: the frozen teacher(s) are attached to the student, outside of its modules
+    if cfg.get('distill', None) is not None:
+        model.distiller = Distiller(**cfg.distill).to(device)
+        logger.info(f'Distilling from {len(model.distiller.teachers)} teacher(s): '
+                    f'{", ".join(t["config"] for t in cfg.distill.teachers)}')
 
     # put model on gpus
     find_unused_parameters = cfg.get('find_unused_parameters', True)
     # Sets the `find_unused_parameters` parameter in
     # torch.nn.parallel.DistributedDataParallel
     
-    model = MMDistributedDataParallel(
-        model.cuda(),
-        device_ids=[torch.cuda.current_device()],
-        broadcast_buffers=False,
-        find_unused_parameters=find_unused_parameters)
+    if device == 'cuda':
+        model = MMDistributedDataParallel(
+            model.cuda(),
+            device_ids=[torch.cuda.current_device()],
+            broadcast_buffers=False,
+            find_unused_parameters=find_unused_parameters)
+    else:
+        model = MMDistributedDataParallel(
+            model.cpu(),
+            broadcast_buffers=False,
+            find_unused_parameters=find_unused_parameters)
 
     # build runner
     optimizer = build_optimizer(model, cfg.optimizer)
 
-    Runner = EpochBasedRunner
-    runner = Runner(
-        model,
-        optimizer=optimizer,
-        work_dir=cfg.work_dir,
-        logger=logger,
-        meta=meta)
+    runner = build_runner(
+        runner_cfg,
+        default_args=dict(
+            model=model,
+            optimizer=optimizer,
+            work_dir=cfg.work_dir,
+            logger=logger,
+            meta=meta))
     # an ugly workaround to make .log and .log.json filenames the same
     runner.timestamp = timestamp
 
-    if 'type' not in cfg.optimizer_config:
+    if fp16_cfg is not None:
+        optimizer_config = dict(cfg.optimizer_config, **fp16_cfg)
+        # the loss scaling of mixed precision is done by AmpOptimizerHook
+        hook_type = optimizer_config.pop('type', 'OptimizerHook')
+        assert hook_type in ('OptimizerHook', 'AmpOptimizerHook'), f'fp16 is not supported with {hook_type}'
+        optimizer_config = AmpOptimizerHook(**optimizer_config)
+    elif 'type' not in cfg.optimizer_config:
         optimizer_config = OptimizerHook(**cfg.optimizer_config)
     else:
         optimizer_config = cfg.optimizer_config
@@ -115,30 +156,61 @@ def train_model(model,
     runner.register_training_hooks(cfg.lr_config, optimizer_config,
                                    cfg.checkpoint_config, cfg.log_config,
                                    cfg.get('momentum_config', None))
-    runner.register_hook(DistSamplerSeedHook())
+    if not iter_based:
+        runner.register_hook(DistSamplerSeedHook())
+    if cfg.get('iter_checkpoint_config', None) is not None:
+        assert not iter_based, 'The checkpoints of IterBasedRunner are by iteration, use checkpoint_config'
+        # after the optimizer step, before the epoch checkpoint
+        runner.register_hook(IterCheckpointHook(**cfg.iter_checkpoint_config), priority='ABOVE_NORMAL')
+    if cfg.get('profiler_config', None) is not None:
+        # after all the other hooks of the iteration
+        runner.register_hook(IterProfilerHook(**cfg.profiler_config), priority='LOWEST')
+    if cfg.log_config is not None:
+        runner.register_hook(LogVarsReduceHook(interval=cfg.log_config.get('interval', 10), by_epoch=not iter_based))
+    if cfg.get('prometheus_config', None) is not None:
+        # after the timer and the logged losses
+        runner.register_hook(PrometheusHook(**cfg.prometheus_config), priority='VERY_LOW')
+    if cfg.get('resource_config', None) is not None:
+        runner.register_hook(ResourceMonitorHook(**cfg.resource_config))
 
     eval_hook = None
     if validate:
-        eval_cfg = cfg.get('evaluation', {})
+        eval_cfg = dict(cfg.get('evaluation', {}))
+        async_cfg = eval_cfg.pop('async_eval', None)
+        if iter_based:
+            eval_cfg.setdefault('by_epoch', False)
         val_dataset = build_dataset(cfg.data.val, dict(test_mode=True))
         dataloader_setting = dict(
             videos_per_gpu=cfg.data.get('videos_per_gpu', 1),
             workers_per_gpu=cfg.data.get('workers_per_gpu', 1),
             persistent_workers=cfg.data.get('persistent_workers', False),
+            pin_memory=device == 'cuda',
             shuffle=False)
         dataloader_setting = dict(dataloader_setting,
                                   **cfg.data.get('val_dataloader', {}))
         val_dataloader = build_dataloader(val_dataset, **dataloader_setting)
-        eval_hook = DistEvalHook(val_dataloader, **eval_cfg)
+        if async_cfg is not None:
+            # evaluate in a side process, the training goes on meanwhile
+            eval_hook = AsyncEvalHook(val_dataloader, cfg.model, cfg.data.val, **async_cfg, **eval_cfg)
+        else:
+            eval_hook = DistEvalHook(val_dataloader, **eval_cfg)
         runner.register_hook(eval_hook)
 
     if cfg.get('resume_from', None):
-        runner.resume(cfg.resume_from)
+        # the default map_location of IterBasedRunner.resume is the current cuda device
+        runner.resume(cfg.resume_from, map_location='default' if device == 'cuda' else 'cpu')
     elif cfg.get('load_from', None):
         cfg.load_from = cache_checkpoint(cfg.load_from)
         runner.load_checkpoint(cfg.load_from)
 
-    runner.run(data_loaders, cfg.workflow, cfg.total_epochs)
+    if iter_based:
+        if dataloader_setting['infinite_sampler']:
+            # the data of a resumed training goes on at the next unseen batch
+            for data_loader in data_loaders:
+                data_loader.batch_sampler.resume(runner.iter)
+        runner.run(data_loaders, cfg.workflow)
+    else:
+        runner.run(data_loaders, cfg.workflow, cfg.total_epochs)
 
     dist.barrier()
     time.sleep(2)
@@ -171,6 +243,7 @@ def train_model(model,
             videos_per_gpu=cfg.data.get('videos_per_gpu', 1),
             workers_per_gpu=cfg.data.get('workers_per_gpu', 1),
             persistent_workers=cfg.data.get('persistent_workers', False),
+            pin_memory=device == 'cuda',
             shuffle=False)
         dataloader_setting = dict(dataloader_setting,
                                   **cfg.data.get('test_dataloader', {}))
@@ -199,7 +272,7 @@ def train_model(model,
                 eval_cfg = cfg.get('evaluation', {})
                 for key in [
                         'interval', 'tmpdir', 'start',
-                        'save_best', 'rule', 'by_epoch', 'broadcast_bn_buffers'
+                        'save_best', 'rule', 'by_epoch', 'broadcast_bn_buffers', 'async_eval'
                 ]:
                     eval_cfg.pop(key, None)
 
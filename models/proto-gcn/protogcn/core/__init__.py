@@ -1,2 +1,9 @@
+from .async_eval import *
+from .collect import *
 from .evaluation import *
+from .fusion import *
 from .hooks import *
+from .profiler import *
+from .prometheus import *
+from .resource_monitor import *
+from .score_sink import *
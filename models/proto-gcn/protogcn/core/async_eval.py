@@ -0,0 +1,243 @@
+import atexit
+import mmcv
+import os
+import os.path as osp
+import queue
+import time
+import torch
+import torch.multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from mmcv.parallel import is_module_wrapper
+from mmcv.runner import LoggerHook
+from mmcv.runner.checkpoint import get_state_dict
+
+from .evaluation import DistEvalHook
+from .hooks import _cpu_clone
+
+__all__ = ['AsyncEvalHook']
+
+
+def _evaluator_loop(model_cfg, data_cfg, loader_cfg, eval_kwargs, device, num_threads, tasks, results):
+    """The evaluator process: test every state dict of ``tasks`` on the val set and put the metrics in ``results``."""
+    # protogcn.models and protogcn.datasets import protogcn.core
+    from mmcv.parallel import MMDataParallel
+    from mmcv.runner import load_state_dict
+
+    from ..datasets import build_dataloader, build_dataset
+    from ..models import build_model
+
+    torch.set_num_threads(num_threads)
+    dataset = build_dataset(data_cfg, dict(test_mode=True))
+    data_loader = build_dataloader(dataset, shuffle=False, **loader_cfg)
+    model = build_model(model_cfg)
+    if device == 'cpu':
+        model = MMDataParallel(model.cpu())
+    else:
+        model = MMDataParallel(model.to(device), device_ids=[torch.device(device).index or 0])
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        step, state_dict = task
+        try:
+            tic = time.time()
+            load_state_dict(model.module, state_dict)
+            del state_dict
+            model.eval()
+            outputs = []
+            with torch.inference_mode():
+                for data in data_loader:
+                    outputs.extend(model(return_loss=False, **data))
+            eval_res = dataset.evaluate(outputs, logger='silent', **eval_kwargs)
+            results.put((step, dict(eval_res), time.time() - tic, None))
+        except Exception as e:  # reported to the trainer, which raises it
+            results.put((step, None, 0., repr(e)))
+
+
+class AsyncEvalHook(DistEvalHook):
+    """Evaluate in a side process while the training goes on.
+
+    At every evaluation interval, rank 0 copies the weights to the cpu (the only part the training waits for, as
+    ``AsyncCheckpointHook``) and hands them to an evaluator process through shared memory, which runs the val pipeline
+    and ``BaseDataset.evaluate`` on its own device and threads (spare cores of a CPU node by default, or a spare GPU
+    given as ``device``). The training does not wait: the metrics are picked up after the following iterations, in
+    the order of the snapshots, and written to the training logs as the ``Epoch(val)`` record of the epoch they were
+    computed for. ``save_best`` writes the snapshot of the best epoch (weights and meta, without the optimizer state)
+    as ``best_{key}_epoch_{n}.pth`` in a background thread. At most ``max_pending`` snapshots wait for the evaluator,
+    beyond that the training waits for the oldest one, and the end of the training waits for all.
+
+    Args:
+        dataloader (DataLoader): The val dataloader of the trainer, only its batch size and length are used.
+        model_cfg (dict): Config of the model.
+        data_cfg (dict): Config of the val dataset.
+        device (str): The device of the evaluator, e.g. 'cuda:1' for a GPU the ranks do not use. Default: 'cpu'.
+        num_threads (int): Number of intra-op threads of the evaluator. Default: 1.
+        workers (int): Number of DataLoader workers of the evaluator. Default: 0.
+        max_pending (int): Max number of snapshots waiting for the evaluator. Default: 2.
+        **kwargs: Arguments of ``DistEvalHook`` (interval, save_best, metrics, ...).
+    """
+
+    def __init__(self,
+                 dataloader,
+                 model_cfg,
+                 data_cfg,
+                 device='cpu',
+                 num_threads=1,
+                 workers=0,
+                 max_pending=2,
+                 **kwargs):
+        super().__init__(dataloader, **kwargs)
+        self.model_cfg = model_cfg
+        self.data_cfg = data_cfg
+        self.device = device
+        self.num_threads = num_threads
+        self.workers = workers
+        self.max_pending = max_pending
+        self.process = None
+        self.pending = []
+        self.wait_time = 0.
+        self.writer = None
+        self.future = None
+
+    def before_run(self, runner):
+        super().before_run(runner)
+        if runner.rank != 0:
+            return
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        # the tensors put in the queues of torch.multiprocessing go through shared memory
+        ctx = mp.get_context('spawn')
+        self.tasks, self.results = ctx.Queue(), ctx.Queue()
+        loader_cfg = dict(
+            videos_per_gpu=self.dataloader.batch_size, workers_per_gpu=self.workers, pin_memory=self.device != 'cpu')
+        self.process = ctx.Process(
+            target=_evaluator_loop,
+            args=(self.model_cfg, self.data_cfg, loader_cfg, self.eval_kwargs, self.device, self.num_threads,
+                  self.tasks, self.results))
+        self.process.start()
+        atexit.register(self._shutdown)
+        runner.logger.info(f'Async evaluation in process {self.process.pid} on {self.device}')
+
+    def _do_evaluate(self, runner):
+        """Hand a snapshot of the weights to the evaluator."""
+        if runner.rank != 0:
+            return
+        step = runner.epoch + 1 if self.by_epoch else runner.iter + 1
+        model = runner.model.module if is_module_wrapper(runner.model) else runner.model
+        state_dict = _cpu_clone(get_state_dict(model))
+        meta = _cpu_clone(
+            dict(runner.meta or {}, epoch=runner.epoch + 1, iter=runner.iter, mmcv_version=mmcv.__version__,
+                 time=time.asctime()))
+        if getattr(model, 'CLASSES', None) is not None:
+            meta.update(CLASSES=model.CLASSES)
+        self.tasks.put((step, state_dict))
+        self.pending.append((step, dict(meta=meta, state_dict=state_dict)))
+        if len(self.pending) > self.max_pending:
+            self._collect(runner, block=len(self.pending) - self.max_pending)
+
+    def after_train_iter(self, runner):
+        super().after_train_iter(runner)
+        if runner.rank == 0 and self.pending:
+            self._collect(runner)
+
+    def after_run(self, runner):
+        if runner.rank != 0:
+            return
+        self._collect(runner, block=len(self.pending))
+        self._shutdown()
+        self._wait_write()
+        self.writer.shutdown()
+        runner.logger.info(f'The training waited {self.wait_time:.1f}s for the async evaluation')
+
+    def _collect(self, runner, block=0):
+        """Report the finished evaluations, waiting for the first ``block`` pending ones."""
+        while self.pending:
+            try:
+                if block > 0:
+                    tic = time.time()
+                    result = self._wait_result()
+                    self.wait_time += time.time() - tic
+                    block -= 1
+                else:
+                    result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            step, eval_res, elapsed, error = result
+            # the evaluator handles the snapshots one by one, in order
+            expected, checkpoint = self.pending.pop(0)
+            assert step == expected, f'Got the evaluation of {step}, expected {expected}'
+            if error is not None:
+                raise RuntimeError(f'The async evaluation of {"epoch" if self.by_epoch else "iter"} {step} failed: '
+                                   f'{error}')
+            self._report(runner, step, eval_res, elapsed)
+            key_score = eval_res.get(self._key_indicator(eval_res)) if self.save_best else None
+            if key_score is not None:
+                self._save_snapshot(runner, step, key_score, checkpoint)
+
+    def _wait_result(self):
+        while True:
+            try:
+                return self.results.get(timeout=5)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f'The async evaluator exited with code {self.process.exitcode}')
+
+    def _key_indicator(self, eval_res):
+        if self.key_indicator == 'auto' and eval_res:
+            self._init_rule(self.rule, list(eval_res.keys())[0])
+        return self.key_indicator
+
+    def _report(self, runner, step, eval_res, elapsed):
+        """Write the metrics to the logs of the LoggerHooks, as the val record of ``step``."""
+        runner.logger.info(f'Async evaluation of {"epoch" if self.by_epoch else "iter"} {step} took {elapsed:.1f}s')
+        output = runner.log_buffer.output
+        saved_output, saved_epoch = dict(output), runner._epoch
+        output.clear()
+        output.update(eval_res)
+        output['eval_iter_num'] = len(self.dataloader)
+        if self.by_epoch:
+            runner._epoch = step - 1
+        for hook in runner.hooks:
+            if isinstance(hook, LoggerHook):
+                hook.log(runner)
+        runner._epoch = saved_epoch
+        output.clear()
+        output.update(saved_output)
+
+    def _save_snapshot(self, runner, step, key_score, checkpoint):
+        """Write the snapshot of ``step`` as the best checkpoint if ``key_score`` is the best so far."""
+        best_score = runner.meta['hook_msgs'].get('best_score', self.init_value_map[self.rule])
+        if not self.compare_func(key_score, best_score):
+            return
+        runner.meta['hook_msgs']['best_score'] = key_score
+        old_path = self.best_ckpt_path
+        current = f'{"epoch" if self.by_epoch else "iter"}_{step}'
+        self.best_ckpt_path = osp.join(self.out_dir, f'best_{self.key_indicator}_{current}.pth')
+        runner.meta['hook_msgs']['best_ckpt'] = self.best_ckpt_path
+        self._wait_write()
+        self.future = self.writer.submit(self._write, checkpoint, self.best_ckpt_path, old_path)
+        runner.logger.info(f'Now best checkpoint is saved as {osp.basename(self.best_ckpt_path)}.')
+        runner.logger.info(f'Best {self.key_indicator} is {key_score:0.4f} at {step} '
+                           f'{"epoch" if self.by_epoch else "iter"}.')
+
+    @staticmethod
+    def _write(checkpoint, filename, old_path):
+        with open(filename + '.tmp', 'wb') as f:
+            torch.save(checkpoint, f)
+        os.replace(filename + '.tmp', filename)
+        if old_path and osp.isfile(old_path):
+            os.remove(old_path)
+
+    def _wait_write(self):
+        """Wait for the write of the best checkpoint in flight, and raise its error if any."""
+        if self.future is not None:
+            self.future.result()
+            self.future = None
+
+    def _shutdown(self):
+        if self.process is not None and self.process.is_alive():
+            self.tasks.put(None)
+            self.process.join(timeout=60)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = None
@@ -0,0 +1,111 @@
+import numpy as np
+import torch
+import torch.distributed as dist
+from mmcv.runner import get_dist_info
+
+__all__ = ['collect_results_gpu']
+
+
+def _gather_array(part, indices, size, chunk_size, device):
+    """Gather the rows of ``part`` (of shape (n, ...)) at their sample ``indices`` on rank 0, in chunks."""
+    rank, world_size = get_dist_info()
+    counts = torch.tensor([len(part)], dtype=torch.long, device=device)
+    all_counts = [torch.zeros_like(counts) for _ in range(world_size)]
+    dist.all_gather(all_counts, counts)
+    max_count = int(max(c.item() for c in all_counts))
+    row_shape = part.shape[1:]
+
+    out = filled = None
+    if rank == 0:
+        out = np.zeros((size, ) + row_shape, dtype=part.dtype)
+        filled = np.zeros(size, dtype=bool)
+    for start in range(0, max_count, chunk_size):
+        # every rank sends a chunk of chunk_size rows, the missing rows have the index -1
+        rows = torch.zeros((chunk_size, ) + row_shape, dtype=torch.from_numpy(part[:0]).dtype)
+        idx = torch.full((chunk_size, ), -1, dtype=torch.long)
+        chunk = part[start:start + chunk_size]
+        rows[:len(chunk)] = torch.from_numpy(np.ascontiguousarray(chunk))
+        idx[:len(chunk)] = torch.from_numpy(indices[start:start + chunk_size])
+        rows, idx = rows.to(device), idx.to(device)
+        rows_list = [torch.empty_like(rows) for _ in range(world_size)] if rank == 0 else None
+        idx_list = [torch.empty_like(idx) for _ in range(world_size)] if rank == 0 else None
+        dist.gather(rows, rows_list, dst=0)
+        dist.gather(idx, idx_list, dst=0)
+        if rank == 0:
+            for r, i in zip(rows_list, idx_list):
+                r, i = r.cpu().numpy(), i.cpu().numpy()
+                # the padding of the sampler repeats samples of other ranks, the first copy of a sample is kept
+                keep = (i >= 0) & (i < size)
+                keep[keep] &= ~filled[i[keep]]
+                keep_idx = i[keep]
+                _, first = np.unique(keep_idx, return_index=True)
+                keep_pos = np.flatnonzero(keep)[first]
+                out[i[keep_pos]] = r[keep_pos]
+                filled[i[keep_pos]] = True
+    if rank == 0:
+        assert filled.all(), f'{size - filled.sum()} samples were not collected'
+    return out
+
+
+def _stack(result_part, keys):
+    """The results of a rank as one array per key (``result`` for the array results)."""
+    if keys is None:
+        return dict(result=np.asarray(result_part))
+    return {k: np.asarray([x[k] for x in result_part]) for k in keys}
+
+
+def collect_results_gpu(result_part, size, indices=None, chunk_size=None):
+    """Collect the test results of all the ranks with collectives, without a tmpdir.
+
+    The results of every rank are stacked into fixed-shape tensors and gathered on rank 0 in chunks of
+    ``chunk_size`` samples (a dict result is gathered key by key), with the sample index of every row, so that the
+    results are put back in dataset order and the padding samples of the distributed sampler are dropped. The
+    tensors go through the process group: on cuda with NCCL, on cpu with gloo.
+
+    Args:
+        result_part (list[np.ndarray | dict]): The results of this rank, one per sample, of the same shape.
+        size (int): The size of the dataset.
+        indices (list[int] | None): The sample index of every result of this rank. None means the strided layout
+            of ``DistributedSampler`` (the i-th result of rank r is sample r + i * world_size). Default: None.
+        chunk_size (int | None): Number of samples a rank sends at once, None means as many as fit in about 2^22
+            values. Default: None.
+
+    Returns:
+        list | None: The results in dataset order on rank 0, None on the other ranks.
+    """
+    rank, world_size = get_dist_info()
+    device = 'cuda' if dist.get_backend() == 'nccl' else 'cpu'
+    if indices is None:
+        indices = [rank + i * world_size for i in range(len(result_part))]
+    indices = np.asarray(indices, dtype=np.int64)
+    assert len(indices) == len(result_part)
+
+    # the structure of the results is taken from the first rank with results, a rank without results sends none
+    structure = parts = None
+    if len(result_part):
+        keys = list(result_part[0].keys()) if isinstance(result_part[0], dict) else None
+        parts = _stack(result_part, keys)
+        structure = (keys, {k: (v.shape[1:], v.dtype.str) for k, v in parts.items()})
+    structures = [None] * world_size
+    dist.all_gather_object(structures, structure)
+    structures = [s for s in structures if s is not None]
+    if not structures:
+        return [] if rank == 0 else None
+    keys, shapes = structures[0]
+    if parts is None:
+        parts = _stack(result_part, keys)
+
+    collected = dict()
+    for k, (row_shape, dtype) in shapes.items():
+        part = parts[k]
+        if len(part) == 0:
+            part = np.zeros((0, ) + row_shape, dtype=dtype)
+        if chunk_size is None:
+            chunk_size = max(2**22 // max(int(np.prod(row_shape)), 1), 1)
+        collected[k] = _gather_array(part, indices, size, chunk_size, device)
+
+    if rank != 0:
+        return None
+    if keys is None:
+        return list(collected['result'])
+    return [{k: collected[k][i] for k in keys} for i in range(size)]
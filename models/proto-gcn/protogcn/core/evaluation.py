@@ -143,6 +143,27 @@ def top_k_accuracy(scores, labels, topk=(1, )):
     return res
 
 
+def top_k_accuracy_tensor(scores, labels, topk=(1, )):
+    """Calculate top k accuracy score on the device of ``scores``.
+
+    Same as :func:`top_k_accuracy`, but works on tensors and never copies them
+    to the host, so it can be called every training iteration without forcing
+    a device synchronization.
+
+    Args:
+        scores (torch.Tensor): Prediction scores with shape (N, num_classes).
+        labels (torch.Tensor): Ground truth labels with shape (N, ).
+        topk (tuple[int]): K value for top_k_accuracy. Default: (1, ).
+
+    Returns:
+        list[torch.Tensor]: Top k accuracy score (0-dim tensor) for each k.
+    """
+    maxk = min(max(topk), scores.size(1))
+    max_k_preds = scores.topk(maxk, dim=1)[1]
+    match_array = max_k_preds == labels.view(-1, 1)
+    return [match_array[:, :k].any(dim=1).float().mean() for k in topk]
+
+
 def mean_average_precision(scores, labels):
     """Mean average precision for multi-label recognition.
 
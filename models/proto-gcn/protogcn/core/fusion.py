@@ -0,0 +1,243 @@
+import itertools
+import json
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+    'stack_scores', 'fuse_scores', 'topk_hits', 'argmax_hits', 'fusion_top_k_accuracy', 'fusion_mean_class_accuracy',
+    'evaluate_weights', 'search_fusion_weights', 'save_fusion_weights', 'load_fusion_weights'
+]
+
+
+def stack_scores(scores, dtype=None):
+    """Stack the scores of several models into an array.
+
+    Args:
+        scores (list[list[np.ndarray] | np.ndarray]): The scores of every model, each a list of per-sample score
+            arrays (as dumped by ``tools/test.py``) or an array of shape (samples, classes).
+        dtype (np.dtype | None): The dtype of the stacked array, None keeps the dtype of the scores. Default: None.
+
+    Returns:
+        np.ndarray: The scores of shape (models, samples, classes).
+    """
+    return np.stack([np.asarray(s, dtype=dtype) for s in scores])
+
+
+def fuse_scores(scores, weights):
+    """The weighted sum of the model scores (as ``protogcn.smp.comb``).
+
+    Args:
+        scores (np.ndarray): The scores of shape (models, samples, classes).
+        weights (np.ndarray): The weights of shape (models, ), or of shape (num_weights, models) to fuse with several
+            weightings at once.
+
+    Returns:
+        np.ndarray: The fused scores of shape (samples, classes), or (num_weights, samples, classes).
+    """
+    weights = np.asarray(weights, dtype=scores.dtype)
+    M, N, C = scores.shape
+    fused = weights.reshape(-1, M) @ scores.reshape(M, N * C)
+    return fused.reshape(N, C) if weights.ndim == 1 else fused.reshape(-1, N, C)
+
+
+def topk_hits(scores, labels, k=1):
+    """Whether the label is among the top-k classes, for every sample.
+
+    The top-k classes are the last k of ``np.argsort`` (as the former ``protogcn.smp.intop``): when the score of the
+    label ties with other classes across the k-th place, the order of ``np.argsort`` decides, and exactly k classes
+    are counted.
+
+    Args:
+        scores (np.ndarray): The scores of shape (..., samples, classes).
+        labels (np.ndarray): The labels of shape (samples, ).
+        k (int): The k of top-k. Default: 1.
+
+    Returns:
+        np.ndarray: Bool hits of shape (..., samples).
+    """
+    labels = np.asarray(labels)
+    label_score = np.take_along_axis(scores, np.broadcast_to(labels[:, None], scores.shape[:-1] + (1, )), -1)
+    higher = (scores > label_score).sum(-1)
+    ties = (scores == label_score).sum(-1)
+    hits = higher + ties <= k
+    # the rare samples whose label ties across the k-th place are ranked as by np.argsort
+    unsure = np.nonzero((higher < k) & ~hits)
+    if len(unsure[0]):
+        top = np.argsort(scores[unsure], -1)[:, -k:]
+        hits[unsure] = (top == labels[unsure[-1]][:, None]).any(-1)
+    return hits
+
+
+def argmax_hits(scores, labels):
+    """Whether the first class of the highest score is the label (as ``protogcn.smp.mean_acc``), for every sample."""
+    return scores.argmax(-1) == np.asarray(labels)
+
+
+def fusion_top_k_accuracy(scores, labels, topk=(1, )):
+    """Top-k accuracy of scores of shape (..., samples, classes), for every k."""
+    return [topk_hits(scores, labels, k).mean(-1) for k in topk]
+
+
+def fusion_mean_class_accuracy(scores, labels):
+    """Mean class accuracy of scores of shape (..., samples, classes), over the classes present in ``labels`` (as
+    ``protogcn.smp.mean_acc``)."""
+    labels = np.asarray(labels)
+    hits = argmax_hits(scores, labels).astype(np.float64)
+    counts = np.bincount(labels)
+    present = counts > 0
+    flat = hits.reshape(-1, hits.shape[-1])
+    class_hits = np.stack([np.bincount(labels, weights=h, minlength=len(counts)) for h in flat])
+    class_acc = class_hits[:, present] / counts[present]
+    return class_acc.mean(-1).reshape(hits.shape[:-1])
+
+
+def _metric_fn(metric):
+    if metric == 'top1':
+        return lambda s, l: fusion_top_k_accuracy(s, l, (1, ))[0]
+    if metric.startswith('top'):
+        k = int(metric[3:])
+        return lambda s, l: fusion_top_k_accuracy(s, l, (k, ))[0]
+    assert metric == 'mean_class_accuracy', f'Unsupported metric {metric}'
+    return fusion_mean_class_accuracy
+
+
+def evaluate_weights(scores, labels, weights, metric='top1', batch_size=None, num_workers=None):
+    """Evaluate many weightings, in batches spread over a thread pool (the BLAS fusion and the numpy reductions
+    release the GIL).
+
+    Args:
+        scores (np.ndarray): The scores of shape (models, samples, classes).
+        labels (np.ndarray): The labels of shape (samples, ).
+        weights (np.ndarray): The weightings of shape (num_weights, models).
+        metric (str): 'top1', 'top5', ... or 'mean_class_accuracy'. Default: 'top1'.
+        batch_size (int | None): Number of weightings fused at once by a worker, None means as many as fit in
+            about 2^24 fused scores. Default: None.
+        num_workers (int | None): Number of threads, None means ``torch.get_num_threads()`` up to 4 (the BLAS of
+            the fusion is multithreaded too). Default: None.
+
+    Returns:
+        np.ndarray: The metric of every weighting.
+    """
+    fn = _metric_fn(metric)
+    weights = np.asarray(weights, dtype=scores.dtype)
+    if batch_size is None:
+        batch_size = max(2**24 // (scores.shape[1] * scores.shape[2]), 1)
+    batches = [weights[i:i + batch_size] for i in range(0, len(weights), batch_size)]
+    num_workers = num_workers or min(torch.get_num_threads(), 4)
+    if num_workers == 1 or len(batches) == 1:
+        return np.concatenate([fn(fuse_scores(scores, w), labels) for w in batches])
+    with ThreadPoolExecutor(num_workers) as pool:
+        return np.concatenate(list(pool.map(lambda w: fn(fuse_scores(scores, w), labels), batches)))
+
+
+def _grid_search(scores, labels, metric, grid, num_workers):
+    M = scores.shape[0]
+    candidates = np.array([w for w in itertools.product(grid, repeat=M) if any(w)], dtype=np.float64)
+    # the ranking does not depend on the scale of the weights, proportional weightings are evaluated once
+    candidates = np.unique(np.round(candidates / candidates.max(1, keepdims=True), 6), axis=0)
+    results = evaluate_weights(scores, labels, candidates, metric, num_workers=num_workers)
+    best = int(np.argmax(results))
+    return candidates[best], float(results[best])
+
+
+def _coordinate_ascent(scores, labels, metric, grid, num_workers, max_rounds=10):
+    M = scores.shape[0]
+    weights = np.ones(M)
+    best = float(evaluate_weights(scores, labels, weights[None], metric, num_workers=1)[0])
+    for _ in range(max_rounds):
+        improved = False
+        for m in range(M):
+            candidates = np.repeat(weights[None], len(grid), 0)
+            candidates[:, m] = grid
+            candidates = candidates[candidates.any(1)]
+            results = evaluate_weights(scores, labels, candidates, metric, num_workers=num_workers)
+            i = int(np.argmax(results))
+            if results[i] > best + 1e-12:
+                best, weights, improved = float(results[i]), candidates[i], True
+        if not improved:
+            break
+    return weights, best
+
+
+def _stacking(scores, labels, metric, l2=1e-4, max_iter=100):
+    """Fit the weights as a multinomial logistic regression on the fused scores, softmax(sum_m w_m * s_m)."""
+    x = torch.from_numpy(np.ascontiguousarray(scores, dtype=np.float32))
+    # normalize the models, so that the fitted weights are comparable
+    scale = x.flatten(1).std(1).clamp(min=1e-12)
+    x = x / scale[:, None, None]
+    y = torch.from_numpy(np.asarray(labels)).long()
+    w = torch.ones(x.shape[0], requires_grad=True)
+    optimizer = torch.optim.LBFGS([w], max_iter=max_iter, line_search_fn='strong_wolfe')
+
+    def closure():
+        optimizer.zero_grad()
+        logits = torch.einsum('m,mnc->nc', w, x)
+        loss = torch.nn.functional.cross_entropy(logits, y) + l2 * (w ** 2).sum()
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    weights = (w.detach() / scale).double().numpy()
+    weights = weights / np.abs(weights).max()
+    return weights, float(evaluate_weights(scores, labels, weights[None], metric, num_workers=1)[0])
+
+
+def search_fusion_weights(scores,
+                          labels,
+                          method='coordinate',
+                          metric='top1',
+                          grid=(0., 0.5, 1., 1.5, 2., 3.),
+                          num_workers=None):
+    """Search the fusion weights of several models.
+
+    Args:
+        scores (np.ndarray): The scores of shape (models, samples, classes).
+        labels (np.ndarray): The labels of shape (samples, ).
+        method (str): 'grid' (every combination of ``grid``), 'coordinate' (coordinate ascent over ``grid``,
+            starting from equal weights) or 'stacking' (logistic regression of the labels on the weighted sum).
+            Default: 'coordinate'.
+        metric (str): The metric to maximize, 'top1', 'top5', ... or 'mean_class_accuracy' (the stacking fits the
+            cross entropy and only reports it). Default: 'top1'.
+        grid (tuple[float]): The candidate weights of 'grid' and 'coordinate'. Default: (0, 0.5, 1, 1.5, 2, 3).
+        num_workers (int | None): Number of threads, None means ``torch.get_num_threads()`` up to 4 (the BLAS of
+            the fusion is multithreaded too). Default: None.
+
+    Returns:
+        tuple[np.ndarray, float]: The weights of shape (models, ) and their metric.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    labels = np.asarray(labels)
+    grid = np.asarray(grid, dtype=np.float64)
+    if method == 'grid':
+        return _grid_search(scores, labels, metric, grid, num_workers)
+    if method == 'coordinate':
+        return _coordinate_ascent(scores, labels, metric, grid, num_workers)
+    assert method == 'stacking', f'Unsupported method {method}'
+    return _stacking(scores, labels, metric)
+
+
+def save_fusion_weights(filename, names, weights, **meta):
+    """Save fusion weights (with the model names) to a json file, see ``load_fusion_weights``."""
+    with open(filename, 'w') as f:
+        json.dump(dict(names=list(names), weights=[float(w) for w in weights], **meta), f, indent=2)
+
+
+def load_fusion_weights(filename, names=None):
+    """Load fusion weights saved by ``save_fusion_weights``.
+
+    Args:
+        filename (str): The json file.
+        names (list[str] | None): If given, the weights are returned in this order. Default: None.
+
+    Returns:
+        list[float]: The weights.
+    """
+    with open(filename) as f:
+        data = json.load(f)
+    weights = dict(zip(data['names'], data['weights']))
+    if names is None:
+        return list(data['weights'])
+    missing = [n for n in names if n not in weights]
+    assert not missing, f'No fusion weight for {missing} in {filename}'
+    return [weights[n] for n in names]
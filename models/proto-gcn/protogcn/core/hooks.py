@@ -1,6 +1,19 @@
 import functools
+import mmcv
+import numpy as np
+import os
+import os.path as osp
+import random
+import re
+import shutil
+import time
 import torch
+import torch.distributed as dist
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from mmcv.parallel import is_module_wrapper
+from mmcv.runner import HOOKS, CheckpointHook, Hook, OptimizerHook, master_only
+from mmcv.runner.checkpoint import get_state_dict
 
 
 class OutputHook:
@@ -62,3 +75,364 @@ def rgetattr(obj, attr, *args):
         return getattr(obj, attr, *args)
 
     return functools.reduce(_getattr, [obj] + attr.split('.'))
+
+
+@HOOKS.register_module()
+class LogVarsReduceHook(Hook):
+    """Fetch the training log variables only on logging iterations.
+
+    The recognizer keeps the log variables of every iteration in an on-device
+    buffer (see ``BaseRecognizer.defer_log_vars``). On logging iterations this
+    hook reduces the buffer across ranks with a single collective and hands
+    the interval averages to ``runner.log_buffer``, so the other iterations
+    run without any host synchronization.
+
+    Args:
+        interval (int): Logging interval, should match ``log_config.interval``.
+            Default: 10.
+        by_epoch (bool): Whether the logger hooks count iterations by epoch.
+            Default: True.
+    """
+
+    def __init__(self, interval=10, by_epoch=True):
+        self.interval = interval
+        self.by_epoch = by_epoch
+
+    @staticmethod
+    def _get_model(runner):
+        return runner.model.module if is_module_wrapper(runner.model) else runner.model
+
+    def before_run(self, runner):
+        self._get_model(runner).defer_log_vars = True
+
+    def after_run(self, runner):
+        self._get_model(runner).defer_log_vars = False
+
+    def before_train_epoch(self, runner):
+        self._get_model(runner).reset_log_vars()
+
+    def after_train_iter(self, runner):
+        if self.by_epoch:
+            should_log = self.every_n_inner_iters(runner, self.interval)
+        else:
+            should_log = self.every_n_iters(runner, self.interval)
+        if not (should_log or self.end_of_epoch(runner)):
+            return
+
+        log_vars, num_samples = self._get_model(runner).flush_log_vars()
+        # The logger averages the last `interval` entries of each variable,
+        # which should only be the average of the current interval.
+        for name in log_vars:
+            runner.log_buffer.val_history.pop(name, None)
+            runner.log_buffer.n_history.pop(name, None)
+        runner.log_buffer.update(log_vars, num_samples)
+
+
+def build_grad_scaler(device_type='cuda', **kwargs):
+    """Build a ``GradScaler`` for the given device type.
+
+    ``torch.amp.GradScaler`` (PyTorch >= 2.3) also works on CPU, older
+    versions only provide ``torch.cuda.amp.GradScaler``.
+    """
+    try:
+        from torch.amp import GradScaler
+        return GradScaler(device_type, **kwargs)
+    except (ImportError, TypeError):
+        from torch.cuda.amp import GradScaler
+        return GradScaler(**kwargs)
+
+
+@HOOKS.register_module()
+class AmpOptimizerHook(OptimizerHook):
+    """Optimizer hook for automatic mixed precision training.
+
+    Unlike mmcv's ``Fp16OptimizerHook``, the weights are kept in fp32: the
+    recognizer runs its forward under ``torch.autocast`` with ``amp_dtype``
+    and this hook only takes care of loss scaling, with a ``GradScaler`` built
+    for the device of the model. Loss scaling is skipped for bfloat16, which
+    has the same exponent range as fp32.
+
+    Args:
+        grad_clip (dict, optional): A config dict to control the clip_grad.
+            Default: None.
+        loss_scale (float | str | dict | None): Scale factor configuration.
+            'dynamic' for dynamic loss scaling, a float for static loss
+            scaling, a dict for the arguments of ``GradScaler``, or None to
+            disable loss scaling. Default: 'dynamic'.
+        detect_anomalous_params (bool): See ``OptimizerHook``. Default: False.
+    """
+
+    def __init__(self, grad_clip=None, loss_scale='dynamic', detect_anomalous_params=False):
+        super().__init__(grad_clip=grad_clip, detect_anomalous_params=detect_anomalous_params)
+        if not (loss_scale is None or loss_scale == 'dynamic' or isinstance(loss_scale, (float, dict))):
+            raise ValueError('loss_scale must be of type float, dict, None or '
+                             f'"dynamic", got {loss_scale}')
+        self.loss_scale = loss_scale
+        self._scale_update_param = None
+        self.loss_scaler = None
+
+    def before_run(self, runner):
+        model = runner.model.module if is_module_wrapper(runner.model) else runner.model
+        device_type = next(model.parameters()).device.type
+        enabled = self.loss_scale is not None and getattr(model, 'amp_dtype', None) == torch.float16
+
+        scaler_cfg = dict(enabled=enabled)
+        if isinstance(self.loss_scale, float):
+            self._scale_update_param = self.loss_scale
+            scaler_cfg['init_scale'] = self.loss_scale
+        elif isinstance(self.loss_scale, dict):
+            scaler_cfg.update(self.loss_scale)
+        self.loss_scaler = build_grad_scaler(device_type, **scaler_cfg)
+
+        # resume from state dict
+        if 'fp16' in runner.meta and 'loss_scaler' in runner.meta['fp16']:
+            self.loss_scaler.load_state_dict(runner.meta['fp16']['loss_scaler'])
+
+    def after_train_iter(self, runner):
+        runner.model.zero_grad()
+        runner.optimizer.zero_grad()
+        if self.detect_anomalous_params:
+            self.detect_anomalous_parameters(runner.outputs['loss'], runner)
+        self.loss_scaler.scale(runner.outputs['loss']).backward()
+
+        if self.grad_clip is not None:
+            self.loss_scaler.unscale_(runner.optimizer)
+            grad_norm = self.clip_grads(runner.model.parameters())
+            if grad_norm is not None:
+                # Add grad norm to the logger
+                runner.log_buffer.update({'grad_norm': float(grad_norm)}, runner.outputs['num_samples'])
+        self.loss_scaler.step(runner.optimizer)
+        self.loss_scaler.update(self._scale_update_param)
+
+        # save state_dict of loss_scaler
+        if self.loss_scaler.is_enabled():
+            runner.meta.setdefault('fp16', {})['loss_scaler'] = self.loss_scaler.state_dict()
+
+
+def _cpu_clone(obj):
+    """Copy the tensors of a (nested) state dict to the cpu, the copies do not share memory with the originals."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        clone = type(obj)((k, _cpu_clone(v)) for k, v in obj.items())
+        # the versions of the modules in a state dict, as ``weights_to_cpu``
+        if hasattr(obj, '_metadata'):
+            clone._metadata = obj._metadata
+        return clone
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_clone(v) for v in obj)
+    return obj
+
+
+@HOOKS.register_module()
+class AsyncCheckpointHook(CheckpointHook):
+    """Save checkpoints without stalling the training on the file system.
+
+    On rank 0, the state dicts of the model and the optimizer are copied to the cpu (the only part the training
+    waits for), and a background thread writes the checkpoint to a temporary file that is renamed into place once
+    complete. ``latest.pth`` is then switched to it, also with a rename, so that it always points to a complete
+    checkpoint, even if the job is killed during a write (``auto_resume`` in ``tools/train.py`` resumes from it). Old
+    checkpoints beyond ``max_keep_ckpts`` are removed after the new one is written. At most one write is in flight:
+    a checkpoint that is due while the previous one is still being written waits for it. The end of the training
+    waits for the last write.
+
+    Use it with ``checkpoint_config = dict(type='AsyncCheckpointHook', interval=1)``, it takes the arguments of
+    ``CheckpointHook`` (local ``out_dir`` only).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.stall_times = []
+
+    def _wait(self):
+        """Wait for the write in flight, and raise its error if any."""
+        if self.future is not None:
+            self.future.result()
+            self.future = None
+
+    @master_only
+    def _save_checkpoint(self, runner):
+        tic = time.time()
+        self._wait()
+        model = runner.model.module if is_module_wrapper(runner.model) else runner.model
+        checkpoint = dict(meta=_cpu_clone(self._get_meta(runner)), state_dict=_cpu_clone(get_state_dict(model)))
+        if self.save_optimizer and runner.optimizer is not None:
+            checkpoint['optimizer'] = _cpu_clone(runner.optimizer.state_dict())
+
+        step = runner.epoch + 1 if self.by_epoch else runner.iter + 1
+        default_tmpl = 'epoch_{}.pth' if self.by_epoch else 'iter_{}.pth'
+        filename_tmpl = self.args.get('filename_tmpl', default_tmpl)
+        filename = filename_tmpl.format(step)
+        runner.meta.setdefault('hook_msgs', dict())
+        runner.meta['hook_msgs']['last_ckpt'] = osp.join(self.out_dir, filename)
+        self.future = self.writer.submit(self._write, runner.logger, checkpoint, filename, filename_tmpl, step)
+        self.stall_times.append(time.time() - tic)
+        runner.logger.info(f'Checkpoint snapshot of {filename} took {self.stall_times[-1]:.3f}s')
+
+    def _get_meta(self, runner):
+        """The meta of the checkpoint, as ``runner.save_checkpoint``."""
+        meta = dict(self.args.get('meta', None) or {})
+        meta.update(runner.meta or {})
+        meta.update(epoch=runner.epoch + 1, iter=runner.iter, mmcv_version=mmcv.__version__, time=time.asctime())
+        model = runner.model.module if is_module_wrapper(runner.model) else runner.model
+        if hasattr(model, 'CLASSES') and model.CLASSES is not None:
+            meta.update(CLASSES=model.CLASSES)
+        return meta
+
+    def _write(self, logger, checkpoint, filename, filename_tmpl, step):
+        tic = time.time()
+        filepath = osp.join(self.out_dir, filename)
+        with open(filepath + '.tmp', 'wb') as f:
+            torch.save(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(filepath + '.tmp', filepath)
+        if self.args.get('create_symlink', True):
+            latest = osp.join(self.out_dir, 'latest.pth')
+            if self.file_client.allow_symlink:
+                if osp.lexists(latest + '.tmp'):
+                    os.remove(latest + '.tmp')
+                os.symlink(filename, latest + '.tmp')
+                os.replace(latest + '.tmp', latest)
+            else:
+                shutil.copy(filepath, latest + '.tmp')
+                os.replace(latest + '.tmp', latest)
+        if self.max_keep_ckpts > 0:
+            # the checkpoints are listed rather than counted back by the interval, the iteration checkpoints skip
+            # the ends of the epochs
+            pattern = re.compile(re.escape(filename_tmpl).replace(r'\{\}', r'(\d+)'))
+            matches = [pattern.fullmatch(name) for name in os.listdir(self.out_dir)]
+            steps = sorted(int(m.group(1)) for m in matches if m is not None and int(m.group(1)) <= step)
+            for old in steps[:-self.max_keep_ckpts]:
+                os.remove(osp.join(self.out_dir, filename_tmpl.format(old)))
+        logger.info(f'Checkpoint {filename} written in {time.time() - tic:.2f}s')
+
+    def after_run(self, runner):
+        if runner.rank == 0:
+            self._wait()
+            if self.stall_times:
+                runner.logger.info(f'Checkpointing stalled the training {sum(self.stall_times):.2f}s in total, '
+                                   f'{max(self.stall_times):.3f}s at most')
+        self.writer.shutdown()
+
+
+def _get_rng_state():
+    state = dict(python=random.getstate(), numpy=np.random.get_state(), torch=torch.get_rng_state())
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def _set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    # the checkpoint may be loaded on a cuda device, the RNG states are cpu tensors
+    torch.set_rng_state(state['torch'].cpu())
+    if 'cuda' in state and torch.cuda.is_available() and len(state['cuda']) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all([s.cpu() for s in state['cuda']])
+
+
+@HOOKS.register_module()
+class IterCheckpointHook(AsyncCheckpointHook):
+    """Save checkpoints in the middle of the epochs, from which the training resumes without replaying the epoch.
+
+    Every ``interval`` iterations, rank 0 writes ``iter_{n}.pth`` (asynchronously, as ``AsyncCheckpointHook``) and
+    switches ``latest.pth`` to it. Besides the weights (with the memory bank of the contrastive loss, a buffer of the
+    model) and the optimizer, its meta records the epoch in progress, the seed of the sampler, the number of samples
+    of the epoch every rank has consumed and the python / numpy / torch / cuda RNG states of every rank. Resuming from
+    it (``--resume-from`` or ``auto_resume``) restarts the epoch at the next unseen sample of the sampler, with the
+    same iteration numbers, and restores the RNG states before the first batch. The DataLoader workers of the
+    resumed epoch are re-seeded from the seed, the epoch and the resume position (``train_model`` builds the loader
+    with ``epoch_seed=True`` for it), so that restarting twice from the same checkpoint gives the same data. With ``workers_per_gpu=0`` the resumed training is the same as the
+    uninterrupted one, with workers the random augmentations of the rest of the epoch differ.
+
+    The epoch checkpoints are still saved by the checkpoint hook of ``checkpoint_config``. Use it with
+    ``iter_checkpoint_config = dict(interval=500)``, it takes the arguments of ``CheckpointHook`` except
+    ``by_epoch``.
+
+    Args:
+        interval (int): The checkpoint interval in iterations. Default: 1000.
+        max_keep_ckpts (int): The number of iteration checkpoints to keep. Default: 1.
+    """
+
+    def __init__(self, interval=1000, max_keep_ckpts=1, **kwargs):
+        kwargs.setdefault('save_last', False)
+        super().__init__(interval=interval, by_epoch=False, max_keep_ckpts=max_keep_ckpts, **kwargs)
+        self.resume_state = None
+        self.inner_offset = 0
+        self.rng_list = None
+
+    def before_run(self, runner):
+        super().before_run(runner)
+        # the state of the checkpoint the runner resumed from, it is not passed on to the next checkpoints
+        hook_msgs = (runner.meta or {}).get('hook_msgs', {})
+        self.resume_state = hook_msgs.pop('resume_state', None)
+
+    def before_train_epoch(self, runner):
+        state, self.resume_state = self.resume_state, None
+        if state is None:
+            return
+        if (state['epoch'], state['iter']) != (runner.epoch, runner.iter):
+            runner.logger.warning(f'The resume state of epoch {state["epoch"]} iter {state["iter"]} does not match the '
+                                  f'runner at epoch {runner.epoch} iter {runner.iter}, the epoch starts over')
+            return
+        rank, world_size = runner.rank, runner.world_size
+        if len(state['rng']) != world_size:
+            runner.logger.warning(f'The checkpoint was saved by {len(state["rng"])} ranks, {world_size} resume it, '
+                                  'the RNG states are not restored')
+        else:
+            # the first batch is loaded before ``before_train_iter``, the loader draws its base seed from its own
+            # generator
+            _set_rng_state(state['rng'][rank])
+        data_loader = runner.data_loader
+        sampler = data_loader.sampler
+        if getattr(sampler, 'seed', state['seed']) != state['seed']:
+            runner.logger.warning(f'The sampler seed {sampler.seed} differs from the seed {state["seed"]} of the '
+                                  'checkpoint, the resumed epoch does not follow the interrupted one')
+        sampler.set_start(state['position'])
+        if data_loader.generator is not None:
+            # not ``hash``: the hash of None (no sampler seed) is its address, which changes between the runs
+            seed = 0 if state['seed'] is None else state['seed']
+            data_loader.generator.manual_seed(((seed * 1000003 + runner.epoch) * 1000003 + state['position']) % 2**63)
+        self.inner_offset = state['position'] // data_loader.batch_size
+        runner.logger.info(f'Resume epoch {runner.epoch + 1} at iter {self.inner_offset + 1}, '
+                           f'sample {state["position"]} of every rank')
+
+    def before_train_iter(self, runner):
+        # the iterations of the resumed epoch are numbered from the resume position
+        runner._inner_iter += self.inner_offset
+
+    def after_train_iter(self, runner):
+        # the epoch checkpoint follows the last iteration of an epoch
+        if not self.every_n_iters(runner, self.interval) or self.end_of_epoch(runner):
+            return
+        rng = _get_rng_state()
+        if dist.is_available() and dist.is_initialized():
+            rng_list = [None] * runner.world_size
+            dist.all_gather_object(rng_list, rng)
+        else:
+            rng_list = [rng]
+        self.rng_list = rng_list
+        super().after_train_iter(runner)
+
+    def after_train_epoch(self, runner):
+        self.inner_offset = 0
+        # the epoch checkpoint is switched to latest.pth after the iteration checkpoints
+        if runner.rank == 0:
+            self._wait()
+
+    def _get_meta(self, runner):
+        meta = super()._get_meta(runner)
+        sampler = runner.data_loader.sampler
+        resume_state = dict(
+            epoch=runner.epoch,
+            iter=runner.iter + 1,
+            seed=getattr(sampler, 'seed', None),
+            position=(runner.inner_iter + 1) * runner.data_loader.batch_size,
+            rng=self.rng_list)
+        # the epoch is in progress, the runner resumes in it
+        meta.update(epoch=runner.epoch, iter=runner.iter + 1)
+        meta['hook_msgs'] = dict(meta.get('hook_msgs', {}), resume_state=resume_state)
+        return meta
@@ -0,0 +1,228 @@
+import json
+import numpy as np
+import os.path as osp
+import time
+import torch
+from collections import defaultdict
+from mmcv.parallel import is_module_wrapper
+from mmcv.runner import HOOKS, Hook
+from torch.nn.parallel import DistributedDataParallel
+
+__all__ = ['IterProfilerHook']
+
+
+@HOOKS.register_module()
+class IterProfilerHook(Hook):
+    """Break sampled training iterations down into phases.
+
+    Every ``interval`` iterations (after ``warmup`` ones), the iteration is timed phase by phase:
+
+    - ``data``: waiting for the batch of the DataLoader, since the end of the previous iteration.
+    - ``h2d``: the copy of the batch to the device (``scatter`` of the model wrapper, cuda only).
+    - ``forward``: the forward of the recognizer and the losses, and inside it every module of ``modules`` (a
+      ``ModuleList`` stands for its children), by default the ``GCN_Block`` s of ``ProtoGCN.gcn`` and
+      ``Class_Specific_Contrastive_Loss``.
+    - ``backward``: from the end of the forward to the optimizer step (with the gradient clipping).
+    - ``allreduce``: the DDP all-reduce of every gradient bucket, which overlaps the backward.
+    - ``optimizer``: ``optimizer.step``.
+    - ``hooks``: the hooks after the step (logging, checkpoints, ...).
+
+    On cuda, the compute phases are timed with cuda events on the current stream (the iteration is synchronized at
+    its end), on cpu and for ``data`` and ``allreduce`` with the host clock. The module hooks and the timers are only
+    set up for the sampled iterations: the other iterations only read the clock once, and a disabled profiler (no
+    ``profiler_config``) is not registered at all. The p50 / p90 / p99 of every phase are logged at the end of every
+    epoch and saved to ``{work_dir}/profile_summary.json``, and the sampled iterations (the last ``max_traced``) to
+    ``{work_dir}/profile_trace.json``, a Chrome trace (chrome://tracing or https://ui.perfetto.dev). Every rank
+    writes its own files, with a ``_rank{r}`` suffix beyond rank 0.
+
+    Use it with ``profiler_config = dict(interval=50)``.
+
+    Args:
+        interval (int): Profile one iteration every ``interval``. Default: 50.
+        warmup (int): Number of iterations before the first profiled one. Default: 10.
+        modules (tuple[str]): The modules of the recognizer to time. Default: ('backbone.gcn', 'cls_head.csc_loss').
+        max_traced (int): The number of iterations kept in the trace. Default: 100.
+    """
+
+    def __init__(self, interval=50, warmup=10, modules=('backbone.gcn', 'cls_head.csc_loss'), max_traced=100):
+        self.interval = interval
+        self.warmup = warmup
+        self.module_names = modules
+        self.max_traced = max_traced
+        self.recording = False
+        self.durations = defaultdict(list)
+        self.trace = []
+        self.spans = []
+        self.handles = []
+
+    def before_run(self, runner):
+        model = runner.model.module if is_module_wrapper(runner.model) else runner.model
+        self.cuda = next(model.parameters()).is_cuda
+        self.modules = [('forward', model)]
+        for name in self.module_names:
+            try:
+                module = model.get_submodule(name)
+            except AttributeError:
+                runner.logger.warning(f'IterProfilerHook: the model has no module {name}')
+                continue
+            if isinstance(module, torch.nn.ModuleList):
+                self.modules.extend((f'forward/{name}.{i}', m) for i, m in enumerate(module))
+            else:
+                self.modules.append((f'forward/{name}', module))
+        if isinstance(runner.model, DistributedDataParallel):
+            runner.model.register_comm_hook(None, self._allreduce_hook())
+        suffix = f'_rank{runner.rank}' if runner.rank else ''
+        self.trace_file = osp.join(runner.work_dir, f'profile_trace{suffix}.json')
+        self.summary_file = osp.join(runner.work_dir, f'profile_summary{suffix}.json')
+        self.rank = runner.rank
+        self.origin = self.last_end = time.perf_counter()
+
+    def _allreduce_hook(self):
+        from torch.distributed.algorithms.ddp_comm_hooks.default_hooks import allreduce_hook
+
+        def hook(state, bucket):
+            fut = allreduce_hook(state, bucket)
+            if not self.recording:
+                return fut
+            span = ['allreduce', 'comm', time.perf_counter(), None]
+            self.spans.append(span)
+
+            def done(fut):
+                span[3] = time.perf_counter()
+                return fut.value()
+
+            return fut.then(done)
+
+        return hook
+
+    def _now(self):
+        if self.cuda:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def _timed(self, name, func):
+
+        def wrapper(*args, **kwargs):
+            span = [name, 'compute', self._now(), None]
+            self.spans.append(span)
+            out = func(*args, **kwargs)
+            span[3] = self._now()
+            return out
+
+        return wrapper
+
+    def before_train_iter(self, runner):
+        if runner.iter < self.warmup or (runner.iter - self.warmup) % self.interval:
+            return
+        self.recording = True
+        self.start = time.perf_counter()
+        self.start_event = self._now() if self.cuda else None
+        self.spans = [['data', 'data', self.last_end, self.start]]
+
+        def pre_hook(name):
+
+            def hook(module, inputs):
+                self.spans.append([name, 'compute', self._now(), None])
+
+            return hook
+
+        def post_hook(name):
+
+            def hook(module, inputs, output):
+                # the innermost open span of the module
+                span = next(s for s in reversed(self.spans) if s[0] == name and s[3] is None)
+                span[3] = self._now()
+
+            return hook
+
+        for name, module in self.modules:
+            self.handles.append(module.register_forward_pre_hook(pre_hook(name)))
+            self.handles.append(module.register_forward_hook(post_hook(name)))
+        if self.cuda and hasattr(runner.model, 'scatter'):
+            runner.model.scatter = self._timed('h2d', runner.model.scatter)
+        if isinstance(runner.optimizer, torch.optim.Optimizer):
+            runner.optimizer.step = self._timed('optimizer', runner.optimizer.step)
+
+    def after_train_iter(self, runner):
+        if self.recording:
+            self._finish(runner)
+        self.last_end = time.perf_counter()
+
+    def _finish(self, runner):
+        self.recording = False
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        if 'scatter' in runner.model.__dict__:
+            del runner.model.scatter
+        if 'step' in runner.optimizer.__dict__:
+            del runner.optimizer.step
+        if self.cuda:
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+
+        def to_time(t):
+            # the cuda events are put on the host clock from the start of the iteration
+            return t if isinstance(t, float) else self.start + self.start_event.elapsed_time(t) / 1000
+
+        spans = [(name, tid, to_time(b), to_time(e)) for name, tid, b, e in self.spans if e is not None]
+        first = dict()
+        for name, tid, b, e in spans:
+            first.setdefault(name, (b, e))
+        forward_end = first['forward'][1] if 'forward' in first else None
+        step_begin, step_end = first.get('optimizer', (None, None))
+        if forward_end is not None and step_begin is not None:
+            spans.append(('backward', 'compute', forward_end, step_begin))
+        if step_end is not None:
+            spans.append(('hooks', 'compute', step_end, end))
+
+        totals = defaultdict(float)
+        for name, tid, b, e in spans:
+            totals[name] += e - b
+        totals['iteration'] = end - self.spans[0][2]
+        for name, total in totals.items():
+            self.durations[name].append(total * 1000)
+        iteration = runner.iter + 1
+        self.trace.append([
+            dict(name=name, cat=name.split('/')[0], ph='X', ts=(b - self.origin) * 1e6, dur=(e - b) * 1e6,
+                 pid=self.rank, tid=tid, args=dict(iter=iteration)) for name, tid, b, e in spans
+        ])
+        self.trace = self.trace[-self.max_traced:]
+
+    def summary(self):
+        """The p50 / p90 / p99 / mean duration (ms) of every phase over the profiled iterations."""
+        summary = dict()
+        for name, values in self.durations.items():
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            summary[name] = dict(p50=p50, p90=p90, p99=p99, mean=float(np.mean(values)), count=len(values))
+        return summary
+
+    def after_train_epoch(self, runner):
+        if not self.durations:
+            return
+        summary = self.summary()
+        total = summary['iteration']['mean']
+        lines = [f'Profile of {summary["iteration"]["count"]} iterations (ms):'
+                 f'{"p50":>10}{"p90":>10}{"p99":>10}{"share":>8}']
+        order = ['data', 'h2d', 'forward'] + [name for name, _ in self.modules[1:]] + \
+            ['backward', 'allreduce', 'optimizer', 'hooks', 'iteration']
+        for name in order:
+            if name in summary:
+                s = summary[name]
+                label = '  ' + name.split('/', 1)[1] if name.startswith('forward/') else name
+                lines.append(f'{label:<36}{s["p50"]:>10.2f}{s["p90"]:>10.2f}{s["p99"]:>10.2f}'
+                             f'{s["mean"] / total:>8.1%}')
+        runner.logger.info('\n'.join(lines))
+        self._dump(summary)
+
+    def after_run(self, runner):
+        if self.durations:
+            self._dump(self.summary())
+
+    def _dump(self, summary):
+        with open(self.summary_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+        with open(self.trace_file, 'w') as f:
+            json.dump(dict(traceEvents=[event for events in self.trace for event in events]), f)
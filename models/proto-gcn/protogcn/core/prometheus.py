@@ -0,0 +1,241 @@
+import os
+import os.path as osp
+import threading
+import time
+import torch
+import torch.distributed as dist
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mmcv.runner import HOOKS, Hook
+
+__all__ = ['PrometheusHook']
+
+_METRICS = dict(
+    samples_per_second='Training samples per second, over all the ranks.',
+    data_wait_fraction='Fraction of the step time spent waiting for the DataLoader.',
+    step_seconds='Mean time of a training step.',
+    loss='Training loss, averaged over the last logging interval.',
+    learning_rate='Learning rate of the first parameter group.',
+    epoch='Current epoch.',
+    iteration='Current iteration.',
+    rank_rss_bytes='Resident memory of the training process of a rank.',
+    worker_rss_bytes='Resident memory of a DataLoader worker.',
+    worker_pss_bytes='Proportional set size of a DataLoader worker (its share of the pages shared with the rank).',
+    gpu_memory_allocated_bytes='GPU memory allocated by the tensors of a rank.',
+    gpu_memory_reserved_bytes='GPU memory reserved by the caching allocator of a rank.',
+    gpu_memory_peak_bytes='Peak GPU memory allocated by the tensors of a rank.')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(samples, labels, prefix='protogcn'):
+    """Render gauges in the Prometheus text exposition format.
+
+    Args:
+        samples (list[tuple]): ``(name, extra_labels, value)`` of every sample, ``name`` a key of the metrics.
+        labels (dict): The labels of all the samples.
+        prefix (str): The prefix of the metric names. Default: 'protogcn'.
+
+    Returns:
+        str: The exposition.
+    """
+    by_name = dict()
+    for name, extra, value in samples:
+        by_name.setdefault(name, []).append((extra, value))
+    lines = []
+    for name, values in by_name.items():
+        full_name = f'{prefix}_{name}'
+        lines.append(f'# HELP {full_name} {_METRICS[name]}')
+        lines.append(f'# TYPE {full_name} gauge')
+        for extra, value in values:
+            label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in dict(labels, **extra).items())
+            value = value if isinstance(value, int) else f'{float(value):.6g}'
+            lines.append(f'{full_name}{{{label_str}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+@HOOKS.register_module()
+class PrometheusHook(Hook):
+    """Expose live training metrics to Prometheus.
+
+    Every ``interval`` iterations, every rank measures its mean step time and DataLoader wait (with its own clock,
+    from the end of an iteration to the next), the RSS of its process and of each of its DataLoader workers (from
+    ``/proc``, and their PSS with ``pss=True``) and its GPU memory, and rank 0 gathers them (one
+    ``all_gather_object`` of a few numbers per rank). Rank 0 then renders the samples/s, the data wait fraction, the
+    step time of every rank, the loss and the learning rate (the last logged values), the memory of every rank and
+    worker, the epoch and the iteration as Prometheus gauges, labeled with the experiment and the config. It serves
+    them on ``http://{addr}:{port}/metrics`` from a daemon thread, or pushes them to a Pushgateway (``pushgateway``,
+    e.g. 'http://pushgateway.monitoring.svc:9091', for pods that Prometheus does not scrape), in a background
+    thread. The training only pays for the measures of the interval.
+
+    Use it with ``prometheus_config = dict(port=9108)``.
+
+    Args:
+        interval (int): The update interval in iterations. Default: 10.
+        port (int | None): The port of the ``/metrics`` endpoint of rank 0, 0 means any free port, None no endpoint.
+            If the port is in use (e.g. by another job on the node), a free port is used and logged. Default: 9108.
+        addr (str): The address of the endpoint. Default: '0.0.0.0'.
+        pushgateway (str | None): The URL of a Pushgateway to push the metrics to. Default: None.
+        job (str): The job of the pushed metrics. Default: 'protogcn'.
+        experiment (str | None): The experiment label, None means the name of the work_dir. Default: None.
+        labels (dict | None): More labels of all the metrics. Default: None.
+        pss (bool): Whether to expose the PSS of the workers too, which takes ~10 ms per GB of the processes (see
+            ``process_memory``). Default: False.
+    """
+
+    def __init__(self,
+                 interval=10,
+                 port=9108,
+                 addr='0.0.0.0',
+                 pushgateway=None,
+                 job='protogcn',
+                 experiment=None,
+                 labels=None,
+                 pss=False):
+        self.interval = interval
+        self.port = port
+        self.addr = addr
+        self.pushgateway = pushgateway
+        self.job = job
+        self.experiment = experiment
+        self.extra_labels = labels or dict()
+        self.pss = pss
+        self.exposition = ''
+        self.server = None
+        self.pusher = None
+        self.push_future = None
+
+    def before_run(self, runner):
+        meta = runner.meta or dict()
+        config = osp.splitext(meta.get('config_name', ''))[0]
+        experiment = self.experiment or meta.get('work_dir') or osp.basename(runner.work_dir.rstrip('/'))
+        self.labels = dict(experiment=experiment, config=config, **self.extra_labels)
+        self.cuda = torch.cuda.is_available() and torch.cuda.is_initialized()
+        self._reset()
+        self.last_end = time.perf_counter()
+        if runner.rank != 0:
+            return
+        if self.port is not None:
+            hook = self
+
+            class Handler(BaseHTTPRequestHandler):
+
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = hook.exposition.encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self.server = ThreadingHTTPServer((self.addr, self.port), Handler)
+            except OSError as e:
+                # e.g. another training job on the node serves on the port
+                runner.logger.warning(f'Cannot serve the Prometheus metrics on port {self.port} ({e}), '
+                                      'falling back to a free port')
+                self.server = ThreadingHTTPServer((self.addr, 0), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            runner.logger.info(f'Prometheus metrics on http://{self.addr}:{self.server.server_port}/metrics')
+        if self.pushgateway is not None:
+            self.pusher = ThreadPoolExecutor(max_workers=1)
+            runner.logger.info(f'Pushing the Prometheus metrics to {self.pushgateway}')
+
+    def _reset(self):
+        self.step_time = self.data_time = 0.
+        self.steps = self.samples = 0
+
+    def before_train_iter(self, runner):
+        self.iter_start = time.perf_counter()
+
+    def after_train_iter(self, runner):
+        end = time.perf_counter()
+        self.step_time += end - self.last_end
+        self.data_time += self.iter_start - self.last_end
+        self.steps += 1
+        self.samples += len(next(v for v in runner.data_batch.values() if isinstance(v, torch.Tensor)))
+        if self.every_n_iters(runner, self.interval):
+            self._update(runner)
+        # the time of the update is part of the next step
+        self.last_end = end
+
+    def _rank_stats(self):
+        # not at the top: protogcn.utils imports protogcn.smp, which imports protogcn.core
+        from ..utils.proc import dataloader_workers, process_memory
+        workers = [process_memory([pid], self.pss) for pid in dataloader_workers()]
+        stats = dict(
+            step_time=self.step_time / max(self.steps, 1),
+            data_time=self.data_time,
+            total_time=self.step_time,
+            samples=self.samples,
+            rss=process_memory([os.getpid()], pss=False)[0],
+            workers=workers)
+        if self.cuda:
+            stats.update(
+                gpu_allocated=torch.cuda.memory_allocated(),
+                gpu_reserved=torch.cuda.memory_reserved(),
+                gpu_peak=torch.cuda.max_memory_allocated())
+        return stats
+
+    def _update(self, runner):
+        stats = self._rank_stats()
+        self._reset()
+        if dist.is_available() and dist.is_initialized():
+            all_stats = [None] * runner.world_size
+            dist.all_gather_object(all_stats, stats)
+        else:
+            all_stats = [stats]
+        if runner.rank != 0:
+            return
+
+        samples = [
+            ('samples_per_second', {}, sum(s['samples'] / max(s['total_time'], 1e-9) for s in all_stats)),
+            ('data_wait_fraction', {},
+             sum(s['data_time'] for s in all_stats) / max(sum(s['total_time'] for s in all_stats), 1e-9)),
+        ]
+        history = runner.log_buffer.val_history
+        if history.get('loss'):
+            samples.append(('loss', {}, history['loss'][-1]))
+        lr = runner.current_lr()
+        lr = list(lr.values())[0] if isinstance(lr, dict) else lr
+        samples += [('learning_rate', {}, lr[0]), ('epoch', {}, runner.epoch), ('iteration', {}, runner.iter + 1)]
+        for rank, s in enumerate(all_stats):
+            samples += [('step_seconds', dict(rank=rank), s['step_time']),
+                        ('rank_rss_bytes', dict(rank=rank), s['rss'])]
+            for worker, (rss, pss) in enumerate(s['workers']):
+                samples.append(('worker_rss_bytes', dict(rank=rank, worker=worker), rss))
+                if self.pss:
+                    samples.append(('worker_pss_bytes', dict(rank=rank, worker=worker), pss))
+            if 'gpu_allocated' in s:
+                samples += [('gpu_memory_allocated_bytes', dict(rank=rank), s['gpu_allocated']),
+                            ('gpu_memory_reserved_bytes', dict(rank=rank), s['gpu_reserved']),
+                            ('gpu_memory_peak_bytes', dict(rank=rank), s['gpu_peak'])]
+        self.exposition = render_metrics(samples, self.labels)
+        if self.pusher is not None and (self.push_future is None or self.push_future.done()):
+            self.push_future = self.pusher.submit(self._push, runner.logger, self.exposition)
+
+    def _push(self, logger, exposition):
+        url = f'{self.pushgateway.rstrip("/")}/metrics/job/{self.job}/experiment/{self.labels["experiment"]}'
+        request = urllib.request.Request(url, data=exposition.encode(), method='PUT')
+        request.add_header('Content-Type', 'text/plain; version=0.0.4')
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            logger.warning(f'Failed to push the metrics to {url}: {e}')
+
+    def after_run(self, runner):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.pusher is not None:
+            self.pusher.shutdown()
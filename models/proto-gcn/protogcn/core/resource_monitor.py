@@ -0,0 +1,203 @@
+import os
+import os.path as osp
+import pyarrow as pa
+import pyarrow.parquet as pq
+import threading
+import time
+import torch
+from mmcv.runner import HOOKS, Hook
+
+__all__ = ['ResourceMonitorHook', 'RESOURCE_SCHEMA']
+
+RESOURCE_SCHEMA = pa.schema([
+    # the unix time, in UTC
+    ('time', pa.timestamp('ms', tz='UTC')),
+    ('rank', pa.int16()),
+    ('epoch', pa.int32()),
+    ('iter', pa.int64()),
+    ('pid', pa.int32()),
+    ('role', pa.dictionary(pa.int8(), pa.string())),
+    ('cpu_percent', pa.float32()),
+    ('rss', pa.int64()),
+    ('pss', pa.int64()),
+    ('read_bytes', pa.int64()),
+    ('host_cpu_percent', pa.float32()),
+    ('host_iowait_percent', pa.float32()),
+    ('host_mem_available', pa.int64()),
+    ('gpu_util', pa.float32()),
+    ('gpu_memory_used', pa.int64()),
+    ('gpu_memory_reserved', pa.int64()),
+    ('gpu_memory_allocated', pa.int64()),
+])
+
+
+def _host_cpu_ticks():
+    # the busy, iowait and total ticks of all the cpus
+    with open('/proc/stat') as f:
+        ticks = [int(x) for x in f.readline().split()[1:]]
+    idle, iowait = ticks[3], ticks[4]
+    return sum(ticks) - idle - iowait, iowait, sum(ticks)
+
+
+def _host_mem_available():
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def _nvml_handle(device):
+    try:
+        import pynvml
+    except ImportError:
+        return None
+    try:
+        pynvml.nvmlInit()
+        # the uuid, unlike the index, does not depend on CUDA_VISIBLE_DEVICES
+        return pynvml.nvmlDeviceGetHandleByUUID(f'GPU-{torch.cuda.get_device_properties(device).uuid}')
+    except (pynvml.NVMLError, AttributeError):
+        return None
+
+
+@HOOKS.register_module()
+class ResourceMonitorHook(Hook):
+    """Sample the resources of the training processes into a Parquet time series.
+
+    Every rank starts a daemon thread that, every ``interval`` seconds, samples its own process tree (the training
+    process, role 'main', its DataLoader workers, role 'worker', and the other descendants, such as the evaluator of
+    ``AsyncEvalHook``, role 'other') from ``/proc``: the CPU % (100 is a core), the RSS, the PSS (every
+    ``pss_interval`` seconds) and the bytes read from the storage during the interval, of every process. The host
+    CPU % and iowait % (100 is all the cores) and available memory, and for the 'main' row on cuda the GPU
+    utilization and used memory (with ``pynvml``, null without) and the memory reserved and allocated by the rank
+    (torch), are sampled too. Every row is tagged with the time, the rank and the current epoch and iteration.
+    Every ``flush_interval`` samples, the rows are written to a new Parquet file (with ``RESOURCE_SCHEMA``),
+    ``{work_dir}/resources/rank{r}-{t}.parquet`` with ``t`` the time of its first sample in ms: the thread keeps at
+    most that many samples in memory, and as every file is complete once written (a Parquet file is only readable
+    once closed), a killed run keeps all but its last samples. ``pq.read_table(f'{work_dir}/resources')`` (or
+    ``pd.read_parquet``) reads them all. A sample that fails (e.g. ``/proc`` or ``pynvml``) is logged and skipped.
+
+    The training thread only writes the epoch and the iteration, the sampling and the writes run in the thread (the
+    reads of ``/proc`` release the GIL). It replaces the ``nvidia-smi`` / ``top`` / ``ps`` loops of the monitoring
+    scripts, use it with ``resource_config = dict(interval=1.)``.
+
+    Args:
+        interval (float): The sampling interval in seconds. Default: 1.
+        pss_interval (float | None): The sampling interval of the PSS, which takes ~10 ms per GB of the processes (see
+            ``process_memory``), null in the other samples. None means no PSS. Default: 10.
+        flush_interval (int): The number of samples of a file. Default: 60.
+    """
+
+    def __init__(self, interval=1., pss_interval=10., flush_interval=60):
+        self.interval = interval
+        self.pss_interval = pss_interval
+        self.flush_interval = flush_interval
+        self.epoch = self.iter = 0
+        self.thread = None
+        self.stop = threading.Event()
+
+    def before_run(self, runner):
+        self.dir = osp.join(runner.work_dir, 'resources')
+        os.makedirs(self.dir, exist_ok=True)
+        self.rank = runner.rank
+        self.logger = runner.logger
+        self.epoch, self.iter = runner.epoch, runner.iter
+        self.device = torch.cuda.current_device() if torch.cuda.is_available() and torch.cuda.is_initialized() else None
+        self.nvml = _nvml_handle(self.device) if self.device is not None else None
+        self.thread = threading.Thread(target=self._run, name='ResourceMonitor', daemon=True)
+        self.thread.start()
+
+    def before_train_epoch(self, runner):
+        self.epoch, self.iter = runner.epoch, runner.iter
+
+    def before_train_iter(self, runner):
+        self.iter = runner.iter
+
+    def after_run(self, runner):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+
+    def _run(self):
+        self.previous = dict()
+        self.previous_host = (time.monotonic(), _host_cpu_ticks())
+        self.last_pss = -float('inf')
+        rows = {name: [] for name in RESOURCE_SCHEMA.names}
+        samples, last_error = 0, None
+        while not self.stop.wait(self.interval):
+            try:
+                for row in self._sample():
+                    for name in RESOURCE_SCHEMA.names:
+                        rows[name].append(row.get(name))
+                samples += 1
+                if samples % self.flush_interval == 0:
+                    self._write(rows)
+            except Exception as e:
+                # the same error of every sample is only logged once
+                if repr(e) != last_error:
+                    self.logger.exception(f'Resource monitor of rank {self.rank} failed, the sample is skipped')
+                last_error = repr(e)
+        try:
+            self._write(rows)
+        except Exception:
+            self.logger.exception(f'Resource monitor of rank {self.rank} failed to write its last samples')
+
+    def _write(self, rows):
+        """Write the rows to a new Parquet file, renamed into place once complete."""
+        if not rows['time']:
+            return
+        table = pa.Table.from_pydict(rows, schema=RESOURCE_SCHEMA)
+        for values in rows.values():
+            values.clear()
+        filename = f'rank{self.rank}-{table["time"][0].value}.parquet'
+        # the readers of the directory skip the hidden files
+        tmp = osp.join(self.dir, f'.{filename}.tmp')
+        pq.write_table(table, tmp)
+        os.replace(tmp, osp.join(self.dir, filename))
+
+    def _sample(self):
+        # not at the top: protogcn.utils imports protogcn.smp, which imports protogcn.core
+        from ..utils.proc import dataloader_workers, process_cpu_time, process_memory, process_read_bytes, process_tree
+        now, ticks = time.monotonic(), _host_cpu_ticks()
+        _, last_ticks = self.previous_host
+        total = max(ticks[2] - last_ticks[2], 1)
+        common = dict(
+            time=int(time.time() * 1000),
+            rank=self.rank,
+            epoch=self.epoch,
+            iter=self.iter,
+            host_cpu_percent=100 * (ticks[0] - last_ticks[0]) / total,
+            host_iowait_percent=100 * (ticks[1] - last_ticks[1]) / total,
+            host_mem_available=_host_mem_available())
+        self.previous_host = (now, ticks)
+        pss = self.pss_interval is not None and now - self.last_pss >= self.pss_interval
+        if pss:
+            self.last_pss = now
+
+        rows, previous = [], dict()
+        workers = set(dataloader_workers())
+        for i, pid in enumerate(process_tree()):
+            cpu_time, read_bytes = process_cpu_time([pid]), process_read_bytes([pid])
+            rss, pss_bytes = process_memory([pid], pss)
+            role = 'main' if i == 0 else 'worker' if pid in workers else 'other'
+            row = dict(common, pid=pid, role=role, rss=rss, pss=pss_bytes if pss else None)
+            if pid in self.previous:
+                last_time, last_cpu, last_read = self.previous[pid]
+                row.update(
+                    cpu_percent=100 * (cpu_time - last_cpu) / max(now - last_time, 1e-6),
+                    read_bytes=read_bytes - last_read)
+            previous[pid] = (now, cpu_time, read_bytes)
+            rows.append(row)
+        # the exited processes are forgotten
+        self.previous = previous
+
+        if self.device is not None:
+            rows[0].update(
+                gpu_memory_reserved=torch.cuda.memory_reserved(self.device),
+                gpu_memory_allocated=torch.cuda.memory_allocated(self.device))
+            if self.nvml is not None:
+                import pynvml
+                rows[0].update(
+                    gpu_util=pynvml.nvmlDeviceGetUtilizationRates(self.nvml).gpu,
+                    gpu_memory_used=pynvml.nvmlDeviceGetMemoryInfo(self.nvml).used)
+        return rows
@@ -0,0 +1,117 @@
+import numpy as np
+import os
+import torch
+import torch.distributed as dist
+from collections import OrderedDict
+from mmcv.runner import get_dist_info
+
+from .fusion import topk_hits
+
+__all__ = ['ScoreSink']
+
+
+class ScoreSink:
+    """Write the test scores batch by batch to disk, and accumulate the classification metrics on the fly.
+
+    Every rank appends the scores of its batches to its own part file (``{filename}.rank{r}.part``), and ``evaluate``
+    merges the parts on rank 0, chunk by chunk, into a ``.npy`` file of shape (num_samples, num_classes) indexed by
+    sample id, so that no rank holds more than a batch of scores and nothing is gathered. No two ranks write the same
+    file: on a network file system, the write-back of a page shared by the rows of several ranks could overwrite the
+    rows of the others. The file is read back with ``np.load(filename, mmap_mode='r')``, and ``tools/ensemble.py``
+    takes it as a score file. Every rank counts the top-k hits and the confusion matrix of its samples, and
+    ``evaluate`` sums these counts over the ranks (a few KB of all-reduce instead of all the scores).
+
+    All the ranks should create the sink and call ``evaluate``, the ``filename`` should be on a file system shared by
+    the ranks.
+
+    Args:
+        filename (str): The ``.npy`` score file.
+        labels (list[int] | np.ndarray): The label of every sample.
+        num_classes (int): The number of classes.
+        topk (tuple[int]): The k of the top-k accuracies. Default: (1, 5).
+        dtype (np.dtype): The dtype of the score file. Default: np.float32.
+    """
+
+    def __init__(self, filename, labels, num_classes, topk=(1, 5), dtype=np.float32):
+        self.filename = filename
+        self.labels = np.asarray(labels, dtype=np.int64)
+        assert self.labels.ndim == 1, 'ScoreSink only supports single-label datasets'
+        self.num_classes = num_classes
+        self.topk = tuple(topk)
+        self.dtype = np.dtype(dtype)
+        self.rank, self.world_size = get_dist_info()
+        self.part = open(self._part_name(self.rank), 'wb')
+        self.indices = []
+        self.hits = np.zeros(len(self.topk), dtype=np.int64)
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    def _part_name(self, rank):
+        return f'{self.filename}.rank{rank}.part'
+
+    def update(self, indices, scores):
+        """Write the scores of a batch and count its hits.
+
+        Args:
+            indices (list[int] | np.ndarray): The sample ids of the batch.
+            scores (list[np.ndarray] | np.ndarray): The scores of the batch, of shape (batch, num_classes).
+        """
+        assert not isinstance(scores[0], dict), 'ScoreSink only supports recognizers that return one score'
+        indices = np.asarray(indices, dtype=np.int64)
+        scores = np.asarray(scores)
+        assert scores.shape == (len(indices), self.num_classes), f'Unexpected scores of shape {scores.shape}'
+        scores.astype(self.dtype, copy=False).tofile(self.part)
+        self.indices.append(indices)
+        labels = self.labels[indices]
+        for i, k in enumerate(self.topk):
+            self.hits[i] += int(topk_hits(scores, labels, k).sum())
+        np.add.at(self.confusion, (labels, scores.argmax(1)), 1)
+
+    def _merge(self, chunk_size=2**22):
+        """Merge the part files of all the ranks into the score file (on rank 0)."""
+        scores = np.lib.format.open_memmap(
+            self.filename, mode='w+', dtype=self.dtype, shape=(len(self.labels), self.num_classes))
+        chunk_size = max(chunk_size // self.num_classes, 1)
+        for rank in range(self.world_size):
+            indices = np.load(self._part_name(rank) + '.idx.npy')
+            if len(indices):
+                part = np.memmap(
+                    self._part_name(rank), dtype=self.dtype, mode='r', shape=(len(indices), self.num_classes))
+                for start in range(0, len(indices), chunk_size):
+                    scores[indices[start:start + chunk_size]] = part[start:start + chunk_size]
+                del part
+            os.remove(self._part_name(rank))
+            os.remove(self._part_name(rank) + '.idx.npy')
+        scores.flush()
+
+    def evaluate(self):
+        """Merge the score file and compute the metrics over all the ranks.
+
+        Returns:
+            dict: ``top{k}_acc`` for every k and ``mean_class_accuracy``, as ``BaseDataset.evaluate``.
+        """
+        self.part.close()
+        indices = np.concatenate(self.indices) if self.indices else np.zeros(0, dtype=np.int64)
+        np.save(self._part_name(self.rank) + '.idx.npy', indices)
+        distributed = dist.is_available() and dist.is_initialized()
+        if distributed:
+            dist.barrier()
+        if self.rank == 0:
+            self._merge()
+        counts = torch.from_numpy(np.concatenate([self.hits, self.confusion.ravel()]))
+        if distributed:
+            # rank 0 joins the all-reduce once the score file is merged, nccl only reduces cuda tensors
+            if dist.get_backend() == 'nccl':
+                counts = counts.to(torch.cuda.current_device())
+            dist.all_reduce(counts)
+        counts = counts.cpu().numpy()
+        hits, confusion = counts[:len(self.topk)], counts[len(self.topk):].reshape(self.confusion.shape)
+        num_samples = confusion.sum()
+        eval_results = OrderedDict()
+        for k, hit in zip(self.topk, hits):
+            eval_results[f'top{k}_acc'] = hit / num_samples
+        # as mean_class_accuracy: the classes that are labeled or predicted, 0 for the ones never labeled
+        cls_cnt, cls_hit = confusion.sum(1), np.diag(confusion)
+        present = (cls_cnt > 0) | (confusion.sum(0) > 0)
+        eval_results['mean_class_accuracy'] = np.mean(
+            [hit / cnt if cnt else 0.0 for cnt, hit in zip(cls_cnt[present], cls_hit[present])])
+        return eval_results
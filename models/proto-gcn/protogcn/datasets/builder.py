@@ -8,7 +8,7 @@ from mmcv.runner import get_dist_info
 from mmcv.utils import Registry, build_from_cfg, digit_version
 from torch.utils.data import DataLoader
 
-from .samplers import ClassSpecificDistributedSampler, DistributedSampler
+from .samplers import ClassSpecificDistributedSampler, DistributedSampler, InfiniteBatchSampler
 
 if platform.system() != 'Windows':
     import resource
@@ -44,6 +44,8 @@ def build_dataloader(dataset,
                      drop_last=False,
                      pin_memory=True,
                      persistent_workers=False,
+                     infinite_sampler=False,
+                     epoch_seed=False,
                      **kwargs):
     """Build PyTorch DataLoader.
 
@@ -67,11 +69,22 @@ def build_dataloader(dataset,
             This allows to maintain the workers Dataset instances alive.
             The argument also has effect in PyTorch>=1.8.0.
             Default: False
+        infinite_sampler (bool): If True, the DataLoader iterates over the
+            epochs without end (with ``InfiniteBatchSampler``), so that its
+            workers live through the whole training and prefetch across the
+            epoch boundaries. It is returned in an ``EpochLoader``, whose
+            iterations are the epochs. Default: False
+        epoch_seed (bool): If True (and with a ``seed``), the DataLoader
+            draws the base seed of its workers from its own generator seeded
+            with ``seed``, and the workers fold it in their seed, so that
+            ``IterCheckpointHook`` can re-seed the workers of a resumed epoch.
+            False keeps the seed of the workers to the seed, rank and worker
+            id. Default: False
         kwargs (dict, optional): Any keyword argument to be used to initialize
             DataLoader.
 
     Returns:
-        DataLoader: A PyTorch dataloader.
+        DataLoader | EpochLoader: A PyTorch dataloader.
     """
     rank, world_size = get_dist_info()
 
@@ -92,11 +105,27 @@ def build_dataloader(dataset,
 
     init_fn = partial(
         worker_init_fn, num_workers=num_workers, rank=rank,
-        seed=seed) if seed is not None else None
+        seed=seed, epoch_seed=epoch_seed) if seed is not None else None
+    if epoch_seed and seed is not None and 'generator' not in kwargs:
+        # the base seed of the workers is drawn from it at every epoch
+        kwargs['generator'] = torch.Generator()
+        kwargs['generator'].manual_seed(seed)
 
     if digit_version(torch.__version__) >= digit_version('1.8.0'):
         kwargs['persistent_workers'] = persistent_workers
 
+    if infinite_sampler:
+        batch_sampler = InfiniteBatchSampler(sampler, batch_size, drop_last=drop_last)
+        data_loader = DataLoader(
+            dataset,
+            batch_sampler=batch_sampler,
+            num_workers=num_workers,
+            collate_fn=partial(collate, samples_per_gpu=videos_per_gpu),
+            pin_memory=pin_memory,
+            worker_init_fn=init_fn,
+            **kwargs)
+        return EpochLoader(data_loader)
+
     data_loader = DataLoader(
         dataset,
         batch_size=batch_size,
@@ -112,10 +141,57 @@ def build_dataloader(dataset,
     return data_loader
 
 
-def worker_init_fn(worker_id, num_workers, rank, seed):
+class EpochLoader:
+    """The epochs of an endless DataLoader (built with ``infinite_sampler=True``).
+
+    Iterating over it yields the batches of one epoch, taken from a single iterator of the DataLoader that is kept
+    from one epoch to the next. It stands for the DataLoader in the epoch-based runner: ``len``, ``dataset`` and the
+    other attributes are the ones of the DataLoader, ``sampler`` and ``batch_size`` the ones of its batch sampler.
+    The epoch of the sampler is only read when the iterator is created, at the first epoch (which may be resumed in
+    the middle with ``sampler.set_start``), the next epochs follow.
+
+    Args:
+        data_loader (DataLoader): A DataLoader with an ``InfiniteBatchSampler``.
+    """
+
+    def __init__(self, data_loader):
+        self.data_loader = data_loader
+        self.iterator = None
+
+    @property
+    def sampler(self):
+        return self.data_loader.batch_sampler.sampler
+
+    @property
+    def batch_size(self):
+        return self.data_loader.batch_sampler.batch_size
+
+    def __getattr__(self, name):
+        if name == 'data_loader':
+            raise AttributeError(name)
+        return getattr(self.data_loader, name)
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def __iter__(self):
+        num_batches = len(self)
+        if self.iterator is None:
+            # a resumed epoch lacks the batches before the start of the sampler
+            num_batches -= self.sampler.start // self.batch_size
+            self.iterator = iter(self.data_loader)
+        for _ in range(num_batches):
+            yield next(self.iterator)
+
+
+def worker_init_fn(worker_id, num_workers, rank, seed, epoch_seed=False):
     """Init the random seed for various workers."""
     # The seed of each worker equals to
     # num_worker * rank + worker_id + user_seed
     worker_seed = num_workers * rank + worker_id + seed
+    if epoch_seed:
+        # plus the base seed of the epoch, as torch.initial_seed() of a worker
+        # is the base seed + worker_id
+        worker_seed = (worker_seed - worker_id + torch.initial_seed()) % 2**32
     np.random.seed(worker_seed)
     random.seed(worker_seed)
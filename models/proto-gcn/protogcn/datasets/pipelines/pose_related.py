@@ -458,12 +458,21 @@ class GenSkeFeat:
 
 @PIPELINES.register_module()
 class FormatGCNInput:
-    """Format final skeleton shape to the given input_format. """
+    """Format final skeleton shape to the given input_format.
 
-    def __init__(self, num_person=2, mode='zero'):
+    Args:
+        num_person (int): The number of persons M, samples are padded or cut to it. Default: 2.
+        mode (str): How to pad, 'zero' or 'loop'. Default: 'zero'.
+        person_mask (bool): If True, also output ``person_mask`` of shape (num_clips, M), which marks the persons
+            that are not all-zero in a clip. Add it to ``Collect`` and ``ToTensor`` so that the recognizer skips the
+            empty persons. Default: False.
+    """
+
+    def __init__(self, num_person=2, mode='zero', person_mask=False):
         self.num_person = num_person
         assert mode in ['zero', 'loop']
         self.mode = mode
+        self.person_mask = person_mask
 
     def __call__(self, results):
         """Performs the FormatShape formatting.
@@ -493,10 +502,14 @@ class FormatGCNInput:
         assert T % nc == 0
         keypoint = keypoint.reshape((M, nc, T // nc, V, C)).transpose(1, 0, 2, 3, 4)
         results['keypoint'] = np.ascontiguousarray(keypoint)
+        if self.person_mask:
+            # nc M
+            results['person_mask'] = np.abs(keypoint).reshape(nc, M, -1).max(-1) > 0
         return results
 
     def __repr__(self):
-        repr_str = self.__class__.__name__ + f'(num_person={self.num_person}, mode={self.mode})'
+        repr_str = (self.__class__.__name__ + f'(num_person={self.num_person}, mode={self.mode}, '
+                    f'person_mask={self.person_mask})')
         return repr_str
 
 
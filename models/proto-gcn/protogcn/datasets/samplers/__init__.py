@@ -1,3 +1,4 @@
 from .distributed_sampler import ClassSpecificDistributedSampler, DistributedSampler
+from .infinite_sampler import InfiniteBatchSampler
 
-__all__ = ['DistributedSampler', 'ClassSpecificDistributedSampler']
+__all__ = ['DistributedSampler', 'ClassSpecificDistributedSampler', 'InfiniteBatchSampler']
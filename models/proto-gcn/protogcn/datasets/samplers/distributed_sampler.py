@@ -9,7 +9,8 @@ class DistributedSampler(_DistributedSampler):
     ``torch.utils.data.DistributedSampler``.
 
     In pytorch of lower versions, there is no ``shuffle`` argument. This child
-    class will port one to DistributedSampler.
+    class will port one to DistributedSampler. ``set_start`` resumes an epoch
+    in the middle.
     """
 
     def __init__(self,
@@ -21,6 +22,15 @@ class DistributedSampler(_DistributedSampler):
         super().__init__(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle)
         # for the compatibility from PyTorch 1.3+
         self.seed = seed if seed is not None else 0
+        self.start = 0
+
+    def set_start(self, start):
+        """Skip the first ``start`` indices of this rank in the next epoch.
+
+        The order of the epoch only depends on the seed and the epoch, so an epoch interrupted after ``start`` samples
+        of this rank resumes at its next unseen sample. The following epochs are complete.
+        """
+        self.start = start
 
     def __iter__(self):
         # deterministically shuffle based on epoch
@@ -38,6 +48,7 @@ class DistributedSampler(_DistributedSampler):
         # subsample
         indices = indices[self.rank:self.total_size:self.num_replicas]
         assert len(indices) == self.num_samples
+        indices, self.start = indices[self.start:], 0
         return iter(indices)
 
 
@@ -45,7 +56,8 @@ class ClassSpecificDistributedSampler(_DistributedSampler):
     """ClassSpecificDistributedSampler inheriting from 'torch.utils.data.DistributedSampler'.
 
     Samples are sampled with a class specific probability (class_prob). This sampler is only applicable to single class
-    recognition dataset. This sampler is also compatible with RepeatDataset.
+    recognition dataset. This sampler is also compatible with RepeatDataset. ``set_start`` resumes an epoch in the
+    middle.
     """
 
     def __init__(self,
@@ -65,6 +77,9 @@ class ClassSpecificDistributedSampler(_DistributedSampler):
         self.class_prob = class_prob
         # for the compatibility from PyTorch 1.3+
         self.seed = seed if seed is not None else 0
+        self.start = 0
+
+    set_start = DistributedSampler.set_start
 
     def __iter__(self):
         g = torch.Generator()
@@ -107,4 +122,5 @@ class ClassSpecificDistributedSampler(_DistributedSampler):
         # subsample
         indices = indices[self.rank:self.total_size:self.num_replicas]
         assert len(indices) == self.num_samples
+        indices, self.start = indices[self.start:], 0
         return iter(indices)
@@ -0,0 +1,47 @@
+from torch.utils.data import Sampler
+
+
+class InfiniteBatchSampler(Sampler):
+    """Yield the batches of a distributed sampler epoch after epoch, without end.
+
+    The epochs are those of the wrapped sampler (from its current epoch on, with ``set_epoch``), and every epoch is
+    batched on its own as by ``BatchSampler``: the batches are the same as the ones of an epoch-based DataLoader. As
+    the iteration never stops, the DataLoader iterator (and its workers) lives through the whole training, and the
+    workers prefetch the batches of the next epoch before the current one ends. ``len`` is the number of batches of
+    an epoch.
+
+    Args:
+        sampler (DistributedSampler | ClassSpecificDistributedSampler): The sampler of the epochs.
+        batch_size (int): The batch size.
+        drop_last (bool): Whether to drop the last incomplete batch of every epoch. Default: False.
+    """
+
+    def __init__(self, sampler, batch_size, drop_last=False):
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+
+    def resume(self, num_batches):
+        """Start after the first ``num_batches`` batches of the training (counted from epoch 0)."""
+        epoch, batch = divmod(num_batches, len(self))
+        self.sampler.set_epoch(epoch)
+        self.sampler.set_start(batch * self.batch_size)
+
+    def __iter__(self):
+        epoch = self.sampler.epoch
+        while True:
+            self.sampler.set_epoch(epoch)
+            batch = []
+            for idx in self.sampler:
+                batch.append(idx)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+            if batch and not self.drop_last:
+                yield batch
+            epoch += 1
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.sampler) // self.batch_size
+        return (len(self.sampler) + self.batch_size - 1) // self.batch_size
@@ -59,7 +59,8 @@ class Prototype_Reconstruction_Network(nn.Module):
         self.dropout = nn.Dropout(dropout)
         
     def forward(self, x):
-        query = self.softmax(self.query_matrix(x), dim=-1)
+        # the softmax is kept in fp32 under mixed precision
+        query = self.softmax(self.query_matrix(x).float(), dim=-1)
         z = self.memory_matrix(query)
         return self.dropout(z)
 
@@ -78,6 +79,7 @@ class ProtoGCN(nn.Module):
                  data_bn_type='VC',
                  num_person=2,
                  pretrained=None,
+                 exit_stages=[],
                  **kwargs):
         super().__init__()
 
@@ -129,17 +131,21 @@ class ProtoGCN(nn.Module):
 
         self.num_stages = num_stages
         self.gcn = nn.ModuleList(modules)
+        # early exits are taken after these GCN blocks (1-based), see ``EarlyExitHead``
+        assert all(0 < i < len(self.gcn) for i in exit_stages)
+        self.exit_stages = list(exit_stages)
         self.pretrained = pretrained
         
         out_channels = base_channels
         norm = 'BN'
         norm_cfg = norm if isinstance(norm, dict) else dict(type=norm)
         
-        self.post = nn.Conv2d(out_channels, out_channels, 1)
-        self.bn = build_norm_layer(norm_cfg, out_channels)[1]
+        # the graph channels of the last unit_gcn (num_subsets * mid_channels), out_channels (384) by default
+        dim = self.gcn[-1].gcn.num_subsets * self.gcn[-1].gcn.mid_channels
+        self.post = nn.Conv2d(dim, dim, 1)
+        self.bn = build_norm_layer(norm_cfg, dim)[1]
         self.relu = nn.ReLU()
         
-        dim = 384   # base_channels * 4
         self.prn = Prototype_Reconstruction_Network(dim, num_prototype)
         
     def init_weights(self):
@@ -147,43 +153,81 @@ class ProtoGCN(nn.Module):
             self.pretrained = cache_checkpoint(self.pretrained)
             load_checkpoint(self, self.pretrained, strict=False)
 
-    def forward(self, x):
+    def forward_stem(self, x):
+        """Normalize the skeletons of shape (N, M, T, V, C) into the input of the GCN blocks, of shape
+        (N*M, C, T, V)."""
         N, M, T, V, C = x.size()
         x = x.permute(0, 1, 3, 4, 2).contiguous()
         if self.data_bn_type == 'MVC':
             x = self.data_bn(x.view(N, M * V * C, T))
         else:
             x = self.data_bn(x.view(N * M, V * C, T))
-        x = x.view(N, M, V, C, T).permute(0, 1, 3, 4, 2).contiguous().view(N * M, C, T, V)
+        return x.view(N, M, V, C, T).permute(0, 1, 3, 4, 2).contiguous().view(N * M, C, T, V)
+
+    def forward(self, x, person_mask=None, return_exits=False):
+        """Defines the computation performed at every call.
+
+        Args:
+            x (torch.Tensor): The skeletons of shape (N, M, T, V, C).
+            person_mask (torch.Tensor | None): Bool mask of shape (N, M) of the non-empty persons. If given, the GCN
+                blocks only run on the non-empty persons (packed into a dense sub-batch), the features of the empty
+                persons are zeros and the graph is averaged over the non-empty persons only. Default: None.
+            return_exits (bool): Whether to also return the features after the ``exit_stages``. Default: False.
+
+        Returns:
+            tuple: The features of shape (N, M, C, T, V) and the reconstructed graph of shape (N, V*V), followed by
+                the list of exit features of shape (N, M, C_i, T_i, V) if ``return_exits``.
+        """
+        N, M, T, V, C = x.size()
+        x = self.forward_stem(x)
+
+        if person_mask is not None:
+            person_mask = person_mask.bool().clone()
+            # a sample without any person still goes through the backbone once
+            person_mask[:, 0] |= ~person_mask.any(1)
+            inds = person_mask.view(-1).nonzero().squeeze(1)
+            x = x.index_select(0, inds)
 
         get_graph = []
+        exit_feats = []
         for i in range(self.num_stages):
             x, gcl_graph = self.gcn[i](x)
             # N*M C V V
             get_graph.append(gcl_graph)
-        
-        x = x.reshape((N, M) + x.shape[1:])
-        c_graph = x.size(2)
-        
+            if return_exits and i + 1 in self.exit_stages:
+                exit_feats.append(x)
+
         graph = get_graph[-1]
+        if person_mask is not None:
+            # scatter the packed persons back, the empty persons are zeros
+            x = x.new_zeros((N * M, ) + x.shape[1:]).index_copy(0, inds, x)
+            graph = graph.new_zeros((N * M, ) + graph.shape[1:]).index_copy(0, inds, graph)
+            exit_feats = [f.new_zeros((N * M, ) + f.shape[1:]).index_copy(0, inds, f) for f in exit_feats]
+
+        x = x.reshape((N, M) + x.shape[1:])
+        c_graph = graph.size(1)
+
         # N C V V -> N C V*V
-        graph = graph.view(N, M, c_graph, V, V).mean(1).view(N, c_graph, V * V)
-        
-        the_graph_list = []
-        for i in range(N):
-            # V*V C
-            the_graph = graph[i].permute(1, 0)
-            # V*V C
-            the_graph = self.prn(the_graph)
-            # C V V
-            the_graph = the_graph.permute(1, 0).view(c_graph, V, V)
-            the_graph_list.append(the_graph)
+        graph = graph.view(N, M, c_graph, V, V)
+        if person_mask is None:
+            graph = graph.mean(1)
+        else:
+            num_person = person_mask.sum(1).to(graph.dtype)
+            graph = graph.sum(1) / num_person[:, None, None, None]
+        graph = graph.view(N, c_graph, V * V)
         
+        # the prototypes are shared by all samples, so the whole batch goes
+        # through the PRN at once (this also keeps the batch size dynamic when
+        # the model is traced for export)
+        # N V*V C
+        the_graph = self.prn(graph.permute(0, 2, 1))
         # N C V V
-        re_graph = torch.stack(the_graph_list, dim=0)
+        re_graph = the_graph.permute(0, 2, 1).reshape(N, c_graph, V, V)
         re_graph = self.post(re_graph)
         reconstructed_graph = self.relu(self.bn(re_graph))
         # N V*V
         reconstructed_graph = reconstructed_graph.mean(1).view(N, -1)
-        
+
+        if return_exits:
+            return x, reconstructed_graph, [f.reshape((N, M) + f.shape[1:]) for f in exit_feats]
         return x, reconstructed_graph
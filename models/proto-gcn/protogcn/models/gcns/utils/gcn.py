@@ -16,7 +16,8 @@ class unit_gcn(nn.Module):
                  intra_act='softmax',
                  inter_act='tanh',
                  norm='BN',
-                 act='ReLU'):
+                 act='ReLU',
+                 mid_channels=None):
         super().__init__()
 
         self.in_channels = in_channels
@@ -24,7 +25,9 @@ class unit_gcn(nn.Module):
         num_subsets = A.size(0)
         self.num_subsets = num_subsets
         self.ratio = ratio
-        mid_channels = int(ratio * out_channels)
+        # the channels of every subset, `mid_channels` (e.g. of a pruned model) overrides `ratio`
+        if mid_channels is None:
+            mid_channels = int(ratio * out_channels)
         self.mid_channels = mid_channels
 
         self.norm_cfg = norm if isinstance(norm, dict) else dict(type=norm)
@@ -92,8 +95,8 @@ class unit_gcn(nn.Module):
         graph_list.append(inter_graph)
         # N K C 1 V * N K C 1 V = N K 1 1 V V
         intra_graph = torch.einsum('nkctv,nkctw->nktvw', x1, x2)[:, :, None]
-        # N K 1 1 V V
-        intra_graph = getattr(self, self.intra_act)(intra_graph)
+        # N K 1 1 V V, the activation (softmax) is kept in fp32 under mixed precision
+        intra_graph = getattr(self, self.intra_act)(intra_graph.float())
         intra_graph = intra_graph * self.beta[0]
         # N K C 1 V V = N K 1 1 V V + N K C 1 V V
         A = intra_graph + A
@@ -61,17 +61,25 @@ class mstcn(nn.Module):
         if mid_channels is None:
             mid_channels = out_channels // num_branches
             rem_mid_channels = out_channels - mid_channels * (num_branches - 1)
+            branch_channels = [rem_mid_channels] + [mid_channels] * (num_branches - 1)
+        elif isinstance(mid_channels, (list, tuple)):
+            # the channels of every branch (e.g. of a pruned model)
+            assert len(mid_channels) == num_branches
+            branch_channels = list(mid_channels)
+            rem_mid_channels = mid_channels[0]
         else:
             assert isinstance(mid_channels, float) and mid_channels > 0
             mid_channels = int(out_channels * mid_channels)
             rem_mid_channels = mid_channels
+            branch_channels = [mid_channels] * num_branches
 
         self.mid_channels = mid_channels
         self.rem_mid_channels = rem_mid_channels
+        self.branch_channels = branch_channels
 
         branches = []
         for i, cfg in enumerate(ms_cfg):
-            branch_c = rem_mid_channels if i == 0 else mid_channels
+            branch_c = branch_channels[i]
             if cfg == '1x1':
                 branches.append(nn.Conv2d(in_channels, branch_c, kernel_size=1, stride=(stride, 1)))
                 continue
@@ -89,7 +97,7 @@ class mstcn(nn.Module):
             branches.append(branch)
 
         self.branches = nn.ModuleList(branches)
-        tin_channels = mid_channels * (num_branches - 1) + rem_mid_channels
+        tin_channels = sum(branch_channels)
 
         self.transform = nn.Sequential(
             nn.BatchNorm2d(tin_channels), self.act, nn.Conv2d(tin_channels, out_channels, kernel_size=1))
@@ -4,7 +4,7 @@ import torch.nn.functional as F
 import numpy as np
 from torch import linalg as LA
 from abc import ABCMeta, abstractmethod
-from ...core import top_k_accuracy
+from ...core import top_k_accuracy_tensor
 from ..builder import build_loss
 
 from ..losses.Class_Specific_Contrastive_Loss import Class_Specific_Contrastive_Loss
@@ -45,6 +45,8 @@ class BaseHead(nn.Module, metaclass=ABCMeta):
     def loss(self, cls_score, get_graph, label, **kwargs):
 
         losses = dict()
+        # compute the losses in fp32 under mixed precision
+        cls_score = cls_score.float()
         if label.shape == torch.Size([]):
             label = label.unsqueeze(0)
         elif label.dim() == 1 and label.size()[0] == self.num_classes \
@@ -52,12 +54,9 @@ class BaseHead(nn.Module, metaclass=ABCMeta):
             label = label.unsqueeze(0)
 
         if not self.multi_class and cls_score.size() != label.size():
-            top_k_acc = top_k_accuracy(cls_score.detach().cpu().numpy(),
-                                       label.detach().cpu().numpy(), (1, 5))
-            losses['top1_acc'] = torch.tensor(
-                top_k_acc[0], device=cls_score.device)
-            losses['top5_acc'] = torch.tensor(
-                top_k_acc[1], device=cls_score.device)
+            top_k_acc = top_k_accuracy_tensor(cls_score.detach(), label.detach(), (1, 5))
+            losses['top1_acc'] = top_k_acc[0]
+            losses['top5_acc'] = top_k_acc[1]
 
         elif self.multi_class and self.label_smooth_eps != 0:
             label = ((1 - self.label_smooth_eps) * label + self.label_smooth_eps / self.num_classes)
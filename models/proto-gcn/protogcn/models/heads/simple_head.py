@@ -39,8 +39,35 @@ class SimpleHead(BaseHead):
         """Initiate the parameters from scratch."""
         normal_init(self.fc_cls, std=self.init_std)
 
-    def forward(self, x):
+    @staticmethod
+    def pool(x, person_mask=None):
+        """Pool GCN features of shape (N, M, C, T, V) into (N, C), over the non-empty persons only if
+        ``person_mask`` is given."""
+        pool = nn.AdaptiveAvgPool2d(1)
+        N, M, C, T, V = x.shape
+        x = x.reshape(N * M, C, T, V)
 
+        x = pool(x)
+        x = x.reshape(N, M, C)
+        if person_mask is None:
+            return x.mean(dim=1)
+        person_mask = person_mask.bool().clone()
+        # a sample without any person keeps person 0, as in the backbone
+        person_mask[:, 0] |= ~person_mask.any(1)
+        person_mask = person_mask.to(x.dtype)
+        return (x * person_mask[..., None]).sum(dim=1) / person_mask.sum(dim=1, keepdim=True)
+
+    def forward(self, x, person_mask=None):
+        """Defines the computation performed at every call.
+
+        Args:
+            x (torch.Tensor | list[torch.Tensor]): The backbone features, of shape (N, M, C, T, V) in 'GCN' mode.
+            person_mask (torch.Tensor | None): Bool mask of shape (N, M) of the non-empty persons, the pooling over
+                M ignores the others. Default: None.
+
+        Returns:
+            torch.Tensor: The class scores.
+        """
         if isinstance(x, list):
             for item in x:
                 assert len(item.shape) == 2
@@ -49,13 +76,7 @@ class SimpleHead(BaseHead):
 
         if len(x.shape) != 2:
             if self.mode == 'GCN':
-                pool = nn.AdaptiveAvgPool2d(1)
-                N, M, C, T, V = x.shape
-                x = x.reshape(N * M, C, T, V)
-
-                x = pool(x)
-                x = x.reshape(N, M, C)
-                x = x.mean(dim=1)
+                x = self.pool(x, person_mask)
 
         assert x.shape[1] == self.in_c
         if self.dropout is not None:
@@ -63,3 +84,51 @@ class SimpleHead(BaseHead):
 
         cls_score = self.fc_cls(x)
         return cls_score
+
+
+@HEADS.register_module()
+class EarlyExitHead(SimpleHead):
+    """SimpleHead with lightweight early-exit classifiers.
+
+    Every exit pools the features after one of the backbone ``exit_stages`` and classifies them with a linear layer.
+    The exits are trained jointly with the final classifier: ``loss`` adds their cross-entropy (``loss_cls``),
+    weighted by ``exit_loss_weight``, to the losses of ``BaseHead.loss``. At test time, ``RecognizerGCN`` stops a
+    sample at the first exit whose confidence passes ``test_cfg.early_exit.threshold``.
+
+    Args:
+        exit_channels (list[int]): The channels of the backbone features at every exit.
+        exit_loss_weight (float): The weight of the loss of every exit. Default: 0.5.
+    """
+
+    def __init__(self,
+                 joint_cfg,
+                 num_classes,
+                 in_channels,
+                 weight,
+                 exit_channels,
+                 exit_loss_weight=0.5,
+                 **kwargs):
+        super().__init__(joint_cfg, num_classes, in_channels, weight, **kwargs)
+        self.exit_loss_weight = exit_loss_weight
+        self.exit_fcs = nn.ModuleList([nn.Linear(c, num_classes) for c in exit_channels])
+
+    def init_weights(self):
+        """Initiate the parameters from scratch."""
+        super().init_weights()
+        for fc in self.exit_fcs:
+            normal_init(fc, std=self.init_std)
+
+    def forward_exit(self, x, idx, person_mask=None):
+        """Classify the features of shape (N, M, C, T, V) at the ``idx``-th exit."""
+        x = self.pool(x, person_mask)
+        if self.dropout is not None:
+            x = self.dropout(x)
+        return self.exit_fcs[idx](x)
+
+    def loss(self, cls_score, get_graph, label, exit_scores=(), **kwargs):
+        losses = super().loss(cls_score, get_graph, label, **kwargs)
+        for i, exit_score in enumerate(exit_scores):
+            exit_score = exit_score.float()
+            losses[f'loss_exit{i + 1}'] = self.exit_loss_weight * self.loss_cls(exit_score, label, **kwargs)
+            losses[f'exit{i + 1}_top1_acc'] = top_k_accuracy_tensor(exit_score.detach(), label.detach(), (1, ))[0]
+        return losses
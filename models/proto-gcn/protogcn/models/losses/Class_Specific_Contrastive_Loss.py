@@ -21,7 +21,8 @@ class Class_Specific_Contrastive_Loss(nn.Module):
         self.tmp = tmp
         self.mom = mom
         self.pred_threshold = pred_threshold
-        self.avg_f = torch.randn(self.h_channel, self.n_class)
+        # the memory bank of class features, a buffer so that it is saved in the checkpoints
+        self.register_buffer('avg_f', torch.randn(self.h_channel, self.n_class))
         self.cl_fc = nn.Linear(self.n_channel, self.h_channel)
         self.loss = nn.CrossEntropyLoss(reduction='none')
         
@@ -84,6 +85,11 @@ class Class_Specific_Contrastive_Loss(nn.Module):
         return score_cl
     
     def forward(self, feature, lbl, logit):
+        # the normalization and the memory bank are kept in fp32 under mixed precision
+        with torch.autocast(device_type=feature.device.type, enabled=False):
+            return self._forward(feature.float(), lbl, logit.float())
+
+    def _forward(self, feature, lbl, logit):
         # batch: 16  num_class: 120
         # 16 256
         feature = self.cl_fc(feature)
@@ -1,3 +1,5 @@
+from .distiller import Distiller
 from .recognizergcn import RecognizerGCN
+from .recognizermultistream import RecognizerMultiStream
 
-__all__ = ['RecognizerGCN']
+__all__ = ['Distiller', 'RecognizerGCN', 'RecognizerMultiStream']
@@ -5,6 +5,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
+from contextlib import nullcontext
 
 from .. import builder
 
@@ -26,7 +27,7 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
     - Methods:``forward_test``, supporting to forward when testing.
 
     Args:
-        backbone (dict): Backbone modules to extract feature.
+        backbone (dict | None): Backbone modules to extract feature.
         cls_head (dict | None): Classification head to process feature. Default: None.
         train_cfg (dict): Config for training. Default: {}.
         test_cfg (dict): Config for testing. Default: {}.
@@ -38,7 +39,8 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
                  train_cfg=dict(),
                  test_cfg=dict()):
         super().__init__()
-        self.backbone = builder.build_backbone(backbone)
+        # multi-stream recognizers build one backbone / head per stream instead
+        self.backbone = builder.build_backbone(backbone) if backbone is not None else None
         self.cls_head = builder.build_head(cls_head) if cls_head else None
 
         if train_cfg is None:
@@ -53,6 +55,21 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
         self.test_cfg = test_cfg
 
         self.max_testing_views = test_cfg.get('max_testing_views', None)
+        # The number of samples and of scored / available clips in adaptive testing (``test_cfg.adaptive``).
+        self.adaptive_stats = dict(samples=0, clips=0, max_clips=0)
+        # The number of clips leaving at every exit in early-exit testing (``test_cfg.early_exit``).
+        self.early_exit_stats = dict()
+        # The teacher(s) of distillation training (a ``Distiller``, set by ``train_model`` from the `distill` config).
+        self.distiller = None
+        # The dtype used by `torch.autocast` for mixed precision (set from the
+        # `fp16` config), None means full precision.
+        self.amp_dtype = None
+        # When set (by ``LogVarsReduceHook``), ``train_step`` keeps the log
+        # variables on device and they are fetched by ``flush_log_vars``.
+        self.defer_log_vars = False
+        self._log_var_names = None
+        self._log_var_sums = None
+        self._log_var_samples = 0
         self.init_weights()
 
     @property
@@ -62,10 +79,23 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
 
     def init_weights(self):
         """Initialize the model network weights."""
-        self.backbone.init_weights()
+        if self.backbone is not None:
+            self.backbone.init_weights()
         if self.with_cls_head:
             self.cls_head.init_weights()
 
+    def amp_context(self):
+        """Return the autocast context for the forward pass.
+
+        Returns:
+            A ``torch.autocast`` context on the device of the model if
+            ``amp_dtype`` is set, otherwise a null context.
+        """
+        if self.amp_dtype is None:
+            return nullcontext()
+        device_type = next(self.parameters()).device.type
+        return torch.autocast(device_type=device_type, dtype=self.amp_dtype)
+
     def extract_feat(self, imgs):
         """Extract features through a backbone.
 
@@ -113,7 +143,7 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
         testing."""
 
     def _parse_losses(self, losses):
-        """Parse the ra w outputs (losses) of the network.
+        """Parse the raw outputs (losses) of the network.
 
         Args:
             losses (dict): Raw output of the network, which usually contain
@@ -122,7 +152,8 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
         Returns:
             tuple[Tensor, dict]: (loss, log_vars), loss is the loss tensor
                 which may be a weighted sum of all losses, log_vars contains
-                all the variables to be sent to the logger.
+                all the variables to be sent to the logger, as detached scalar
+                tensors that still live on the device.
         """
         log_vars = OrderedDict()
         for loss_name, loss_value in losses.items():
@@ -137,14 +168,68 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
 
         log_vars['loss'] = loss
         for loss_name, loss_value in log_vars.items():
-            # reduce loss when distributed training
-            if dist.is_available() and dist.is_initialized():
-                loss_value = loss_value.data.clone()
-                dist.all_reduce(loss_value.div_(dist.get_world_size()))
-            log_vars[loss_name] = loss_value.item()
+            log_vars[loss_name] = loss_value.detach()
 
         return loss, log_vars
 
+    @staticmethod
+    def _reduce_log_vars(log_vars):
+        """Average the log variables over all ranks and fetch them to the host.
+
+        All the variables are packed into one tensor, so a single collective
+        and a single device-to-host copy are issued however many there are.
+
+        Args:
+            log_vars (dict[str, Tensor]): Scalar tensors to be reduced.
+
+        Returns:
+            dict[str, float]: The reduced log variables.
+        """
+        packed = torch.stack([value.float() for value in log_vars.values()])
+        if dist.is_available() and dist.is_initialized():
+            dist.all_reduce(packed.div_(dist.get_world_size()))
+        return OrderedDict(zip(log_vars.keys(), packed.tolist()))
+
+    def _accumulate_log_vars(self, log_vars, num_samples):
+        """Add the log variables of one iteration to the on-device buffer."""
+        values = torch.stack([value.float() for value in log_vars.values()]) * num_samples
+        if self._log_var_sums is None:
+            self._log_var_names = list(log_vars.keys())
+            self._log_var_sums = values
+        else:
+            assert self._log_var_names == list(log_vars.keys()), \
+                'The log variables should not change between iterations'
+            self._log_var_sums += values
+        self._log_var_samples += num_samples
+
+    def reset_log_vars(self):
+        """Drop the log variables accumulated since the last flush."""
+        self._log_var_names = None
+        self._log_var_sums = None
+        self._log_var_samples = 0
+
+    def flush_log_vars(self):
+        """Reduce the accumulated log variables and fetch them to the host.
+
+        The per-rank sums and sample counts are packed into one tensor and
+        summed with a single collective, so the returned values are averaged
+        over all samples seen by all ranks since the last flush.
+
+        Returns:
+            tuple[dict[str, float], int]: The averaged log variables and the
+                number of samples accumulated on this rank.
+        """
+        if self._log_var_sums is None:
+            return OrderedDict(), 0
+        num_samples = self._log_var_samples
+        packed = torch.cat([self._log_var_sums, self._log_var_sums.new_tensor([num_samples])])
+        if dist.is_available() and dist.is_initialized():
+            dist.all_reduce(packed)
+        packed = packed.tolist()
+        log_vars = OrderedDict((name, value / packed[-1]) for name, value in zip(self._log_var_names, packed[:-1]))
+        self.reset_log_vars()
+        return log_vars, num_samples
+
     def forward(self, imgs, label=None, return_loss=True, **kwargs):
         """Define the computation performed at every call."""
         if return_loss:
@@ -175,18 +260,22 @@ class BaseRecognizer(nn.Module, metaclass=ABCMeta):
                 ``loss`` is a tensor for back propagation, which can be a
                 weighted sum of multiple losses.
                 ``log_vars`` contains all the variables to be sent to the
-                logger.
+                logger. It is omitted when ``defer_log_vars`` is set, in which
+                case the variables are fetched with ``flush_log_vars``.
                 ``num_samples`` indicates the batch size (when the model is
                 DDP, it means the batch size on each GPU), which is used for
                 averaging the logs.
         """
-        losses = self(**data_batch, return_loss=True)
+        with self.amp_context():
+            losses = self(**data_batch, return_loss=True)
 
         loss, log_vars = self._parse_losses(losses)
+        num_samples = len(next(iter(data_batch.values())))
 
-        outputs = dict(
-            loss=loss,
-            log_vars=log_vars,
-            num_samples=len(next(iter(data_batch.values()))))
+        outputs = dict(loss=loss, num_samples=num_samples)
+        if self.defer_log_vars:
+            self._accumulate_log_vars(log_vars, num_samples)
+        else:
+            outputs['log_vars'] = self._reduce_log_vars(log_vars)
 
         return outputs
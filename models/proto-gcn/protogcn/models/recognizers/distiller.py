@@ -0,0 +1,117 @@
+import torch
+import torch.nn.functional as F
+from mmcv import Config
+from mmcv.runner import load_checkpoint
+
+from ...utils import cache_checkpoint
+from ..builder import build_model
+
+__all__ = ['Distiller']
+
+
+class Distiller:
+    """Teacher(s) for distilling a RecognizerGCN into a compact student.
+
+    The teachers are frozen RecognizerGCNs built from their config files and checkpoints. Several teachers form a
+    fused multi-modality ensemble (like ``tools/ensemble.py``): their logits and reconstructed graphs are averaged
+    with the given weights. Every teacher reads its own modality (the ``modality`` of its config), so the train
+    pipeline generates all of them at once, e.g. ``GenSkeFeat(feats=['j', 'b', 'jm', 'bm'])``, and the student gets
+    the slice of ``student_feat``.
+
+    The Distiller is not an ``nn.Module``: it is attached to the student as ``recognizer.distiller`` and stays out of
+    its state dict, of the optimizer and of DDP. The student losses become::
+
+        cls_weight * loss_cls + kd_weight * T^2 * KL(teacher / T || student / T) + graph_weight * MSE(graphs)
+
+    where ``loss_cls`` is the usual head loss (CE + CSC) and the graphs are the reconstructed graphs ``get_graph``.
+
+    Args:
+        teachers (list[dict]): The teachers, each with ``config``, ``checkpoint`` and optionally ``weight``
+            (default 1) and ``modality`` (default: the ``modality`` of the config).
+        feats (list[str]): The modalities generated by ``GenSkeFeat`` in the train pipeline, in order.
+        student_feat (str): The modality of the student. Default: 'j'.
+        temperature (float): The softmax temperature of the KL loss. Default: 4.
+        cls_weight (float): The weight of the head loss of the student. Default: 1.
+        kd_weight (float): The weight of the KL loss. Default: 1.
+        graph_weight (float): The weight of the graph-matching loss. Default: 1.
+    """
+
+    def __init__(self,
+                 teachers,
+                 feats,
+                 student_feat='j',
+                 temperature=4.,
+                 cls_weight=1.,
+                 kd_weight=1.,
+                 graph_weight=1.):
+        assert student_feat in feats, f'The student modality {student_feat} is not in {feats}'
+        self.feats = list(feats)
+        self.student_feat = student_feat
+        self.temperature = temperature
+        self.cls_weight = cls_weight
+        self.kd_weight = kd_weight
+        self.graph_weight = graph_weight
+
+        self.teachers, self.modalities, weights = [], [], []
+        for teacher in teachers:
+            cfg = Config.fromfile(teacher['config'])
+            modality = teacher.get('modality', cfg.get('modality', 'j'))
+            assert modality in feats, f'The teacher modality {modality} is not in {feats}'
+            model = build_model(cfg.model)
+            load_checkpoint(model, cache_checkpoint(teacher['checkpoint']), map_location='cpu')
+            model.eval().requires_grad_(False)
+            self.teachers.append(model)
+            self.modalities.append(modality)
+            weights.append(teacher.get('weight', 1.))
+        self.weights = [w / sum(weights) for w in weights]
+
+    def to(self, device):
+        for teacher in self.teachers:
+            teacher.to(device)
+        return self
+
+    def split(self, keypoint, feat):
+        """Get the channels of modality ``feat`` from the merged input of shape (..., C * len(feats))."""
+        num_channels = keypoint.shape[-1] // len(self.feats)
+        idx = self.feats.index(feat)
+        return keypoint[..., idx * num_channels:(idx + 1) * num_channels].contiguous()
+
+    @torch.no_grad()
+    def targets(self, keypoint, person_mask=None):
+        """Run the teachers.
+
+        Args:
+            keypoint (torch.Tensor): The merged input of shape (N, M, T, V, C * len(feats)).
+            person_mask (torch.Tensor | None): The person mask of shape (N, M). Default: None.
+
+        Returns:
+            tuple[torch.Tensor]: The fused teacher logits of shape (N, num_classes) and reconstructed graph of shape
+                (N, V*V).
+        """
+        cls_score, graph = 0, 0
+        for teacher, modality, weight in zip(self.teachers, self.modalities, self.weights):
+            x, get_graph = teacher.extract_feat(self.split(keypoint, modality), person_mask)
+            cls_score = cls_score + weight * teacher.cls_head(x, person_mask).float()
+            graph = graph + weight * get_graph.float()
+        return cls_score, graph
+
+    def loss(self, cls_score, get_graph, teacher_score, teacher_graph):
+        """Compute the distillation losses of the student.
+
+        Args:
+            cls_score (torch.Tensor): The student logits of shape (N, num_classes).
+            get_graph (torch.Tensor): The student reconstructed graph of shape (N, V*V).
+            teacher_score (torch.Tensor): The teacher logits of shape (N, num_classes).
+            teacher_graph (torch.Tensor): The teacher reconstructed graph of shape (N, V*V).
+
+        Returns:
+            dict: ``loss_kd``, ``loss_graph`` and the top-1 agreement with the teacher ``teacher_agree``.
+        """
+        T = self.temperature
+        log_prob = F.log_softmax(cls_score.float() / T, dim=-1)
+        teacher_prob = F.softmax(teacher_score / T, dim=-1)
+        loss_kd = F.kl_div(log_prob, teacher_prob, reduction='batchmean') * T ** 2
+        loss_graph = F.mse_loss(get_graph.float(), teacher_graph)
+        agree = (cls_score.argmax(-1) == teacher_score.argmax(-1)).float().mean()
+        return dict(
+            loss_kd=self.kd_weight * loss_kd, loss_graph=self.graph_weight * loss_graph, teacher_agree=agree)
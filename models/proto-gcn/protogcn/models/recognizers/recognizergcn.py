@@ -9,32 +9,141 @@ from .base import BaseRecognizer
 class RecognizerGCN(BaseRecognizer):
     """GCN-based recognizer for skeleton-based action recognition. """
 
-    def forward_train(self, keypoint, label, **kwargs):
-        """Defines the computation performed at every call when training."""
+    @property
+    def with_early_exit(self):
+        """bool: whether the recognizer has early-exit classifiers (``EarlyExitHead``)."""
+        return hasattr(self.cls_head, 'exit_fcs') and len(self.backbone.exit_stages) > 0
+
+    def forward_train(self, keypoint, label, person_mask=None, **kwargs):
+        """Defines the computation performed at every call when training.
+
+        With a ``distiller`` attached, ``keypoint`` holds all the modalities of ``distiller.feats``: the teachers read
+        theirs, the student its ``student_feat``, and the distillation losses are added.
+        """
         assert self.with_cls_head
         assert keypoint.shape[1] == 1
         keypoint = keypoint[:, 0]
+        if person_mask is not None:
+            person_mask = person_mask[:, 0]
+
+        teacher_score = None
+        if self.distiller is not None:
+            teacher_score, teacher_graph = self.distiller.targets(keypoint, person_mask)
+            keypoint = self.distiller.split(keypoint, self.distiller.student_feat)
 
         losses = dict()
-        x, get_graph = self.extract_feat(keypoint)
-        cls_score = self.cls_head(x)
         gt_label = label.squeeze(-1)
-        loss = self.cls_head.loss(cls_score, get_graph, gt_label)
+        if self.with_early_exit:
+            x, get_graph, exit_feats = self.backbone(keypoint, person_mask, return_exits=True)
+            exit_scores = [self.cls_head.forward_exit(f, i, person_mask) for i, f in enumerate(exit_feats)]
+            cls_score = self.cls_head(x, person_mask)
+            loss = self.cls_head.loss(cls_score, get_graph, gt_label, exit_scores=exit_scores)
+        else:
+            x, get_graph = self.extract_feat(keypoint, person_mask)
+            cls_score = self.cls_head(x, person_mask)
+            loss = self.cls_head.loss(cls_score, get_graph, gt_label)
         losses.update(loss)
+        if teacher_score is not None:
+            losses['loss_cls'] = self.distiller.cls_weight * losses['loss_cls']
+            losses.update(self.distiller.loss(cls_score, get_graph, teacher_score, teacher_graph))
 
         return losses
 
-    def forward_test(self, keypoint, **kwargs):
+    def forward_clips(self, keypoint, person_mask=None, with_head=True):
+        """Run flattened clips through the backbone (and the head), in chunks of at most ``test_cfg.max_testing_views``
+        clips (all at once if it is not set).
+
+        Args:
+            keypoint (torch.Tensor): The clips of shape (num_clips, M, T, V, C).
+            person_mask (torch.Tensor | None): The person mask of shape (num_clips, M). Default: None.
+            with_head (bool): Whether to return the class scores or the backbone features. Default: True.
+
+        Returns:
+            list[torch.Tensor]: The class scores (or the features) of every chunk.
+        """
+        num_views = self.max_testing_views or len(keypoint)
+        early_exit = with_head and self.with_early_exit and self.test_cfg.get('early_exit', None) is not None
+        outs = []
+        for i in range(0, len(keypoint), num_views):
+            mask = None if person_mask is None else person_mask[i:i + num_views]
+            if early_exit:
+                outs.append(self.forward_early_exit(keypoint[i:i + num_views], mask).float())
+                continue
+            x, _ = self.extract_feat(keypoint[i:i + num_views], mask)
+            outs.append(self.cls_head(x, mask).float() if with_head else x)
+        return outs
+
+    def forward_early_exit(self, keypoint, person_mask=None):
+        """Score clips with early exits.
+
+        The GCN blocks run stage by stage. At every exit, the clips whose softmax confidence reaches
+        ``test_cfg.early_exit.threshold`` take the exit score and leave the batch, the others go on to the next
+        block. The PRN only feeds the training loss, so it is skipped. The person mask only masks the pooling here,
+        the empty persons are not skipped.
+
+        The number of clips leaving at every exit ('exit1', ..., 'final') is added to ``self.early_exit_stats``.
+
+        Args:
+            keypoint (torch.Tensor): The clips of shape (num_clips, M, T, V, C).
+            person_mask (torch.Tensor | None): The person mask of shape (num_clips, M). Default: None.
+
+        Returns:
+            torch.Tensor: The class scores of shape (num_clips, num_classes).
+        """
+        threshold = self.test_cfg['early_exit']['threshold']
+        N, M = keypoint.shape[:2]
+        exits = {stage: i for i, stage in enumerate(self.backbone.exit_stages)}
+        x = self.backbone.forward_stem(keypoint)
+        active = torch.arange(N, device=keypoint.device)
+        cls_score = None
+        for i, block in enumerate(self.backbone.gcn):
+            x, _ = block(x)
+            if i + 1 not in exits:
+                continue
+            x = x.reshape((len(active), M) + x.shape[1:])
+            mask = None if person_mask is None else person_mask[active]
+            exit_score = self.cls_head.forward_exit(x, exits[i + 1], mask)
+            if cls_score is None:
+                cls_score = exit_score.new_zeros(N, exit_score.shape[-1])
+            done = exit_score.softmax(dim=-1).amax(dim=-1) >= threshold
+            cls_score[active[done]] = exit_score[done]
+            key = f'exit{exits[i + 1] + 1}'
+            self.early_exit_stats[key] = self.early_exit_stats.get(key, 0) + int(done.sum())
+            x, active = x[~done].flatten(0, 1), active[~done]
+            if len(active) == 0:
+                return cls_score
+
+        x = x.reshape((len(active), M) + x.shape[1:])
+        mask = None if person_mask is None else person_mask[active]
+        final_score = self.cls_head(x, mask)
+        self.early_exit_stats['final'] = self.early_exit_stats.get('final', 0) + len(active)
+        if cls_score is None:
+            return final_score
+        cls_score[active] = final_score.to(cls_score.dtype)
+        return cls_score
+
+    def forward_test(self, keypoint, person_mask=None, **kwargs):
         """Defines the computation performed at every call when evaluation and
-        testing."""
+        testing.
+
+        The clips of all samples in the batch go through the backbone together, in chunks of at most
+        ``test_cfg.max_testing_views`` clips (all at once if it is not set). The clip scores are then regrouped per
+        sample before ``average_clip``. With ``test_cfg.adaptive`` set, the clips are scored in rounds instead, see
+        ``forward_adaptive``.
+        """
         assert self.with_cls_head or self.feat_ext
+        feat_ext = self.test_cfg.get('feat_ext', False)
+        score_ext = self.test_cfg.get('score_ext', False)
+        if self.test_cfg.get('adaptive', None) is not None and not (feat_ext or score_ext):
+            return self.forward_adaptive(keypoint, person_mask)
+
         bs, nc = keypoint.shape[:2]
         keypoint = keypoint.reshape((bs * nc, ) + keypoint.shape[2:])
+        if person_mask is not None:
+            person_mask = person_mask.reshape((bs * nc, ) + person_mask.shape[2:])
+        outs = self.forward_clips(keypoint, person_mask, with_head=not (feat_ext or score_ext))
 
-        x, get_graph = self.extract_feat(keypoint)
-        feat_ext = self.test_cfg.get('feat_ext', False)
         pool_opt = self.test_cfg.get('pool_opt', 'all')
-        score_ext = self.test_cfg.get('score_ext', False)
         if feat_ext or score_ext:
             assert bs == 1
             assert isinstance(pool_opt, str)
@@ -46,6 +155,7 @@ class RecognizerGCN(BaseRecognizer):
                 for digit in pool_opt:
                     assert digit in dim_idx
 
+            x = outs[0] if len(outs) == 1 else torch.cat(outs)
             if isinstance(x, tuple) or isinstance(x, list):
                 x = torch.cat(x, dim=2)
             assert len(x.shape) == 5, 'The shape is N, M, C, T, V'
@@ -62,7 +172,7 @@ class RecognizerGCN(BaseRecognizer):
                 x = x[None]
             return x.data.cpu().numpy().astype(np.float16)
 
-        cls_score = self.cls_head(x)
+        cls_score = outs[0] if len(outs) == 1 else torch.cat(outs)
         cls_score = cls_score.reshape(bs, nc, cls_score.shape[-1])
         if 'average_clips' not in self.test_cfg:
             self.test_cfg['average_clips'] = 'prob'
@@ -74,6 +184,87 @@ class RecognizerGCN(BaseRecognizer):
 
         return cls_score.data.cpu().numpy()
 
+    def forward_adaptive(self, keypoint, person_mask=None):
+        """Anytime multi-clip testing.
+
+        The clips are scored in rounds of ``clips_per_round`` (in their sampled order). After every round, the
+        samples whose running clip average is confident enough stop: the top-1 / top-2 margin of its probabilities
+        is at least ``margin``, or their entropy is at most ``entropy``. Only the remaining samples are scored in the
+        next round. Configured by ``test_cfg.adaptive``, e.g. ``dict(clips_per_round=2, margin=0.5)``.
+
+        The number of samples and of scored / available clips are added to ``self.adaptive_stats``.
+
+        Args:
+            keypoint (torch.Tensor): Input of shape (N, num_clips, M, T, V, C).
+            person_mask (torch.Tensor | None): The person mask of shape (N, num_clips, M). Default: None.
+
+        Returns:
+            np.ndarray: The averaged class scores of shape (N, num_classes).
+        """
+        cfg = self.test_cfg['adaptive']
+        clips_per_round = cfg.get('clips_per_round', 2)
+        margin, max_entropy = cfg.get('margin', None), cfg.get('entropy', None)
+        assert margin is not None or max_entropy is not None, 'adaptive testing needs a margin or an entropy'
+        average_clips = self.test_cfg.get('average_clips', 'prob')
+        assert average_clips in ['score', 'prob'], 'adaptive testing needs average_clips to be "score" or "prob"'
+
+        bs, nc = keypoint.shape[:2]
+        score_sum, num_clips = None, keypoint.new_zeros(bs)
+        active = torch.arange(bs, device=keypoint.device)
+        for start in range(0, nc, clips_per_round):
+            clips = keypoint[active, start:start + clips_per_round]
+            na, nr = clips.shape[:2]
+            mask = None
+            if person_mask is not None:
+                mask = person_mask[active, start:start + clips_per_round].flatten(0, 1)
+            cls_score = torch.cat(self.forward_clips(clips.flatten(0, 1), mask)).reshape(na, nr, -1)
+            if average_clips == 'prob':
+                cls_score = cls_score.softmax(dim=-1)
+            if score_sum is None:
+                score_sum = cls_score.new_zeros(bs, cls_score.shape[-1])
+            score_sum[active] += cls_score.sum(dim=1)
+            num_clips[active] += nr
+
+            prob = score_sum[active] / num_clips[active, None]
+            if average_clips == 'score':
+                prob = prob.softmax(dim=-1)
+            done = torch.zeros_like(active, dtype=torch.bool)
+            if margin is not None:
+                top2 = prob.topk(2, dim=-1)[0]
+                done |= top2[:, 0] - top2[:, 1] >= margin
+            if max_entropy is not None:
+                done |= -(prob * prob.clamp(min=1e-12).log()).sum(dim=-1) <= max_entropy
+            active = active[~done]
+            if len(active) == 0:
+                break
+
+        self.adaptive_stats['samples'] += bs
+        self.adaptive_stats['clips'] += int(num_clips.sum())
+        self.adaptive_stats['max_clips'] += bs * nc
+        return (score_sum / num_clips[:, None]).cpu().numpy()
+
+    def forward_export(self, keypoint):
+        """The tensor-only test path used for TorchScript / ONNX export.
+
+        Same scores as ``forward_test`` with ``average_clips`` in ('score',
+        'prob'), but it stays on tensors and reads no shape as a Python
+        number, so the batch and clip dimensions stay dynamic in the traced
+        graph.
+
+        Args:
+            keypoint (torch.Tensor): Input of shape (N, num_clips, M, T, V, C).
+
+        Returns:
+            torch.Tensor: Clip-averaged class scores of shape (N, num_classes).
+        """
+        assert self.with_cls_head
+        x, _ = self.extract_feat(keypoint.flatten(0, 1))
+        cls_score = self.cls_head(x).float()
+        cls_score = cls_score.reshape(keypoint.shape[0], keypoint.shape[1], cls_score.shape[-1])
+        if self.test_cfg.get('average_clips', 'prob') is None:
+            raise ValueError('forward_export needs average_clips to be "score" or "prob".')
+        return self.average_clip(cls_score)
+
     def forward(self, keypoint, label=None, return_loss=True, **kwargs):
         """Define the computation performed at every call."""
         if return_loss:
@@ -81,8 +272,11 @@ class RecognizerGCN(BaseRecognizer):
                 raise ValueError('Label should not be None.')
             return self.forward_train(keypoint, label, **kwargs)
 
-        return self.forward_test(keypoint, **kwargs)
+        with self.amp_context():
+            return self.forward_test(keypoint, **kwargs)
 
-    def extract_feat(self, keypoint):
+    def extract_feat(self, keypoint, person_mask=None):
 
-        return self.backbone(keypoint)
+        if person_mask is None:
+            return self.backbone(keypoint)
+        return self.backbone(keypoint, person_mask)
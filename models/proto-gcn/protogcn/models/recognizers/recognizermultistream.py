@@ -0,0 +1,99 @@
+import copy as cp
+import torch.nn as nn
+
+from ..builder import RECOGNIZERS
+from .base import BaseRecognizer
+from .recognizergcn import RecognizerGCN
+
+
+@RECOGNIZERS.register_module()
+class RecognizerMultiStream(BaseRecognizer):
+    """Several skeleton modalities (streams) trained together in one recognizer.
+
+    The pipeline decodes and augments every clip once and generates all the modalities with
+    ``GenSkeFeat(feats=input_feats)`` (the modalities of ``feats``, without repeats), which concatenates them on the
+    channel axis. Every stream is a RecognizerGCN with its own ProtoGCN backbone and head, reading the channels of its
+    modality. The training losses of all the streams are summed (the log variables are prefixed by the stream name),
+    and testing returns, for every sample, a dict of the fused score ('fusion', the weighted sum of the stream
+    scores, as ``protogcn.smp.comb``) followed by the score of every stream, so that validation reports
+    ``fusion_top1_acc`` as well as ``{name}_top1_acc``.
+
+    Args:
+        backbone (dict | list[dict]): The backbone of every stream, or a list of one per stream.
+        cls_head (dict | list[dict]): The head of every stream, or a list of one per stream.
+        feats (list[str]): The modality of every stream. Default: ['j', 'b', 'k', 'jm', 'bm', 'km'].
+        fusion_weights (list[float] | None): The fusion weight of every stream, None means 1 for all. Default: None.
+        train_cfg (dict): Config for training. Default: {}.
+        test_cfg (dict): Config for testing, shared by the streams. Default: {}.
+        names (list[str] | None): The name of every stream, None means its modality. Default: None.
+    """
+
+    def __init__(self,
+                 backbone,
+                 cls_head,
+                 feats=['j', 'b', 'k', 'jm', 'bm', 'km'],
+                 fusion_weights=None,
+                 train_cfg=dict(),
+                 test_cfg=dict(),
+                 names=None):
+        super().__init__(None, None, train_cfg, test_cfg)
+        self.feats = list(feats)
+        self.input_feats = list(dict.fromkeys(self.feats))
+        self.names = list(names) if names is not None else self.feats
+        assert len(set(self.names)) == len(self.names) and 'fusion' not in self.names, \
+            f'The stream names should be unique, got {self.names}'
+        if fusion_weights is None:
+            fusion_weights = [1.] * len(self.feats)
+        assert len(fusion_weights) == len(self.feats)
+        self.fusion_weights = list(fusion_weights)
+        backbones = backbone if isinstance(backbone, (list, tuple)) else [backbone] * len(self.feats)
+        cls_heads = cls_head if isinstance(cls_head, (list, tuple)) else [cls_head] * len(self.feats)
+        assert len(backbones) == len(cls_heads) == len(self.feats)
+        self.streams = nn.ModuleList([
+            RecognizerGCN(cp.deepcopy(b), cp.deepcopy(h), cp.deepcopy(train_cfg), cp.deepcopy(test_cfg))
+            for b, h in zip(backbones, cls_heads)
+        ])
+
+    def init_weights(self):
+        """Initialize the model network weights."""
+        for stream in getattr(self, 'streams', []):
+            stream.init_weights()
+
+    def split(self, keypoint):
+        """Split the merged input of shape (..., C * len(input_feats)) into the inputs of the streams."""
+        num_channels = keypoint.shape[-1] // len(self.input_feats)
+        inputs = dict()
+        for i, feat in enumerate(self.input_feats):
+            inputs[feat] = keypoint[..., i * num_channels:(i + 1) * num_channels].contiguous()
+        return [inputs[feat] for feat in self.feats]
+
+    def forward_train(self, keypoint, label, **kwargs):
+        """Defines the computation performed at every call when training."""
+        losses = dict()
+        for name, stream, x in zip(self.names, self.streams, self.split(keypoint)):
+            loss = stream.forward_train(x, label, **kwargs)
+            losses.update({f'{name}_{k}': v for k, v in loss.items()})
+        return losses
+
+    def forward_test(self, keypoint, **kwargs):
+        """Defines the computation performed at every call when evaluation and testing.
+
+        Returns:
+            list[dict]: For every sample, the fused score and the score of every stream.
+        """
+        scores = [stream.forward_test(x, **kwargs) for stream, x in zip(self.streams, self.split(keypoint))]
+        fused = sum(w * s for w, s in zip(self.fusion_weights, scores))
+        return [
+            dict(fusion=fused[i], **{name: score[i] for name, score in zip(self.names, scores)})
+            for i in range(len(fused))
+        ]
+
+    def forward(self, keypoint, label=None, return_loss=True, **kwargs):
+        """Define the computation performed at every call."""
+        if return_loss:
+            if label is None:
+                raise ValueError('Label should not be None.')
+            return self.forward_train(keypoint, label, **kwargs)
+
+        with self.amp_context():
+            return self.forward_test(keypoint, **kwargs)
@@ -69,15 +69,12 @@ def ljson(pth):
     return json.load(open(pth, 'r'))
 
 def intop(pred, label, n):
-    pred = [np.argsort(x)[-n:] for x in pred]
-    hit = [(l in p) for l, p in zip(label, pred)]
-    return hit
+    from protogcn.core.fusion import topk_hits
+    return topk_hits(np.asarray(pred), label, n).tolist()
 
 def comb(scores, coeffs):
-    ret = [x * coeffs[0] for x in scores[0]]
-    for i in range(1, len(scores)):
-        ret = [x + y for x, y in zip(ret, [x * coeffs[i] for x in scores[i]])]
-    return ret
+    from protogcn.core.fusion import fuse_scores, stack_scores
+    return list(fuse_scores(stack_scores(scores), coeffs))
 
 def auto_mix2(scores):
     assert len(scores) == 2
@@ -106,12 +103,11 @@ def load_label(ann, split=None):
         raise NotImplemented
 
 def mean_acc(pred, label, with_class_acc=False):
-    hits = defaultdict(list)
-    for p, g in zip(pred, label):
-        hits[g].append(np.argmax(p) == g)
-    keys = list(hits.keys())
-    keys.sort()
-    class_acc = [np.mean(hits[k]) for k in keys]
+    from protogcn.core.fusion import argmax_hits
+    label = np.asarray(label)
+    hits = argmax_hits(np.asarray(pred), label)
+    counts = np.bincount(label)
+    class_acc = list(np.bincount(label, weights=hits)[counts > 0] / counts[counts > 0])
     return (np.mean(class_acc), class_acc) if with_class_acc else np.mean(class_acc)
 
 def match_dict(s, d):
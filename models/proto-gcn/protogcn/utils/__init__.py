@@ -1,3 +1,5 @@
 from .collect_env import *  
+from .device import *  
 from .graph import *  
 from .misc import *  
+from .proc import *
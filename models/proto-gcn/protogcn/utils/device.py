@@ -0,0 +1,84 @@
+import os
+import torch
+import torch.distributed as dist
+from mmcv.runner import init_dist as mmcv_init_dist
+
+__all__ = ['get_device', 'init_dist', 'setup_cpu_threads']
+
+
+def get_device(device=None):
+    """Get the device to run on.
+
+    Args:
+        device (str | None): 'cuda' or 'cpu'. None means 'cuda' if it is
+            available, otherwise 'cpu'. Default: None.
+
+    Returns:
+        str: The device type.
+    """
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    assert device in ['cuda', 'cpu'], f'Unsupported device: {device}'
+    return device
+
+
+def init_dist(launcher, backend='nccl', **kwargs):
+    """Initialize the distributed environment, on GPU or on CPU.
+
+    NCCL jobs go through ``mmcv.runner.init_dist``, which binds every rank to
+    a cuda device. For other backends (gloo on CPU), the process group is
+    initialized directly from the environment set by the launcher, or as a
+    single process group if the script is started without a launcher.
+
+    Args:
+        launcher (str): The job launcher, 'pytorch' or 'slurm'.
+        backend (str): The backend of the process group. Default: 'nccl'.
+        **kwargs: Keyword arguments for ``init_process_group``.
+    """
+    if backend == 'nccl':
+        mmcv_init_dist(launcher, backend=backend, **kwargs)
+        return
+
+    assert launcher == 'pytorch', f'Launcher {launcher} is not supported with backend {backend}'
+    if 'RANK' not in os.environ:
+        os.environ['RANK'] = '0'
+        os.environ['WORLD_SIZE'] = '1'
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', str(kwargs.pop('port', 29500)))
+    dist.init_process_group(backend=backend, **kwargs)
+
+
+def setup_cpu_threads(num_workers=0, num_threads=None):
+    """Split the CPU cores of the node between the local ranks.
+
+    Every rank is pinned to its own slice of the available cores (the
+    DataLoader workers it spawns inherit the affinity), and its intra-op
+    thread pool is sized to the cores left after its ``num_workers`` workers,
+    so that N ranks x M workers do not oversubscribe the node.
+
+    Args:
+        num_workers (int): Number of DataLoader workers of each rank.
+            Default: 0.
+        num_threads (int | None): Number of intra-op threads of each rank.
+            None means the cores of the rank minus ``num_workers``, at least
+            1. Default: None.
+
+    Returns:
+        int: The number of intra-op threads of this rank.
+    """
+    local_rank = max(int(os.environ.get('LOCAL_RANK', 0)), 0)
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', os.environ.get('WORLD_SIZE', 1)))
+
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count()))
+    per_rank = max(len(cores) // local_world_size, 1)
+    rank_cores = cores[local_rank * per_rank:(local_rank + 1) * per_rank] or cores
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, rank_cores)
+
+    if num_threads is None:
+        num_threads = max(len(rank_cores) - num_workers, 1)
+    torch.set_num_threads(num_threads)
+    return num_threads
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+
+__all__ = ['process_tree', 'dataloader_workers', 'process_memory', 'process_cpu_time', 'process_read_bytes']
+
+
+def process_tree(pid=None):
+    """The pids of a process and of all its descendants, read from ``/proc`` (Linux only).
+
+    Args:
+        pid (int | None): The root process, None means the current one. Default: None.
+
+    Returns:
+        list[int]: The pids, the root first.
+    """
+    pid = os.getpid() if pid is None else pid
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                stat = f.read()
+        except OSError:  # the process exited
+            continue
+        # the command name is in parentheses and may contain spaces
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(name))
+    pids, queue = [], [pid]
+    while queue:
+        p = queue.pop(0)
+        pids.append(p)
+        queue.extend(children.get(p, []))
+    return pids
+
+
+def dataloader_workers():
+    """The pids of the DataLoader workers of the current process.
+
+    Unlike ``process_tree``, the other children, such as the multiprocessing resource tracker (not a multiprocessing
+    child) or the evaluator of ``AsyncEvalHook`` (not daemonic), are left out: the workers are the daemonic
+    multiprocessing children, as started by the DataLoader.
+
+    Returns:
+        list[int]: The pids.
+    """
+    return [p.pid for p in multiprocessing.active_children() if p.daemon]
+
+
+def process_memory(pids, pss=True):
+    """The RSS and the PSS of processes, in bytes, summed over the processes.
+
+    The PSS (proportional set size) splits the pages shared by several processes, such as the dataset inherited by
+    forked DataLoader workers, between them: unlike the RSS, the PSS of a process tree is the memory it takes. It is
+    read from ``/proc/{pid}/smaps_rollup`` (Linux >= 4.14), the processes it cannot be read for count 0. The kernel
+    walks the pages of the process for it, which takes ~10 ms per GB: the RSS alone (``statm``) takes microseconds.
+
+    Args:
+        pids (list[int]): The processes.
+        pss (bool): Whether to read the PSS, 0 otherwise. Default: True.
+
+    Returns:
+        tuple[int]: The RSS and the PSS.
+    """
+    total_rss = total_pss = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total_rss += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            if not pss:
+                continue
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        total_pss += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total_rss, total_pss
+
+
+def process_cpu_time(pids):
+    """The CPU time (user and system) of processes, in seconds, summed over the processes.
+
+    Args:
+        pids (list[int]): The processes.
+
+    Returns:
+        float: The CPU time.
+    """
+    ticks = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rindex(')') + 2:].split()
+        ticks += int(fields[11]) + int(fields[12])
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+def process_read_bytes(pids):
+    """The bytes read from the storage by processes, summed over the processes.
+
+    Read from ``/proc/{pid}/io``: the reads served by the page cache do not count, and the processes it cannot be read
+    for (another user, a kernel without task I/O accounting) count 0.
+
+    Args:
+        pids (list[int]): The processes.
+
+    Returns:
+        int: The bytes read.
+    """
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/io') as f:
+                for line in f:
+                    if line.startswith('read_bytes:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
@@ -0,0 +1,24 @@
+import os
+import socket
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank, world_size, port, fn, args):
+    os.environ.update(MASTER_ADDR='127.0.0.1', MASTER_PORT=str(port))
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    try:
+        fn(rank, world_size, *args)
+    finally:
+        dist.destroy_process_group()
+
+
+def run_distributed(fn, world_size=2, *args):
+    """Run ``fn(rank, world_size, *args)`` in ``world_size`` processes of a gloo group, ``fn`` a module function."""
+    mp.spawn(_worker, args=(world_size, _free_port(), fn, args), nprocs=world_size)
@@ -0,0 +1,43 @@
+import numpy as np
+import pickle
+
+from protogcn.core import collect_results_gpu
+from dist_utils import run_distributed
+
+
+def _sample(i):
+    return dict(score=np.full(3, i, dtype=np.float32), label=np.int64(i % 5))
+
+
+def _collect(rank, world_size, out, size, layout):
+    if layout == 'strided':
+        # the DistributedSampler pads the last round with the first samples
+        indices = [(rank + i * world_size) % size for i in range(-(-size // world_size))]
+    elif layout == 'uneven':
+        # every sample on rank 1, none on rank 0
+        indices = list(range(size)) if rank == 1 else []
+    results = collect_results_gpu([_sample(i) for i in indices], size, indices=indices, chunk_size=2)
+    if rank == 0:
+        with open(out, 'wb') as f:
+            pickle.dump(results, f)
+    else:
+        assert results is None
+
+
+def _check(tmp_path, size, layout):
+    out = str(tmp_path / 'results.pkl')
+    run_distributed(_collect, 2, out, size, layout)
+    with open(out, 'rb') as f:
+        results = pickle.load(f)
+    assert len(results) == size
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result['score'], _sample(i)['score'])
+        assert result['label'] == _sample(i)['label']
+
+
+def test_collect_padded(tmp_path):
+    _check(tmp_path, 7, 'strided')
+
+
+def test_collect_empty_rank0(tmp_path):
+    _check(tmp_path, 5, 'uneven')
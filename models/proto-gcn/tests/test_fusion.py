@@ -0,0 +1,60 @@
+import itertools
+import numpy as np
+import pytest
+
+from protogcn.core import evaluate_weights, fuse_scores, search_fusion_weights, topk_hits
+
+GRID = (0., 0.5, 1., 2.)
+
+
+def _argsort_hits(scores, labels, k):
+    # the former protogcn.smp.intop: the label is among the last k of np.argsort
+    return np.array([label in np.argsort(score)[-k:] for score, label in zip(scores, labels)])
+
+
+def _top1(scores, labels, weights):
+    fused = sum(w * s for w, s in zip(weights, scores.astype(np.float64)))
+    return _argsort_hits(fused, labels, 1).mean()
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 8, 200)
+    # 3 models whose scores round to a few levels, so that the labels often tie with other classes
+    scores = rng.integers(0, 4, (3, 200, 8)).astype(np.float32)
+    scores[np.arange(3)[:, None], np.arange(200), labels] += rng.integers(0, 3, (3, 200))
+    return scores, labels
+
+
+@pytest.mark.parametrize('k', [1, 2, 5])
+def test_topk_hits_ties(data, k):
+    scores, labels = data
+    for model_scores in scores:
+        np.testing.assert_array_equal(topk_hits(model_scores, labels, k), _argsort_hits(model_scores, labels, k))
+    # with the leading axis of several weightings
+    np.testing.assert_array_equal(
+        topk_hits(scores, labels, k), np.stack([_argsort_hits(s, labels, k) for s in scores]))
+
+
+def test_evaluate_weights(data):
+    scores, labels = data
+    weights = np.array([w for w in itertools.product(GRID, repeat=3) if any(w)])
+    expected = [_top1(scores, labels, w) for w in weights]
+    np.testing.assert_allclose(evaluate_weights(scores, labels, weights), expected)
+    # in small batches over a thread pool
+    np.testing.assert_allclose(evaluate_weights(scores, labels, weights, batch_size=5, num_workers=2), expected)
+    np.testing.assert_allclose(fuse_scores(scores, weights[0]), sum(w * s for w, s in zip(weights[0], scores)))
+
+
+def test_search_fusion_weights(data):
+    scores, labels = data
+    brute_force = max(_top1(scores, labels, w) for w in itertools.product(GRID, repeat=3) if any(w))
+
+    weights, top1 = search_fusion_weights(scores, labels, method='grid', grid=GRID)
+    assert top1 == pytest.approx(brute_force)
+    assert _top1(scores, labels, weights) == pytest.approx(top1)
+
+    weights, top1 = search_fusion_weights(scores, labels, method='coordinate', grid=GRID)
+    assert _top1(scores, labels, weights) == pytest.approx(top1)
+    assert _top1(scores, labels, np.ones(3)) <= top1 <= brute_force + 1e-12
@@ -0,0 +1,70 @@
+import os.path as osp
+import pytest
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from mmcv.runner import DistSamplerSeedHook, EpochBasedRunner
+from mmcv.utils import get_logger
+
+from protogcn.core import IterCheckpointHook
+from protogcn.datasets import build_dataloader
+
+NUM_EPOCHS = 2
+
+
+class _Dataset(torch.utils.data.Dataset):
+
+    def __len__(self):
+        return 20
+
+    def __getitem__(self, i):
+        # a random augmentation, drawn in the main process without workers
+        return dict(x=torch.full((4, ), float(i)) + torch.rand(4), y=torch.tensor(i % 2))
+
+
+class _Model(nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.fc = nn.Linear(4, 2)
+
+    def train_step(self, data_batch, optimizer, **kwargs):
+        loss = F.cross_entropy(self.fc(F.dropout(data_batch['x'], 0.5)), data_batch['y'])
+        return dict(loss=loss, log_vars=dict(loss=loss.item()), num_samples=len(data_batch['y']))
+
+
+def _train(work_dir, infinite_sampler, resume_from=None):
+    torch.manual_seed(0)
+    model = _Model()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+    # as train_model builds it with an iter_checkpoint_config
+    data_loader = build_dataloader(
+        _Dataset(), 4, 0, seed=0, pin_memory=False, infinite_sampler=infinite_sampler, epoch_seed=True)
+    runner = EpochBasedRunner(
+        model,
+        optimizer=optimizer,
+        work_dir=work_dir,
+        logger=get_logger('test_iter_checkpoint'),
+        meta=dict(),
+        max_epochs=NUM_EPOCHS)
+    runner.register_training_hooks(None, dict(grad_clip=None))
+    runner.register_hook(DistSamplerSeedHook())
+    runner.register_hook(IterCheckpointHook(interval=3, max_keep_ckpts=10), priority='ABOVE_NORMAL')
+    if resume_from is not None:
+        runner.resume(resume_from, map_location='cpu')
+    runner.run([data_loader], [('train', 1)])
+    assert runner.iter == NUM_EPOCHS * 5
+    return model.state_dict()
+
+
+@pytest.mark.parametrize('infinite_sampler', [False, True])
+def test_resume_round_trip(tmp_path, infinite_sampler):
+    work_dir = str(tmp_path)
+    expected = _train(work_dir, infinite_sampler)
+    # iter_3 is in the middle of the first epoch, iter_6 in the middle of the second one, iter_5 and iter_10 end the
+    # epochs and are skipped
+    assert not osp.exists(osp.join(work_dir, 'iter_5.pth'))
+    for step in [3, 6]:
+        resumed = _train(str(tmp_path / f'resume_{step}'), infinite_sampler, osp.join(work_dir, f'iter_{step}.pth'))
+        for name, param in expected.items():
+            torch.testing.assert_close(resumed[name], param, rtol=0, atol=0)
@@ -0,0 +1,67 @@
+import pytest
+import torch
+import torch.distributed as dist
+from mmcv.runner import LogBuffer
+
+from protogcn.models.recognizers.base import BaseRecognizer
+from dist_utils import run_distributed
+
+
+class _Recognizer(BaseRecognizer):
+
+    def __init__(self):
+        super().__init__(backbone=None)
+        self.weight = torch.nn.Parameter(torch.ones(()))
+
+    def forward_train(self, imgs, label, **kwargs):
+        # a per-sample loss and accuracy, averaged over the batch by ``_parse_losses``
+        return dict(loss_cls=self.weight * imgs, top1_acc=(label == 0).float())
+
+    def forward_test(self, imgs, **kwargs):
+        return imgs
+
+
+def _batch(values, labels):
+    return dict(imgs=torch.tensor(values, dtype=torch.float32), label=torch.tensor(labels))
+
+
+BATCHES = [_batch([1., 2., 3., 6.], [0, 0, 1, 1]), _batch([10.], [0]), _batch([4., 5., 6.], [1, 1, 1])]
+
+
+def test_flush_log_vars_sample_weighting():
+    model = _Recognizer()
+    # the averages of the mmcv logger over the interval, weighted by the batch sizes
+    log_buffer = LogBuffer()
+    for batch in BATCHES:
+        outputs = model.train_step(batch, None)
+        log_buffer.update(outputs['log_vars'], outputs['num_samples'])
+    log_buffer.average(len(BATCHES))
+
+    model.defer_log_vars = True
+    for batch in BATCHES:
+        assert 'log_vars' not in model.train_step(batch, None)
+    log_vars, num_samples = model.flush_log_vars()
+    assert num_samples == 8
+    assert log_vars == pytest.approx(log_buffer.output)
+    assert log_vars['loss_cls'] == pytest.approx(37 / 8)
+    assert log_vars['top1_acc'] == pytest.approx(3 / 8)
+    # the buffer starts over after a flush
+    assert model.flush_log_vars() == ({}, 0)
+
+
+def _flush(rank, world_size):
+    model = _Recognizer()
+    model.defer_log_vars = True
+    # rank 0 sees 5 samples, rank 1 the other 3
+    for batch in BATCHES[:2] if rank == 0 else BATCHES[2:]:
+        model.train_step(batch, None)
+    log_vars, num_samples = model.flush_log_vars()
+    assert num_samples == (5 if rank == 0 else 3)
+    # the average over all the samples, not the average of the rank averages
+    assert log_vars['loss_cls'] == pytest.approx(37 / 8)
+    assert log_vars['top1_acc'] == pytest.approx(3 / 8)
+    dist.barrier()
+
+
+def test_flush_log_vars_distributed():
+    run_distributed(_flush, 2)
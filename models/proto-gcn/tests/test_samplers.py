@@ -0,0 +1,59 @@
+import itertools
+import pytest
+
+from protogcn.datasets.samplers import ClassSpecificDistributedSampler, DistributedSampler, InfiniteBatchSampler
+
+NUM_SAMPLES, WORLD_SIZE = 23, 2
+
+
+class _Dataset:
+
+    video_infos = [dict(label=i % 3) for i in range(NUM_SAMPLES)]
+
+    def __len__(self):
+        return NUM_SAMPLES
+
+
+def _samplers(rank):
+    return [
+        DistributedSampler(_Dataset(), WORLD_SIZE, rank, seed=3),
+        ClassSpecificDistributedSampler(_Dataset(), WORLD_SIZE, rank, class_prob=[1, 1.5, 0.5], seed=3)
+    ]
+
+
+@pytest.mark.parametrize('rank', range(WORLD_SIZE))
+@pytest.mark.parametrize('start', [0, 5, 11])
+def test_set_start(rank, start):
+    for sampler in _samplers(rank):
+        sampler.set_epoch(1)
+        epoch = list(sampler)
+        sampler.set_epoch(2)
+        next_epoch = list(sampler)
+
+        sampler.set_epoch(1)
+        sampler.set_start(start)
+        assert list(sampler) == epoch[start:]
+        # only the resumed epoch is cut
+        sampler.set_epoch(2)
+        assert list(sampler) == next_epoch
+
+
+@pytest.mark.parametrize('rank', range(WORLD_SIZE))
+@pytest.mark.parametrize('drop_last', [False, True])
+def test_infinite_batch_sampler_resume(rank, drop_last):
+    batches = InfiniteBatchSampler(DistributedSampler(_Dataset(), WORLD_SIZE, rank, seed=3), 4, drop_last)
+    num_batches = len(batches)
+    expected = list(itertools.islice(batches, 3 * num_batches))
+    for epoch in range(3):
+        # the batches of an epoch are those of the sampler epoch
+        epoch_indices = DistributedSampler(_Dataset(), WORLD_SIZE, rank, seed=3)
+        epoch_indices.set_epoch(epoch)
+        epoch_indices = list(epoch_indices)
+        assert sum(expected[epoch * num_batches:(epoch + 1) * num_batches], []) == \
+            epoch_indices[:num_batches * 4 if drop_last else None]
+
+    # resume in the middle of epoch 1 and at the start of epoch 2: the tail of the epoch then full epochs
+    for done in [num_batches + 2, 2 * num_batches]:
+        resumed = InfiniteBatchSampler(DistributedSampler(_Dataset(), WORLD_SIZE, rank, seed=3), 4, drop_last)
+        resumed.resume(done)
+        assert list(itertools.islice(resumed, 3 * num_batches - done)) == expected[done:]
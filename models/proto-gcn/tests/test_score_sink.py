@@ -0,0 +1,33 @@
+import numpy as np
+import os
+import torch.distributed as dist
+
+from protogcn.core import ScoreSink, collect_results_gpu
+from dist_utils import run_distributed
+
+NUM_SAMPLES, NUM_CLASSES = 1003, 60
+
+
+def _stream(rank, world_size, filename):
+    rng = np.random.default_rng(rank)
+    labels = np.arange(NUM_SAMPLES) % NUM_CLASSES
+    sink = ScoreSink(filename, labels, NUM_CLASSES)
+    # the strided ids of DistributedSampler, in batches of 16
+    indices = np.arange(rank, NUM_SAMPLES, world_size)
+    scores = rng.random((len(indices), NUM_CLASSES), dtype=np.float32)
+    for start in range(0, len(indices), 16):
+        sink.update(indices[start:start + 16], scores[start:start + 16])
+    eval_results = sink.evaluate()
+
+    gathered = collect_results_gpu(list(scores), NUM_SAMPLES, indices=indices)
+    if rank == 0:
+        gathered = np.stack(gathered)
+        written = np.load(filename, mmap_mode='r')
+        np.testing.assert_array_equal(written, gathered)
+        assert eval_results['top1_acc'] == np.mean(gathered.argmax(1) == labels)
+        assert not [name for name in os.listdir(os.path.dirname(filename)) if name.endswith('.part')]
+    dist.barrier()
+
+
+def test_score_sink(tmp_path):
+    run_distributed(_stream, 2, str(tmp_path / 'scores.npy'))
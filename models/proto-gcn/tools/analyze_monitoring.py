@@ -0,0 +1,431 @@
+import argparse
+import glob
+import json
+import math
+import os
+import os.path as osp
+import re
+from collections import defaultdict
+from datetime import datetime
+
+"""
+Compare the resource usage and the speed of training experiments.
+
+    python tools/analyze_monitoring.py monitoring_logs work_dirs --json analysis.json --timeline timeline.csv
+
+The experiments are discovered under the given paths (default: the current directory):
+
+- in every ``monitoring_logs`` directory, from the logs of the monitoring scripts, named ``{kind}_{experiment}``:
+  ``gpu_*.csv`` (``nvidia-smi --format=csv``), ``system_*.log`` (``top -b`` filtered on the Cpu and python lines),
+  ``system_mem_*.log`` (``free -m``), ``process_*.log`` (``ps aux`` or ``ps -eo pid,ppid,%cpu,%mem,rss,vsz,cmd``) and
+  ``training_*.log`` (the text log of tools/train.py);
+- in every work_dir with a ``resources`` directory of Parquet files (``ResourceMonitorHook``), named after the
+  work_dir, with the latest text log of the work_dir.
+
+Every file is read once, in chunks (progress bars without newlines included), and only running sums, maxima, fixed
+histograms (for the percentiles of the percentages) and fixed-width timeline buckets are kept: the memory does not
+grow with the logs. The sources are put on the clock of the training log, and the usage is only counted during the
+training (from the start of the workflow to the last iteration). The ``top`` samples have no time: they are placed
+1 s apart (``top -d 1``) from the first GPU sample, or from the first line of the training log.
+
+Reported per experiment: the training iterations per second (within the epochs, without the evaluations) and the
+samples per second of a rank (with ``videos_per_gpu`` of the logged config), the data stall ratio (the share of the
+iteration time waiting for the DataLoader, ``data_time / time`` weighted by the iterations), the mean and p95 GPU and
+host CPU utilization, the mean iowait and the peak GPU memory (``nvidia-smi`` and torch), training process memory
+(RSS summed over the python processes, and PSS with the Parquet files, per rank) and host memory used.
+"""
+
+PREFIXES = ('system_mem', 'training', 'process', 'system', 'gpu')
+LOG_TIME = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - ')
+TRAIN_LINE = re.compile(r'(?:Epoch \[(\d+)\]\[(\d+)/\d+\]|Iter \[(\d+)/\d+\])\s(.*)')
+FIELD = re.compile(r'(\w+): (-?\d+(?:\.\d+)?(?:e[-+]?\d+)?)\b')
+TOP_CPU = re.compile(r'^%Cpu(?:\(s\))?:(.*)')
+STAMP = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})')
+RESOURCES = re.compile(r'rank\d+-\d+\.parquet$')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare the resource usage and the speed of training experiments')
+    parser.add_argument('paths', nargs='*', default=['.'], help='directories to discover the experiments in')
+    parser.add_argument('--experiments', nargs='+', default=None, help='only these experiments')
+    parser.add_argument('--json', default=None, help='write the metrics as json to this file, - for stdout')
+    parser.add_argument('--timeline', default=None, help='write the aligned timeline as csv to this file')
+    parser.add_argument('--bucket', type=float, default=60, help='seconds of a timeline bucket')
+    return parser.parse_args()
+
+
+def iter_lines(path, chunk_size=1 << 20, max_len=1 << 16):
+    """Yield the lines of a text file, split on '\\n' and '\\r', each cut to ``max_len`` characters."""
+    with open(path, 'r', errors='replace', newline='') as f:
+        rest = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = re.split('[\r\n]', rest + chunk)
+            rest = lines.pop()
+            if len(rest) > max_len:
+                rest = rest[:max_len]
+            yield from (line[:max_len] for line in lines)
+        if rest:
+            yield rest
+
+
+def to_seconds(stamp, fmt='%Y-%m-%d %H:%M:%S'):
+    return datetime.strptime(stamp, fmt).timestamp()
+
+
+def to_mib(value):
+    """A top memory value (KiB, or with a m / g / t suffix) in MiB."""
+    scale = dict(m=1, g=2**10, t=2**20)
+    if value[-1] in scale:
+        return float(value[:-1]) * scale[value[-1]]
+    return float(value) / 1024
+
+
+class Stat:
+    """Count, mean and maximum of a stream, and percentiles if ``percent`` (a 0.1 histogram on 0 - 100)."""
+
+    def __init__(self, percent=False):
+        self.count = 0
+        self.total = 0.
+        self.max = None
+        self.hist = [0] * 1001 if percent else None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = value if self.max is None else max(self.max, value)
+        if self.hist is not None:
+            self.hist[min(max(int(round(value * 10)), 0), 1000)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, q):
+        if not self.count or self.hist is None:
+            return None
+        # the nearest rank
+        rank, seen = max(math.ceil(q / 100 * self.count), 1), 0
+        for i, n in enumerate(self.hist):
+            seen += n
+            if seen >= rank:
+                return i / 10
+
+
+PERCENT = ('gpu_util', 'cpu_util', 'iowait')
+
+
+class Experiment:
+    """The streamed metrics of an experiment, on the training window and the timeline buckets."""
+
+    def __init__(self, name, bucket):
+        self.name = name
+        self.bucket = bucket
+        self.files = dict()
+        self.resources = []
+        self.stats = defaultdict(lambda: None)
+        self.timeline = defaultdict(lambda: defaultdict(lambda: [0., 0, None]))
+        self.start = self.end = None
+        self.first_log = self.first_gpu = None
+        self.batch_size = None
+        self.iters = self.train_time = 0.
+        self.weighted_time = self.weighted_data_time = 0.
+
+    def add(self, name, t, value, check=True):
+        if check and self.end is not None and not self.start <= t <= self.end:
+            return
+        if self.stats[name] is None:
+            self.stats[name] = Stat(name in PERCENT)
+        self.stats[name].add(value)
+        if self.start is not None:
+            slot = self.timeline[int((t - self.start) // self.bucket)][name]
+            slot[0] += value
+            slot[1] += 1
+            slot[2] = value if slot[2] is None else max(slot[2], value)
+
+    def read_training(self, path):
+        last = None
+        for line in iter_lines(path):
+            if self.batch_size is None:
+                match = re.search(r'videos_per_gpu=(\d+)', line)
+                if match:
+                    self.batch_size = int(match.group(1))
+            match = LOG_TIME.match(line)
+            if not match:
+                continue
+            t = to_seconds(match.group(1)) + int(match.group(2)) / 1000
+            if self.start is None and 'workflow:' in line:
+                self.start = t
+            match = TRAIN_LINE.search(line)
+            if not match:
+                continue
+            epoch, it, fields = int(match.group(1) or 0), int(match.group(2) or match.group(3)), match.group(4)
+            fields = {k: float(v) for k, v in FIELD.findall(fields)}
+            if self.start is None:
+                self.start = t - fields.get('time', 0) * it
+            # the logged times are the means over the iterations since the previous line of the epoch
+            previous_it = last[2] if last is not None and last[1] == epoch and last[2] < it else 0
+            n = it - previous_it
+            if previous_it:
+                self.iters += n
+                self.train_time += t - last[0]
+                self.add('iters_per_s', t, n / max(t - last[0], 1e-9), check=False)
+            if 'time' in fields:
+                self.weighted_time += n * fields['time']
+                self.weighted_data_time += n * fields.get('data_time', 0)
+            if 'memory' in fields:
+                self.add('torch_mem_mib', t, fields['memory'], check=False)
+            last = (t, epoch, it)
+            self.end = t
+
+    def read_gpu(self, path):
+        columns = None
+        for line in iter_lines(path):
+            parts = [p.strip() for p in line.split(',')]
+            if columns is None:
+                columns = {name.split(' ')[0]: i for i, name in enumerate(parts)}
+                continue
+            try:
+                t = to_seconds(parts[columns['timestamp']], '%Y/%m/%d %H:%M:%S.%f')
+                util = float(parts[columns['utilization.gpu']].split()[0])
+                used = float(parts[columns['memory.used']].split()[0])
+            except (KeyError, IndexError, ValueError):
+                continue
+            if self.first_gpu is None:
+                self.first_gpu = t
+            self.add('gpu_util', t, util)
+            self.add('gpu_mem_mib', t, used)
+
+    def read_top(self, path):
+        t0 = self.first_gpu or self.first_log
+        sample, rss = -1, None
+
+        def flush():
+            if rss is not None:
+                self.add('proc_rss_mib', t0 + sample, rss)
+
+        for line in iter_lines(path):
+            match = TOP_CPU.match(line)
+            if match:
+                flush()
+                sample += 1
+                rss = None
+                values = {k: float(v) for v, k in re.findall(r'([\d.]+)\s*(\w+)', match.group(1))}
+                if 'id' in values:
+                    self.add('cpu_util', t0 + sample, 100 - values['id'] - values.get('wa', 0))
+                    self.add('iowait', t0 + sample, values.get('wa', 0))
+                continue
+            parts = line.split()
+            # PID USER PR NI VIRT RES SHR S %CPU %MEM TIME+ COMMAND
+            if sample >= 0 and len(parts) >= 12 and parts[0].isdigit() and 'python' in parts[11]:
+                try:
+                    rss = (rss or 0) + to_mib(parts[5])
+                except ValueError:
+                    continue
+        flush()
+
+    def read_free(self, path):
+        t = None
+        for line in iter_lines(path):
+            match = STAMP.search(line)
+            if match:
+                t = to_seconds(match.group(1))
+                continue
+            parts = line.split()
+            # the memory row: a label (localized) and total used free shared buff/cache available
+            if t is not None and len(parts) == 7 and all(p.isdigit() for p in parts[1:]):
+                self.add('host_mem_used_mib', t, float(parts[2]))
+                t = None
+
+    def read_ps(self, path):
+        t, rss = None, None
+
+        def flush():
+            if t is not None and rss is not None:
+                self.add('proc_rss_mib', t, rss)
+
+        for line in iter_lines(path):
+            match = STAMP.search(line)
+            if match and len(line.split()) <= 5:
+                flush()
+                t, rss = to_seconds(match.group(1)), None
+                continue
+            if not any(key in line for key in ('train.py', 'multiprocessing', 'torch.distributed')):
+                continue
+            parts = line.split()
+            try:
+                # ps aux: USER PID %CPU %MEM VSZ RSS, ps -eo: PID PPID %CPU %MEM RSS VSZ (KiB)
+                rss = (rss or 0) + (int(parts[4]) if parts[0].isdigit() else int(parts[5])) / 1024
+            except (IndexError, ValueError):
+                continue
+        flush()
+
+    def read_resources(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        columns = ['time', 'role', 'rss', 'pss', 'host_cpu_percent', 'host_iowait_percent', 'gpu_util',
+                   'gpu_memory_used', 'gpu_memory_reserved']
+        parquet = pq.ParquetFile(path)
+        columns = [c for c in columns if c in parquet.schema_arrow.names]
+        current, sums = None, None
+
+        def flush():
+            if current is None:
+                return
+            t = current / 1000
+            self.add('proc_rss_mib', t, sums['rss'] / 2**20)
+            if sums['pss']:
+                self.add('proc_pss_mib', t, sums['pss'] / 2**20)
+            for name, key, scale in (('cpu_util', 'cpu', 1), ('iowait', 'iowait', 1), ('gpu_util', 'gpu_util', 1),
+                                     ('gpu_mem_mib', 'gpu_mem', 2**-20)):
+                if sums.get(key) is not None:
+                    self.add(name, t, sums[key] * scale)
+
+        for batch in parquet.iter_batches(batch_size=4096, columns=columns):
+            # the unix time in ms: without a time zone (as before the UTC one), pyarrow returns naive datetimes that
+            # would be taken as local times
+            times = batch.column('time').cast(pa.int64()).to_pylist()
+            for t, row in zip(times, batch.to_pylist()):
+                row['time'] = t
+                if row['time'] != current:
+                    flush()
+                    current, sums = row['time'], dict(rss=0, pss=0)
+                sums['rss'] += row['rss'] or 0
+                sums['pss'] += row.get('pss') or 0
+                if row['role'] == 'main':
+                    sums.update(
+                        cpu=row.get('host_cpu_percent'),
+                        iowait=row.get('host_iowait_percent'),
+                        gpu_util=row.get('gpu_util'),
+                        gpu_mem=row.get('gpu_memory_used') or row.get('gpu_memory_reserved'))
+        flush()
+
+    def analyze(self):
+        training = self.files.get('training')
+        if training is not None:
+            for line in iter_lines(training):
+                match = LOG_TIME.match(line)
+                if match:
+                    self.first_log = to_seconds(match.group(1))
+                    break
+            self.read_training(training)
+        if 'gpu' in self.files:
+            self.read_gpu(self.files['gpu'])
+        if 'system' in self.files and (self.first_gpu or self.first_log) is not None:
+            self.read_top(self.files['system'])
+        if 'system_mem' in self.files:
+            self.read_free(self.files['system_mem'])
+        if 'process' in self.files:
+            self.read_ps(self.files['process'])
+        for path in self.resources:
+            self.read_resources(path)
+
+    def metrics(self):
+
+        def stat(name, attr, *args):
+            s = self.stats[name]
+            if s is None:
+                return None
+            value = getattr(s, attr)
+            return value(*args) if callable(value) else value
+
+        iters_per_s = self.iters / self.train_time if self.train_time else None
+        return dict(
+            duration_s=self.end - self.start if self.start is not None and self.end is not None else None,
+            iterations=int(self.iters) or None,
+            iters_per_s=iters_per_s,
+            samples_per_s=iters_per_s * self.batch_size if iters_per_s and self.batch_size else None,
+            data_stall_ratio=self.weighted_data_time / self.weighted_time if self.weighted_time else None,
+            gpu_util_mean=stat('gpu_util', 'mean'),
+            gpu_util_p95=stat('gpu_util', 'percentile', 95),
+            gpu_mem_peak_mib=stat('gpu_mem_mib', 'max'),
+            torch_mem_peak_mib=stat('torch_mem_mib', 'max'),
+            cpu_util_mean=stat('cpu_util', 'mean'),
+            cpu_util_p95=stat('cpu_util', 'percentile', 95),
+            iowait_mean=stat('iowait', 'mean'),
+            proc_rss_peak_mib=stat('proc_rss_mib', 'max'),
+            proc_pss_peak_mib=stat('proc_pss_mib', 'max'),
+            host_mem_used_peak_mib=stat('host_mem_used_mib', 'max'),
+            sources=sorted(self.files) + (['resources'] if self.resources else []))
+
+
+def discover(paths, bucket):
+    experiments = dict()
+
+    def get(name):
+        return experiments.setdefault(name, Experiment(name, bucket))
+
+    for root in paths:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+            if osp.basename(osp.normpath(dirpath)) == 'monitoring_logs':
+                for filename in sorted(filenames):
+                    stem, ext = osp.splitext(filename)
+                    for prefix in PREFIXES:
+                        if stem.startswith(prefix + '_') and ext == ('.csv' if prefix == 'gpu' else '.log'):
+                            get(stem[len(prefix) + 1:]).files[prefix] = osp.join(dirpath, filename)
+                            break
+            resources = [osp.join(dirpath, f) for f in sorted(filenames) if RESOURCES.match(f)]
+            if resources and osp.basename(osp.normpath(dirpath)) == 'resources':
+                # the files of ResourceMonitorHook, in the resources directory of the work_dir
+                dirpath = osp.dirname(osp.normpath(dirpath))
+                experiment = get(osp.basename(dirpath))
+                experiment.resources = resources
+                # the latest text log of tools/train.py
+                logs = sorted(glob.glob(osp.join(dirpath, '*_*.log')))
+                if logs:
+                    experiment.files.setdefault('training', logs[-1])
+    return experiments
+
+
+def fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def main():
+    args = parse_args()
+    experiments = discover(args.paths, args.bucket)
+    if args.experiments is not None:
+        experiments = {k: v for k, v in experiments.items() if k in args.experiments}
+    results = dict()
+    for name in sorted(experiments):
+        experiments[name].analyze()
+        results[name] = experiments[name].metrics()
+
+    columns = [('experiment', 24, None), ('duration_s', 9, '.0f'), ('iters_per_s', 7, '.2f'),
+               ('samples_per_s', 9, '.1f'), ('data_stall_ratio', 7, '.1%'), ('gpu_util_mean', 7, '.1f'),
+               ('gpu_util_p95', 7, '.1f'), ('gpu_mem_peak_mib', 8, '.0f'), ('cpu_util_mean', 7, '.1f'),
+               ('cpu_util_p95', 7, '.1f'), ('proc_rss_peak_mib', 9, '.0f'), ('host_mem_used_peak_mib', 9, '.0f')]
+    headers = ['experiment', 'time s', 'it/s', 'sample/s', 'stall', 'gpu %', 'gpu p95', 'gpu MiB', 'cpu %',
+               'cpu p95', 'rss MiB', 'host MiB']
+    print(''.join(f'{h:<{w}}' if i == 0 else f'{h:>{w}}' for i, (h, (_, w, _)) in enumerate(zip(headers, columns))))
+    for name, metrics in results.items():
+        print(f'{name:<24}' + ''.join(f'{fmt(metrics[key], spec):>{w}}' for key, w, spec in columns[1:]))
+
+    if args.json is not None:
+        text = json.dumps(results, indent=2)
+        if args.json == '-':
+            print(text)
+        else:
+            with open(args.json, 'w') as f:
+                f.write(text + '\n')
+    if args.timeline is not None:
+        names = ['iters_per_s', 'gpu_util', 'gpu_mem_mib', 'cpu_util', 'iowait', 'proc_rss_mib', 'proc_pss_mib',
+                 'host_mem_used_mib']
+        with open(args.timeline, 'w') as f:
+            f.write(','.join(['experiment', 't'] + names) + '\n')
+            for name in sorted(experiments):
+                timeline = experiments[name].timeline
+                for index in sorted(timeline):
+                    slots = timeline[index]
+                    # the mean of the rates and the utilizations, the peak of the memory
+                    values = [(slots[n][2] if n.endswith('mib') else slots[n][0] / slots[n][1]) if n in slots else ''
+                              for n in names]
+                    f.write(','.join([name, f'{index * args.bucket:g}'] + [
+                        v if v == '' else f'{v:.6g}' for v in values]) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,14 @@ CONFIG=$1
 CHECKPOINT=$2
 GPUS=$3
 
-MKL_SERVICE_FORCE_INTEL=1 PYTHONPATH="$(dirname $0)/..":$PYTHONPATH \
-CUDA_VISIBLE_DEVICES=0 python -m torch.distributed.launch --nproc_per_node=$GPUS --master_port=$MASTER_PORT \
-    $(dirname "$0")/test.py $CONFIG -C $CHECKPOINT --launcher pytorch ${@:4}
+# CPU 모드인지 확인 (CUDA_VISIBLE_DEVICES가 빈 문자열이면 CPU 모드)
+if [ -z "$CUDA_VISIBLE_DEVICES" ]; then
+    echo "Running in CPU mode"
+    MKL_SERVICE_FORCE_INTEL=1 PYTHONPATH="$(dirname $0)/..":$PYTHONPATH \
+    python -m torch.distributed.launch --nproc_per_node=$GPUS --master_port=$MASTER_PORT \
+        $(dirname "$0")/test.py $CONFIG -C $CHECKPOINT --launcher pytorch ${@:4}
+else
+    MKL_SERVICE_FORCE_INTEL=1 PYTHONPATH="$(dirname $0)/..":$PYTHONPATH \
+    CUDA_VISIBLE_DEVICES=0 python -m torch.distributed.launch --nproc_per_node=$GPUS --master_port=$MASTER_PORT \
+        $(dirname "$0")/test.py $CONFIG -C $CHECKPOINT --launcher pytorch ${@:4}
+fi
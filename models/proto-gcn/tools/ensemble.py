@@ -1,36 +1,89 @@
-from mmcv import load, dump
-from protogcn.smp import *
-import datetime
-
-joint_path = '../work_dirs/ntu60_xsub/j/best_pred.pkl'
-bone_path = '../work_dirs/ntu60_xsub/b/best_pred.pkl'
-kbone_path = '../work_dirs/ntu60_xsub/k/best_pred.pkl'
-joint_motion_path = '../work_dirs/ntu60_xsub/jm/best_pred.pkl'
-bone_motion_path = '../work_dirs/ntu60_xsub/bm/best_pred.pkl'
-kbone_motion_path = '../work_dirs/ntu60_xsub/km/best_pred.pkl'
-
-joint = load(joint_path)
-bone = load(bone_path)
-kbone = load(kbone_path)
-joint_motion = load(joint_motion_path)
-bone_motion = load(bone_motion_path)
-kbone_motion = load(kbone_motion_path)
-
-label = load_label('/data/nturgbd/ntu60_3danno.pkl', 'xsub_val')
-# label = load_label('/data/nturgbd/ntu60_3danno.pkl', 'xview_val')
-# label = load_label('/data/nturgbd/ntu120_3danno.pkl', 'xsub_val')
-# label = load_label('/data/nturgbd/ntu120_3danno.pkl', 'xset_val')
-# label = load_label('/data/k400/k400_hrnet.pkl', 'val')
-# label = load_label('/data/finegym/gym_hrnet.pkl', 'val')
-
-print('J+B')
-fused = comb([joint, bone], [1, 1])
-print('Top-1', top1(fused, label))
-
-print('4M')
-fused = comb([joint, bone, joint_motion, bone_motion], [2, 2, 1, 1])
-print('Top-1', top1(fused, label))
-
-print('6M')
-fused = comb([joint, bone, kbone, joint_motion, bone_motion, kbone_motion], [2, 2, 2, 1, 1, 1])
-print('Top-1', top1(fused, label))
\ No newline at end of file
+import argparse
+import numpy as np
+import os.path as osp
+import time
+from mmcv import load
+
+from protogcn.core import (fuse_scores, fusion_mean_class_accuracy, fusion_top_k_accuracy, save_fusion_weights,
+                           search_fusion_weights, stack_scores)
+from protogcn.smp import load_label
+
+"""
+Fuse the test scores of several models and search the fusion weights.
+
+    python tools/ensemble.py ../work_dirs/ntu60_xsub/{j,b,k,jm,bm,km}/best_pred.pkl \
+        --label /data/nturgbd/ntu60_3danno.pkl --split xsub_val --weights 2 2 2 1 1 1 \
+        --search coordinate --out ../work_dirs/ntu60_xsub/fusion_weights.json
+
+The scores are stacked into a (models, samples, classes) array, the metrics of all the candidate weightings are
+computed in vectorized form, over all CPU cores. The chosen weights are saved with the model names (by default, the
+name of the directory of every score file), and `tools/test_ensemble.py --weights-file` applies them. Search them on
+a held-out split rather than on the reported one.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fuse the scores of several models and search the fusion weights')
+    parser.add_argument(
+        'scores', nargs='+', help='score file of every model (the --out of tools/test.py, pkl or streamed npy)')
+    parser.add_argument('--label', required=True, help='annotation file (.pkl or .txt) with the labels')
+    parser.add_argument('--split', default=None, help='split of the annotation file, e.g. xsub_val')
+    parser.add_argument('--names', nargs='+', default=None, help='name of every model, default: the directories')
+    parser.add_argument('--weights', type=float, nargs='+', default=None, help='fixed fusion weights to evaluate')
+    parser.add_argument(
+        '--search', choices=['none', 'grid', 'coordinate', 'stacking'], default='coordinate',
+        help='the weight search')
+    parser.add_argument(
+        '--metric', default='top1', help='the metric to maximize: top1, top5, ... or mean_class_accuracy')
+    parser.add_argument(
+        '--grid', type=float, nargs='+', default=[0, 0.5, 1, 1.5, 2, 3], help='candidate weights of the search')
+    parser.add_argument(
+        '--workers', type=int, default=None, help='number of threads, default: torch.get_num_threads() up to 4')
+    parser.add_argument('--out', default=None, help='json file to save the searched weights')
+    args = parser.parse_args()
+    assert args.weights is None or len(args.weights) == len(args.scores), 'Give one weight per score file'
+    return args
+
+
+def load_scores(filename):
+    return np.load(filename, mmap_mode='r') if filename.endswith('.npy') else load(filename)
+
+
+def report(name, scores, labels):
+    top1, top5 = fusion_top_k_accuracy(scores, labels, (1, 5))
+    mean_class = fusion_mean_class_accuracy(scores, labels)
+    print(f'{name:<40}{top1:>10.4f}{top5:>10.4f}{mean_class:>12.4f}')
+
+
+def main():
+    args = parse_args()
+    names = args.names or [osp.basename(osp.dirname(osp.abspath(f))) for f in args.scores]
+    if len(set(names)) < len(names):
+        names = [osp.splitext(osp.basename(f))[0] for f in args.scores]
+    scores = stack_scores([load_scores(f) for f in args.scores], np.float32)
+    labels = np.asarray(load_label(args.label, args.split))
+    assert scores.shape[1] == len(labels), f'{scores.shape[1]} scores for {len(labels)} labels'
+    print(f'{len(names)} models, {scores.shape[1]} samples, {scores.shape[2]} classes')
+
+    print(f'\n{"":<40}{"top1":>10}{"top5":>10}{"mean_class":>12}')
+    for name, score in zip(names, scores):
+        report(name, score, labels)
+    report('fusion 1:...:1', fuse_scores(scores, np.ones(len(names))), labels)
+    if args.weights is not None:
+        report('fusion ' + ':'.join(f'{w:g}' for w in args.weights), fuse_scores(scores, args.weights), labels)
+
+    if args.search == 'none':
+        return
+    tic = time.time()
+    weights, value = search_fusion_weights(
+        scores, labels, method=args.search, metric=args.metric, grid=args.grid, num_workers=args.workers)
+    print(f'\n{args.search} search of the {args.metric} in {time.time() - tic:.2f}s: '
+          + ', '.join(f'{n} {w:.3g}' for n, w in zip(names, weights)))
+    report(f'fusion ({args.search})', fuse_scores(scores, weights), labels)
+    if args.out is not None:
+        save_fusion_weights(args.out, names, weights, method=args.search, metric=args.metric, value=value)
+        print(f'weights saved to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
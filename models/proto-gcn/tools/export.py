@@ -0,0 +1,79 @@
+import argparse
+import os.path as osp
+import torch
+import warnings
+from mmcv import Config, mkdir_or_exist
+
+from protogcn.apis import build_export_model, default_input_shape
+
+"""
+Export a RecognizerGCN (backbone + cls_head + multi-clip averaging) to TorchScript and / or ONNX.
+
+The exported graph takes `keypoint` of shape (N, num_clips, M, T, V, C) and returns the clip-averaged class
+scores `score` of shape (N, num_classes). N and num_clips are dynamic; M, T, V and C are fixed to the export shape.
+
+    python tools/export.py configs/ntu60_xsub/j.py -C work_dirs/ntu60_xsub/j/best.pth --out-dir work_dirs/export/j
+    python tools/export_runner.py configs/ntu60_xsub/j.py work_dirs/export/j/model.onnx -C work_dirs/ntu60_xsub/j/best.pth
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export a protogcn recognizer to TorchScript / ONNX')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('-C', '--checkpoint', help='checkpoint file', default=None)
+    parser.add_argument('--out-dir', default=None, help='output directory, default: {work_dir}/export')
+    parser.add_argument(
+        '--format', nargs='+', choices=['torchscript', 'onnx'], default=['torchscript', 'onnx'],
+        help='the export formats')
+    parser.add_argument(
+        '--input-shape', type=str, default=None,
+        help='example input shape N,num_clips,M,T,V,C, default: from the backbone and the test pipeline')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version')
+    parser.add_argument(
+        '--average-clips', choices=['score', 'prob'], default=None,
+        help='average type of the test clips, default: test_cfg.average_clips or "prob"')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    out_dir = args.out_dir or osp.join(cfg.work_dir, 'export')
+    mkdir_or_exist(out_dir)
+
+    model = build_export_model(cfg, args.checkpoint, args.average_clips)
+    if args.input_shape is None:
+        input_shape = default_input_shape(cfg)
+    else:
+        input_shape = tuple(map(int, args.input_shape.split(',')))
+    # use more than one sample / clip, so that no size of 1 gets special-cased in the trace
+    example = torch.randn((max(input_shape[0], 2), max(input_shape[1], 2)) + input_shape[2:])
+    print(f'Export input shape: {tuple(example.shape)}, dynamic axes: N, num_clips')
+
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.filterwarnings('ignore', category=torch.jit.TracerWarning)
+        if 'torchscript' in args.format:
+            ts_file = osp.join(out_dir, 'model.pt')
+            traced = torch.jit.trace(model, example, check_trace=False)
+            traced.save(ts_file)
+            print(f'TorchScript model saved to {ts_file}')
+
+        if 'onnx' in args.format:
+            onnx_file = osp.join(out_dir, 'model.onnx')
+            export_kwargs = dict(
+                input_names=['keypoint'],
+                output_names=['score'],
+                dynamic_axes=dict(keypoint={0: 'batch', 1: 'num_clips'}, score={0: 'batch'}),
+                opset_version=args.opset,
+                do_constant_folding=True)
+            try:
+                # the TorchScript-based exporter handles the dynamic axes of the traced reshapes
+                torch.onnx.export(model, (example, ), onnx_file, dynamo=False, **export_kwargs)
+            except TypeError:
+                # torch < 2.5 has no `dynamo` argument
+                torch.onnx.export(model, (example, ), onnx_file, **export_kwargs)
+            print(f'ONNX model saved to {onnx_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import numpy as np
+import os.path as osp
+import time
+import torch
+from mmcv import Config
+
+from protogcn.apis import build_export_model, default_input_shape
+from protogcn.datasets import build_dataset
+
+"""
+Run a model exported by `tools/export.py` on CPU, check its scores against the PyTorch model and benchmark the
+latency at several batch sizes.
+
+    python tools/export_runner.py configs/ntu60_xsub/j.py work_dirs/export/j/model.onnx -C work_dirs/ntu60_xsub/j/best.pth
+
+`.onnx` files run with onnxruntime (CPUExecutionProvider), `.pt` files with `torch.jit.load`.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check and benchmark an exported protogcn recognizer on CPU')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('model', help='exported model file (.onnx or .pt)')
+    parser.add_argument('-C', '--checkpoint', help='checkpoint file of the PyTorch reference', default=None)
+    parser.add_argument(
+        '--average-clips', choices=['score', 'prob'], default=None,
+        help='must match the value used for the export')
+    parser.add_argument(
+        '--parity-samples', type=int, default=32,
+        help='number of test samples compared against the PyTorch model')
+    parser.add_argument(
+        '--random-input', action='store_true',
+        help='check parity on random inputs instead of the test split')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads, default: all cores')
+    return parser.parse_args()
+
+
+def build_runner(model_file, threads=None):
+    """Return a function mapping a float32 array (N, num_clips, M, T, V, C) to scores (N, num_classes)."""
+    if model_file.endswith('.onnx'):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads is not None:
+            options.intra_op_num_threads = threads
+        session = ort.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        return lambda x: session.run(['score'], dict(keypoint=x))[0]
+
+    assert model_file.endswith('.pt'), 'The exported model should be a .onnx or a .pt file'
+    model = torch.jit.load(model_file, map_location='cpu').eval()
+
+    def run(x):
+        with torch.inference_mode():
+            return model(torch.from_numpy(x)).numpy()
+    return run
+
+
+def parity_inputs(cfg, args, input_shape):
+    """Yield (keypoint, label) pairs of a single sample."""
+    if args.random_input:
+        rng = np.random.default_rng(0)
+        for _ in range(args.parity_samples):
+            yield rng.standard_normal((1, ) + input_shape[1:], dtype=np.float32), None
+        return
+
+    cfg.data.test.test_mode = True
+    dataset = build_dataset(cfg.data.test, dict(test_mode=True))
+    for i in range(min(args.parity_samples, len(dataset))):
+        data = dataset[i]
+        yield data['keypoint'][None].numpy().astype(np.float32), data.get('label', None)
+
+
+def benchmark(fn, x, warmup, repeat):
+    for _ in range(warmup):
+        fn(x)
+    times = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - tic)
+    return np.array(times) * 1000
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_export_model(cfg, args.checkpoint, args.average_clips)
+    input_shape = default_input_shape(cfg)
+
+    def run_pytorch(x):
+        with torch.inference_mode():
+            return model(torch.from_numpy(x)).numpy()
+
+    run_exported = build_runner(args.model, args.threads)
+
+    # parity
+    max_diff, agree, correct, total = 0., 0, [0, 0], 0
+    for keypoint, label in parity_inputs(cfg, args, input_shape):
+        ref, out = run_pytorch(keypoint), run_exported(keypoint)
+        max_diff = max(max_diff, float(np.abs(ref - out).max()))
+        agree += int(ref.argmax() == out.argmax())
+        if label is not None:
+            correct[0] += int(ref.argmax() == label)
+            correct[1] += int(out.argmax() == label)
+        total += 1
+        input_shape = keypoint.shape
+    print(f'Parity on {total} samples of shape {tuple(input_shape[1:])}: '
+          f'max abs diff {max_diff:.3e}, top-1 agreement {agree / total:.4f}')
+    if label is not None:
+        print(f'top1_acc: PyTorch {correct[0] / total:.4f}, {osp.basename(args.model)} {correct[1] / total:.4f}')
+
+    # latency
+    print(f'\n{"batch":>6} {"pytorch ms":>11} {"exported ms":>12} {"ms/sample":>10} {"p90 ms":>8} {"speedup":>8}')
+    rng = np.random.default_rng(0)
+    for bs in args.batch_sizes:
+        x = rng.standard_normal((bs, ) + tuple(input_shape[1:]), dtype=np.float32)
+        t_ref = benchmark(run_pytorch, x, args.warmup, args.repeat)
+        t_exp = benchmark(run_exported, x, args.warmup, args.repeat)
+        print(f'{bs:>6} {np.median(t_ref):>11.2f} {np.median(t_exp):>12.2f} {np.median(t_exp) / bs:>10.2f} '
+              f'{np.percentile(t_exp, 90):>8.2f} {np.median(t_ref) / np.median(t_exp):>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import copy
+import numpy as np
+import os.path as osp
+import subprocess
+import time
+import torch
+import torch.nn as nn
+from mmcv import Config, mkdir_or_exist
+from mmcv.runner import load_checkpoint, save_checkpoint
+
+from protogcn.apis import default_input_shape
+from protogcn.datasets import build_dataloader, build_dataset
+from protogcn.models import build_model
+from protogcn.smp import fnp
+from protogcn.utils import cache_checkpoint
+
+"""
+Structured channel pruning of a ProtoGCN recognizer.
+
+The pruned channels are the inner channels of every GCN block, its in / out channels (and so the residuals, `A`,
+`alpha`, `beta` and `add_coeff`) are kept:
+- unit_gcn: the channels of every subset (`mid_channels`, the same number is kept in each of the `num_subsets`
+  subsets), i.e. the outputs of `pre` / `conv1` / `conv2` and the inputs of `post`. In the last block, they are also
+  the graph channels of the PRN (and of the `post` / `bn` of ProtoGCN).
+- mstcn: the channels of every branch, i.e. the outputs of the branch (the inputs of `transform`) and the channels
+  between the 1x1 and the temporal conv of the dilated branches.
+
+The channels are ranked by the |gamma| of the BN that follows them ('bn') or by the first-order Taylor estimate
+(gamma * dL/dgamma + beta * dL/dbeta)^2 accumulated over training batches ('taylor'). At each sparsity level, the
+pruned model is rebuilt from the config with the new widths (`gcn_mid_channels` / `tcn_mid_channels` of the
+backbone) and the kept weights, and saved with a fine-tuning config:
+
+    python tools/prune.py configs/ntu60_xsub/j.py -C work_dirs/ntu60_xsub/j/best.pth --sparsity 0.25 0.5
+    bash tools/dist_train.sh work_dirs/ntu60_xsub/j/prune/s50/config.py 1 --validate
+
+`--finetune` runs the fine-tuning of every level with `tools/dist_train.sh`.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Structured channel pruning of a protogcn recognizer')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('-C', '--checkpoint', help='checkpoint file', default=None)
+    parser.add_argument('--out-dir', default=None, help='output directory, default: {work_dir}/prune')
+    parser.add_argument(
+        '--sparsity', type=float, nargs='+', default=[0.25, 0.5, 0.75], help='the share of pruned channels')
+    parser.add_argument('--importance', choices=['bn', 'taylor'], default='bn', help='the channel importance')
+    parser.add_argument('--taylor-batches', type=int, default=32, help='train batches for the Taylor importance')
+    parser.add_argument(
+        '--finetune-epochs', type=int, default=None, help='epochs of the fine-tuning, default: total_epochs / 5')
+    parser.add_argument('--finetune-lr', type=float, default=None, help='lr of the fine-tuning, default: lr / 10')
+    parser.add_argument('--finetune', action='store_true', help='fine-tune every level with tools/dist_train.sh')
+    parser.add_argument('--gpus', type=int, default=1, help='number of processes of the fine-tuning')
+    parser.add_argument('--batch-size', type=int, default=1, help='batch size of the latency benchmark')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads, default: all cores')
+    return parser.parse_args()
+
+
+def bn_importance(bn, taylor=None):
+    """The importance of the channels of a BN layer."""
+    if taylor is not None:
+        return taylor[bn]
+    return bn.weight.detach().abs()
+
+
+def taylor_importance(model, data_loader, num_batches):
+    """Accumulate (gamma * dL/dgamma + beta * dL/dbeta)^2 of every BN layer over ``num_batches`` train batches."""
+    bns = [m for m in model.modules() if isinstance(m, nn.BatchNorm2d)]
+    scores = {bn: torch.zeros_like(bn.weight) for bn in bns}
+    model.train()
+    for i, data in enumerate(data_loader):
+        if i == num_batches:
+            break
+        model.zero_grad()
+        losses = model(return_loss=True, **data)
+        loss = sum(v for k, v in losses.items() if 'loss' in k)
+        loss.backward()
+        for bn in bns:
+            if bn.weight.grad is not None:
+                scores[bn] += (bn.weight * bn.weight.grad + bn.bias * bn.bias.grad).detach() ** 2
+    model.zero_grad()
+    model.eval()
+    return scores
+
+
+def topk_sorted(importance, k):
+    return importance.topk(k).indices.sort().values
+
+
+def num_kept(channels, sparsity):
+    return max(int(round(channels * (1 - sparsity))), 1)
+
+
+def select_channels(backbone, sparsity, taylor=None):
+    """Choose the kept channels of every block.
+
+    Returns:
+        list[dict]: For every GCN block, the kept channels ``gcn`` (indices into num_subsets * mid_channels) and,
+            for every mstcn branch, ``out`` (indices into the branch outputs) and ``mid`` (dilated branches only).
+        torch.Tensor: The kept output channels of the `post` / `bn` of ProtoGCN.
+    """
+    plans = []
+    for block in backbone.gcn:
+        gcn, tcn = block.gcn, block.tcn
+        # the same number of channels is kept in every subset
+        imp = bn_importance(gcn.pre[1], taylor).view(gcn.num_subsets, gcn.mid_channels)
+        keep = num_kept(gcn.mid_channels, sparsity)
+        gcn_idx = torch.cat([topk_sorted(imp[k], keep) + k * gcn.mid_channels for k in range(gcn.num_subsets)])
+
+        out_imp = bn_importance(tcn.transform[0], taylor)
+        branches, offset = [], 0
+        for branch, channels in zip(tcn.branches, tcn.branch_channels):
+            keep = num_kept(channels, sparsity)
+            plan = dict(out=topk_sorted(out_imp[offset:offset + channels], keep))
+            if isinstance(branch, nn.Sequential) and not isinstance(branch[-1], nn.MaxPool2d):
+                plan['mid'] = topk_sorted(bn_importance(branch[1], taylor), keep)
+            branches.append(plan)
+            offset += channels
+        plans.append(dict(gcn=gcn_idx, tcn=branches))
+
+    post_idx = topk_sorted(bn_importance(backbone.bn, taylor), len(plans[-1]['gcn']))
+    return plans, post_idx
+
+
+def pruned_widths(backbone, plans):
+    """The `gcn_mid_channels` / `tcn_mid_channels` backbone arguments of the pruned model."""
+    gcn_mid = [len(plan['gcn']) // block.gcn.num_subsets for plan, block in zip(plans, backbone.gcn)]
+    tcn_mid = [[len(b['out']) for b in plan['tcn']] for plan in plans]
+    # the per-stage arguments are indexed by stage, the first stage has no block if in_channels == base_channels
+    if backbone.in_channels == backbone.base_channels:
+        gcn_mid, tcn_mid = [None] + gcn_mid, [None] + tcn_mid
+    return tuple(gcn_mid), tuple(tcn_mid)
+
+
+def copy_layer(dst, src, out_idx=None, in_idx=None):
+    """Copy the (sliced) parameters and buffers of a conv / linear / BN layer."""
+    for name, value in list(src.named_parameters(recurse=False)) + list(src.named_buffers(recurse=False)):
+        if value.dim() == 0:
+            getattr(dst, name).data.copy_(value.data)
+            continue
+        if out_idx is not None:
+            value = value.index_select(0, out_idx.to(value.device))
+        if in_idx is not None and value.dim() > 1:
+            value = value.index_select(1, in_idx.to(value.device))
+        getattr(dst, name).data.copy_(value.data)
+
+
+def copy_pruned_block(dst, src, plan):
+    """Copy the kept weights of GCN_Block ``src`` into the pruned GCN_Block ``dst``."""
+    idx = plan['gcn']
+    gcn, dgcn = src.gcn, dst.gcn
+    for name in ['A', 'alpha', 'beta']:
+        getattr(dgcn, name).data.copy_(getattr(gcn, name).data)
+    copy_layer(dgcn.pre[0], gcn.pre[0], out_idx=idx)
+    copy_layer(dgcn.pre[1], gcn.pre[1], out_idx=idx)
+    copy_layer(dgcn.conv1, gcn.conv1, out_idx=idx)
+    copy_layer(dgcn.conv2, gcn.conv2, out_idx=idx)
+    copy_layer(dgcn.post, gcn.post, in_idx=idx)
+    copy_layer(dgcn.bn, gcn.bn)
+    if isinstance(gcn.down, nn.Module):
+        dgcn.down.load_state_dict(gcn.down.state_dict())
+
+    tcn, dtcn = src.tcn, dst.tcn
+    dtcn.add_coeff.data.copy_(tcn.add_coeff.data)
+    cat_idx, offset = [], 0
+    for branch, dbranch, bplan, channels in zip(tcn.branches, dtcn.branches, plan['tcn'], tcn.branch_channels):
+        out_idx = bplan['out']
+        cat_idx.append(out_idx + offset)
+        offset += channels
+        if isinstance(branch, nn.Conv2d):
+            copy_layer(dbranch, branch, out_idx=out_idx)
+        elif 'mid' in bplan:
+            mid_idx = bplan['mid']
+            copy_layer(dbranch[0], branch[0], out_idx=mid_idx)
+            copy_layer(dbranch[1], branch[1], out_idx=mid_idx)
+            copy_layer(dbranch[3].conv, branch[3].conv, out_idx=out_idx, in_idx=mid_idx)
+        else:
+            copy_layer(dbranch[0], branch[0], out_idx=out_idx)
+            copy_layer(dbranch[1], branch[1], out_idx=out_idx)
+    cat_idx = torch.cat(cat_idx)
+    copy_layer(dtcn.transform[0], tcn.transform[0], out_idx=cat_idx)
+    copy_layer(dtcn.transform[2], tcn.transform[2], in_idx=cat_idx)
+    copy_layer(dtcn.bn, tcn.bn)
+
+    if isinstance(src.residual, nn.Module):
+        dst.residual.load_state_dict(src.residual.state_dict())
+
+
+def prune_model(model, cfg, sparsity, taylor=None):
+    """Build the pruned recognizer.
+
+    Args:
+        model (nn.Module): The recognizer, left unchanged.
+        cfg (Config): Its config.
+        sparsity (float): The share of pruned channels.
+        taylor (dict | None): The Taylor importance of every BN layer, None to use the BN gamma. Default: None.
+
+    Returns:
+        tuple: The pruned recognizer and its model config.
+    """
+    backbone = model.backbone
+    plans, post_idx = select_channels(backbone, sparsity, taylor)
+    model_cfg = copy.deepcopy(cfg.model)
+    model_cfg.backbone.gcn_mid_channels, model_cfg.backbone.tcn_mid_channels = pruned_widths(backbone, plans)
+    pruned = build_model(model_cfg).to(next(model.parameters()).device).eval()
+
+    pbackbone = pruned.backbone
+    copy_layer(pbackbone.data_bn, backbone.data_bn)
+    for block, pblock, plan in zip(backbone.gcn, pbackbone.gcn, plans):
+        copy_pruned_block(pblock, block, plan)
+    # the graph channels of the last block feed the PRN
+    graph_idx = plans[-1]['gcn']
+    copy_layer(pbackbone.prn.query_matrix, backbone.prn.query_matrix, in_idx=graph_idx)
+    copy_layer(pbackbone.prn.memory_matrix, backbone.prn.memory_matrix, out_idx=graph_idx)
+    copy_layer(pbackbone.post, backbone.post, out_idx=post_idx, in_idx=graph_idx)
+    copy_layer(pbackbone.bn, backbone.bn, out_idx=post_idx)
+    pruned.cls_head.load_state_dict(model.cls_head.state_dict())
+    return pruned, model_cfg
+
+
+def measure(model, input_shape, args):
+    """Return the backbone parameters (M) and FLOPs (G) of one clip, and the median latency (ms) of a test batch."""
+    clip = torch.randn((1, ) + input_shape[2:])
+    params, flops = fnp(model.backbone, (clip, ))
+    x = torch.randn((args.batch_size, ) + input_shape[1:])
+    times = []
+    with torch.inference_mode():
+        for i in range(args.warmup + args.repeat):
+            tic = time.perf_counter()
+            model(return_loss=False, keypoint=x)
+            if i >= args.warmup:
+                times.append(time.perf_counter() - tic)
+    return params / 1e6, flops / 1e9, float(np.median(times)) * 1000
+
+
+def finetune_config(cfg, model_cfg, out_dir, checkpoint, args):
+    cfg = copy.deepcopy(cfg)
+    cfg.model = model_cfg
+    cfg.work_dir = out_dir
+    cfg.load_from = checkpoint
+    cfg.resume_from = None
+    cfg.total_epochs = args.finetune_epochs or max(cfg.total_epochs // 5, 1)
+    cfg.optimizer.lr = args.finetune_lr or cfg.optimizer.lr / 10
+    return cfg
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    out_dir = args.out_dir or osp.join(cfg.work_dir, 'prune')
+    mkdir_or_exist(out_dir)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_model(cfg.model)
+    if args.checkpoint is not None:
+        load_checkpoint(model, cache_checkpoint(args.checkpoint), map_location='cpu')
+    model = model.cpu().eval()
+
+    taylor = None
+    if args.importance == 'taylor':
+        dataset = build_dataset(cfg.data.train)
+        data_loader = build_dataloader(
+            dataset,
+            videos_per_gpu=cfg.data.get('videos_per_gpu', 1),
+            workers_per_gpu=cfg.data.get('workers_per_gpu', 1),
+            pin_memory=False)
+        print(f'Accumulating the Taylor importance over {args.taylor_batches} train batches')
+        taylor = taylor_importance(model, data_loader, args.taylor_batches)
+
+    input_shape = default_input_shape(cfg)
+    report = [(0.0, ) + measure(model, input_shape, args)]
+    for sparsity in args.sparsity:
+        pruned, model_cfg = prune_model(model, cfg, sparsity, taylor)
+        level_dir = osp.join(out_dir, f's{int(round(sparsity * 100)):02d}')
+        mkdir_or_exist(level_dir)
+        checkpoint = osp.join(level_dir, 'pruned.pth')
+        save_checkpoint(pruned, checkpoint, meta=dict(sparsity=sparsity, importance=args.importance))
+        ft_cfg = finetune_config(cfg, model_cfg, level_dir, checkpoint, args)
+        ft_cfg.dump(osp.join(level_dir, 'config.py'))
+        report.append((sparsity, ) + measure(pruned, input_shape, args))
+
+    base = report[0]
+    print(f'\nInput {tuple(input_shape[1:])} x batch {args.batch_size}, importance: {args.importance}')
+    print(f'{"sparsity":>8} {"params M":>9} {"GFLOPs":>8} {"latency ms":>11} {"speedup":>8}')
+    for sparsity, params, flops, latency in report:
+        print(f'{sparsity:>8.2f} {params:>9.3f} {flops:>8.3f} {latency:>11.2f} {base[3] / latency:>7.2f}x')
+
+    for sparsity in args.sparsity:
+        level_cfg = osp.join(out_dir, f's{int(round(sparsity * 100)):02d}', 'config.py')
+        command = ['bash', osp.join(osp.dirname(__file__), 'dist_train.sh'), level_cfg, str(args.gpus), '--validate']
+        if not args.finetune:
+            print(f'Fine-tune with: {" ".join(command)}')
+            continue
+        print(f'\nFine-tuning sparsity {sparsity}: {" ".join(command)}')
+        subprocess.run(command, check=True)
+
+
+if __name__ == '__main__':
+    main()
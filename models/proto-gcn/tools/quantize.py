@@ -0,0 +1,186 @@
+import argparse
+import copy
+import io
+import mmcv
+import numpy as np
+import os.path as osp
+import time
+import torch
+import torch.nn as nn
+import warnings
+from mmcv import Config
+from mmcv.runner import load_checkpoint
+
+from protogcn.datasets import build_dataloader, build_dataset
+from protogcn.models import build_model
+from protogcn.utils import cache_checkpoint
+
+"""
+Post-training static int8 quantization of a RecognizerGCN for CPU inference (FX graph mode).
+
+Only the convs / linears (1x1 and temporal convs of unit_gcn, unit_tcn and mstcn, `SimpleHead.fc_cls`) and the
+BN / ReLU / MaxPool fused into them run in int8. The graph construction of unit_gcn (einsums, tanh / softmax,
+graph sums) and the PRN stay in float, the quantized graph dequantizes around them.
+
+    python tools/quantize.py configs/ntu60_xsub/j.py -C work_dirs/ntu60_xsub/j/best.pth --calib-samples 256
+
+The quantized model is saved (traced with `forward_export`, see tools/export.py) to {out_dir}/model_int8.pt, which
+`tools/export_runner.py` can run.
+"""
+
+QUANT_MODULES = (nn.Conv2d, nn.Linear, nn.BatchNorm2d, nn.ReLU, nn.MaxPool2d)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Post-training int8 quantization of a protogcn recognizer')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('-C', '--checkpoint', help='checkpoint file', default=None)
+    parser.add_argument('--out-dir', default=None, help='output directory, default: {work_dir}/export')
+    parser.add_argument('--calib-samples', type=int, default=256, help='number of val samples for calibration')
+    parser.add_argument(
+        '--eval-samples', type=int, default=None, help='evaluate on the first N test samples, default: all')
+    parser.add_argument('--backend', choices=['x86', 'fbgemm', 'qnnpack', 'onednn'], default='x86')
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads, default: all cores')
+    parser.add_argument(
+        '--eval',
+        type=str,
+        nargs='+',
+        default=['top_k_accuracy', 'mean_class_accuracy'],
+        help='evaluation metrics')
+    return parser.parse_args()
+
+
+def get_qconfig_mapping(backend):
+    from torch.ao.quantization import QConfigMapping, get_default_qconfig
+
+    qconfig = get_default_qconfig(backend)
+    qconfig_mapping = QConfigMapping()
+    for module_type in QUANT_MODULES:
+        qconfig_mapping.set_object_type(module_type, qconfig)
+    return qconfig_mapping
+
+
+def quantize_model(model, calib_loader, backend='x86'):
+    """Quantize ``model.backbone`` and ``model.cls_head.fc_cls`` of an eval-mode RecognizerGCN.
+
+    Args:
+        model (nn.Module): The float recognizer, left unchanged.
+        calib_loader (DataLoader): The calibration data.
+        backend (str): The quantized engine. Default: 'x86'.
+
+    Returns:
+        nn.Module: The quantized recognizer.
+    """
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_qconfig_mapping(backend)
+    model = copy.deepcopy(model).cpu().eval()
+
+    data = next(iter(calib_loader))
+    keypoint = data['keypoint'][:, 0]
+    with torch.no_grad():
+        feat, _ = model.backbone(keypoint)
+    # SimpleHead itself branches on the input type, only its fc_cls is traced
+    pooled = feat.mean(dim=(3, 4)).mean(dim=1)
+    # traced through nn.Sequential, so that the optional `person_mask` keeps its default (None)
+    model.backbone = prepare_fx(nn.Sequential(model.backbone), qconfig_mapping, (keypoint, ))
+    model.cls_head.fc_cls = prepare_fx(model.cls_head.fc_cls, qconfig_mapping, (pooled, ))
+
+    prog_bar = mmcv.ProgressBar(len(calib_loader.dataset))
+    with torch.no_grad():
+        for data in calib_loader:
+            model(return_loss=False, keypoint=data['keypoint'])
+            for _ in range(len(data['keypoint'])):
+                prog_bar.update()
+
+    model.backbone = convert_fx(model.backbone)
+    model.cls_head.fc_cls = convert_fx(model.cls_head.fc_cls)
+    return model
+
+
+def model_size(model):
+    """The size of the serialized state dict in MB."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1024 ** 2
+
+
+def inference(model, data_loader):
+    """Return the results and the forward time of every batch in ms."""
+    results, times = [], []
+    prog_bar = mmcv.ProgressBar(len(data_loader.dataset))
+    with torch.inference_mode():
+        for data in data_loader:
+            # the traced backbone has no person-aware path
+            data.pop('person_mask', None)
+            tic = time.perf_counter()
+            result = model(return_loss=False, **data)
+            times.append((time.perf_counter() - tic) * 1000)
+            results.extend(result)
+            for _ in range(len(result)):
+                prog_bar.update()
+    return results, np.array(times)
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    out_dir = args.out_dir or osp.join(cfg.work_dir, 'export')
+    mmcv.mkdir_or_exist(out_dir)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_model(cfg.model)
+    if args.checkpoint is not None:
+        load_checkpoint(model, cache_checkpoint(args.checkpoint), map_location='cpu')
+    model = model.cpu().eval()
+
+    loader_cfg = dict(
+        videos_per_gpu=cfg.data.get('videos_per_gpu', 1),
+        workers_per_gpu=cfg.data.get('workers_per_gpu', 1),
+        pin_memory=False)
+
+    # calibrate on a random subset of the val split
+    calib_set = build_dataset(cfg.data.val, dict(test_mode=True))
+    rng = np.random.default_rng(0)
+    indices = rng.permutation(len(calib_set))[:args.calib_samples]
+    calib_set.video_infos = [calib_set.video_infos[i] for i in indices]
+    calib_loader = build_dataloader(calib_set, shuffle=False, **loader_cfg)
+    print(f'Calibrating on {len(calib_set)} val samples')
+    qmodel = quantize_model(model, calib_loader, args.backend)
+
+    cfg.data.test.test_mode = True
+    dataset = build_dataset(cfg.data.test, dict(test_mode=True))
+    if args.eval_samples is not None:
+        dataset.video_infos = dataset.video_infos[:args.eval_samples]
+    loader_cfg.update(cfg.data.get('test_dataloader', {}))
+    data_loader = build_dataloader(dataset, shuffle=False, **loader_cfg)
+
+    report = dict()
+    for name, cur_model in [('float', model), ('int8', qmodel)]:
+        print(f'\nEvaluating the {name} model on {len(dataset)} test samples')
+        results, times = inference(cur_model, data_loader)
+        eval_res = dataset.evaluate(results, metrics=args.eval)
+        report[name] = dict(eval_res, latency=float(np.median(times)), size=model_size(cur_model))
+
+    print(f'\n{"":<22}{"float":>10}{"int8":>10}{"change":>10}')
+    for key in report['float']:
+        fp, q = report['float'][key], report['int8'][key]
+        change = f'{q - fp:+.4f}' if key not in ('latency', 'size') else f'{fp / q:.2f}x'
+        unit = dict(latency=' (ms/batch)', size=' (MB)').get(key, '')
+        print(f'{key + unit:<22}{fp:>10.4f}{q:>10.4f}{change:>10}')
+
+    # save the quantized model for deployment
+    qmodel.forward = qmodel.forward_export
+    keypoint = data_loader.dataset[0]['keypoint'][None].float()
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.filterwarnings('ignore', category=torch.jit.TracerWarning)
+        traced = torch.jit.trace(qmodel, torch.cat([keypoint, keypoint]), check_trace=False)
+    out_file = osp.join(out_dir, 'model_int8.pt')
+    traced.save(out_file)
+    print(f'\nQuantized model saved to {out_file}')
+
+
+if __name__ == '__main__':
+    main()
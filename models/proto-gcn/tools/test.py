@@ -10,15 +10,16 @@ from mmcv import Config
 from mmcv import digit_version as dv
 from mmcv import load
 from mmcv.cnn import fuse_conv_bn
-from mmcv.engine import collect_results_cpu
 
 from mmcv.fileio.io import file_handlers
-from mmcv.parallel import MMDistributedDataParallel
-from mmcv.runner import get_dist_info, init_dist, load_checkpoint
+from mmcv.parallel import MMDataParallel, MMDistributedDataParallel
+from mmcv.runner import get_dist_info, load_checkpoint
 
+from protogcn.apis import multi_gpu_test
+from protogcn.core import ScoreSink, top_k_accuracy
 from protogcn.datasets import build_dataloader, build_dataset
 from protogcn.models import build_model
-from protogcn.utils import cache_checkpoint, mc_off, mc_on, test_port
+from protogcn.utils import cache_checkpoint, get_device, init_dist, mc_off, mc_on, setup_cpu_threads, test_port
 
 import pickle
 import shutil
@@ -33,62 +34,6 @@ import sys
 import numpy as np
 
 
-def multi_gpu_test(model: nn.Module,
-                   data_loader: DataLoader,
-                   tmpdir: Optional[str] = None,
-                   gpu_collect: bool = False) -> Optional[list]:
-    """Test model with multiple gpus.
-    This method tests model with multiple gpus and collects the results
-    under two different modes: gpu and cpu modes. By setting
-    ``gpu_collect=True``, it encodes results to gpu tensors and use gpu
-    communication for results collection. On cpu mode it saves the results on
-    different gpus to ``tmpdir`` and collects them by the rank 0 worker.
-    Args:
-        model (nn.Module): Model to be tested.
-        data_loader (nn.Dataloader): Pytorch data loader.
-        tmpdir (str): Path of directory to save the temporary results from
-            different gpus under cpu mode.
-        gpu_collect (bool): Option to use either gpu or cpu to collect results.
-    Returns:
-        list: The prediction results.
-    """
-    model.eval()
-    results = []
-    dataset = data_loader.dataset
-    rank, world_size = get_dist_info()
-    # optional: save graphs for visualization
-    # save_graph = []
-
-    if rank == 0:
-        prog_bar = mmcv.ProgressBar(len(dataset))
-    time.sleep(2)  # This line can prevent deadlock problem in some cases.
-    for i, data in enumerate(data_loader):
-        with torch.no_grad():
-            result = model(return_loss=False, **data) 
-            # result, get_graph = model(return_loss=False, **data)
-        results.extend(result)
-        # save_graph.append(get_graph)
-        
-        if rank == 0:
-            batch_size = len(result)
-            batch_size_all = batch_size * world_size
-            if batch_size_all + prog_bar.completed > len(dataset):
-                batch_size_all = len(dataset) - prog_bar.completed
-            for _ in range(batch_size_all):
-                prog_bar.update()
-
-    # collect results from all ranks
-    if gpu_collect:
-        result_from_ranks = collect_results_gpu(results, len(dataset))
-    else:
-        result_from_ranks = collect_results_cpu(results, len(dataset), tmpdir)
-
-    # graph_data = np.array(save_graph)
-    # np.save('graph.npy', graph_data)
-    
-    return result_from_ranks
-
-
 def parse_args():
     parser = argparse.ArgumentParser(
         description='protogcn test (and eval) a model')
@@ -97,7 +42,8 @@ def parse_args():
     parser.add_argument(
         '--out',
         default=None,
-        help='output result file in pkl/yaml/json format')
+        help='output result file in pkl/yaml/json format, or a .npy file: the scores are then streamed to per-rank '
+        'files merged into an array indexed by sample id, and evaluated on the fly, without collecting them')
     parser.add_argument(
         '--fuse-conv-bn',
         action='store_true',
@@ -113,11 +59,49 @@ def parse_args():
     parser.add_argument(
         '--tmpdir',
         help='tmp directory used for collecting results from multiple workers')
+    parser.add_argument(
+        '--gpu-collect',
+        action='store_true',
+        help='gather the results with collectives (NCCL or gloo) instead of through tmpdir')
     parser.add_argument(
         '--average-clips',
         choices=['score', 'prob', None],
         default=None,
         help='average type when averaging test clips')
+    parser.add_argument(
+        '--videos-per-gpu',
+        type=int,
+        default=None,
+        help='number of test videos per batch on each gpu, overrides data.test_dataloader.videos_per_gpu')
+    parser.add_argument(
+        '--max-testing-views',
+        type=int,
+        default=None,
+        help='max number of clips the backbone processes at once, the clips of a batch are chunked by it')
+    parser.add_argument(
+        '--adaptive-margin',
+        type=float,
+        default=None,
+        help='adaptive multi-clip testing: stop a sample once the top-1 / top-2 margin of its clip-averaged '
+        'probabilities reaches this value')
+    parser.add_argument(
+        '--adaptive-entropy',
+        type=float,
+        default=None,
+        help='adaptive multi-clip testing: stop a sample once the entropy of its clip-averaged probabilities '
+        'drops to this value')
+    parser.add_argument(
+        '--clips-per-round', type=int, default=2, help='number of clips scored per round in adaptive testing')
+    parser.add_argument(
+        '--compare-fixed',
+        action='store_true',
+        help='in adaptive testing, also run the fixed all-clip protocol and report the speedup and top-1 change')
+    parser.add_argument(
+        '--exit-threshold',
+        type=float,
+        default=None,
+        help='early-exit testing (models with an EarlyExitHead): a clip leaves at the first exit whose softmax '
+        'confidence reaches this value')
     parser.add_argument(
         '--launcher',
         choices=['pytorch', 'slurm'],
@@ -136,8 +120,8 @@ def parse_args():
     return args
 
 
-def inference_pytorch(args, cfg, data_loader):
-    """Get predictions by pytorch models."""
+def inference_pytorch(args, cfg, data_loader, sink=None):
+    """Get predictions by pytorch models (written to ``sink`` if given)."""
     if args.average_clips is not None:
         # You can set average_clips during testing, it will override the
         # original setting
@@ -149,6 +133,20 @@ def inference_pytorch(args, cfg, data_loader):
                 cfg.model.test_cfg.average_clips = args.average_clips
             else:
                 cfg.test_cfg.average_clips = args.average_clips
+    if args.max_testing_views is not None:
+        if cfg.model.get('test_cfg') is None:
+            cfg.model.test_cfg = dict()
+        cfg.model.test_cfg['max_testing_views'] = args.max_testing_views
+    if args.exit_threshold is not None:
+        if cfg.model.get('test_cfg') is None:
+            cfg.model.test_cfg = dict()
+        cfg.model.test_cfg['early_exit'] = dict(threshold=args.exit_threshold)
+    adaptive = args.adaptive_margin is not None or args.adaptive_entropy is not None
+    if adaptive:
+        if cfg.model.get('test_cfg') is None:
+            cfg.model.test_cfg = dict()
+        cfg.model.test_cfg['adaptive'] = dict(
+            clips_per_round=args.clips_per_round, margin=args.adaptive_margin, entropy=args.adaptive_entropy)
 
     # build the model and load checkpoint
     model = build_model(cfg.model)
@@ -166,15 +164,127 @@ def inference_pytorch(args, cfg, data_loader):
     if args.fuse_conv_bn:
         model = fuse_conv_bn(model)
 
-    model = MMDistributedDataParallel(
-        model.cuda(),
-        device_ids=[torch.cuda.current_device()],
-        broadcast_buffers=False)
-    outputs = multi_gpu_test(model, data_loader, args.tmpdir)
+    fp16_cfg = cfg.get('fp16', None)
+    if fp16_cfg is not None:
+        # as train_model: float16 on cuda, bfloat16 on cpu
+        model.amp_dtype = getattr(torch, fp16_cfg.get('dtype', 'float16' if cfg.device == 'cuda' else 'bfloat16'))
+
+    if cfg.device == 'cuda':
+        model = MMDistributedDataParallel(
+            model.cuda(),
+            device_ids=[torch.cuda.current_device()],
+            broadcast_buffers=False)
+    else:
+        # every rank tests its own shard, there are no gradients to sync
+        model = MMDataParallel(model.cpu())
+        # mmcv creates the default tmpdir with a cuda broadcast
+        if args.tmpdir is None:
+            args.tmpdir = osp.join(cfg.work_dir, '.test_tmp')
+
+    if adaptive:
+        outputs = adaptive_test(model, data_loader, args, sink)
+    else:
+        outputs = multi_gpu_test(model, data_loader, args.tmpdir, args.gpu_collect, sink=sink)
+    if args.exit_threshold is not None:
+        report_early_exit(model.module)
 
     return outputs
 
 
+def report_early_exit(recognizer):
+    """Print the share of the test clips that left at every exit."""
+    keys = [f'exit{i + 1}' for i in range(len(recognizer.backbone.exit_stages))] + ['final']
+    stats = torch.tensor([recognizer.early_exit_stats.get(k, 0) for k in keys], dtype=torch.float64)
+    if dist.is_available() and dist.is_initialized():
+        # nccl only reduces cuda tensors
+        if dist.get_backend() == 'nccl':
+            stats = stats.to(torch.cuda.current_device())
+        dist.all_reduce(stats)
+        stats = stats.cpu()
+    rank, _ = get_dist_info()
+    if rank == 0:
+        share = stats / stats.sum().clamp(min=1)
+        print('\nearly exit: ' + ', '.join(f'{k} {v:.1%}' for k, v in zip(keys, share.tolist())))
+
+
+def adaptive_test(model, data_loader, args, sink=None):
+    """Run the adaptive multi-clip test and report the clips used, and (with ``--compare-fixed``) the speedup and
+    the top-1 change compared with scoring all clips."""
+    recognizer = model.module
+    # the streams of a RecognizerMultiStream are tested, and counted, one by one
+    recognizers = list(getattr(recognizer, 'streams', [recognizer]))
+    rank, _ = get_dist_info()
+    dataset = data_loader.dataset
+
+    # the adaptive pass runs first, so that any warm-up cost counts against it
+    dist.barrier()
+    tic = time.time()
+    outputs = multi_gpu_test(model, data_loader, args.tmpdir, args.gpu_collect, sink=sink)
+    adaptive_time = time.time() - tic
+
+    if args.compare_fixed:
+        adaptive_cfgs = [r.test_cfg.pop('adaptive') for r in recognizers]
+        dist.barrier()
+        tic = time.time()
+        fixed_outputs = multi_gpu_test(model, data_loader, args.tmpdir, args.gpu_collect)
+        fixed_time = time.time() - tic
+        for r, adaptive_cfg in zip(recognizers, adaptive_cfgs):
+            r.test_cfg['adaptive'] = adaptive_cfg
+
+    stats = torch.tensor([sum(r.adaptive_stats[k] for r in recognizers) for k in ('samples', 'clips', 'max_clips')],
+                         dtype=torch.float64)
+    if dist.is_available() and dist.is_initialized():
+        # nccl only reduces cuda tensors
+        if dist.get_backend() == 'nccl':
+            stats = stats.to(torch.cuda.current_device())
+        dist.all_reduce(stats)
+        stats = stats.cpu()
+    if rank == 0:
+        samples, clips, max_clips = stats.tolist()
+        assert samples > 0, 'No sample went through the adaptive multi-clip test'
+        per = 'sample and stream' if len(recognizers) > 1 else 'sample'
+        print(f'\nadaptive testing used {clips / samples:.2f} / {max_clips / samples:.0f} clips per {per} '
+              f'({max_clips / clips:.2f}x fewer clips)')
+        if args.compare_fixed:
+            labels = [ann['label'] for ann in dataset.video_infos]
+            # the fused score of a RecognizerMultiStream
+            fixed_scores, adaptive_scores = ([x['fusion'] if isinstance(x, dict) else x for x in o]
+                                             for o in (fixed_outputs, outputs))
+            fixed_top1 = top_k_accuracy(fixed_scores, labels, (1, ))[0]
+            adaptive_top1 = top_k_accuracy(adaptive_scores, labels, (1, ))[0]
+            print(f'fixed: {fixed_time:.1f}s, top1_acc {fixed_top1:.4f}; adaptive: {adaptive_time:.1f}s, '
+                  f'top1_acc {adaptive_top1:.4f}; speedup {fixed_time / adaptive_time:.2f}x, '
+                  f'top1 change {adaptive_top1 - fixed_top1:+.4f}')
+    return outputs
+
+
+def stream_test(args, cfg, dataset, data_loader, out, eval_cfg):
+    """Test with the scores streamed to the .npy file ``out`` by a ScoreSink, and print the metrics it counted."""
+    assert not args.compare_fixed, '--compare-fixed needs the collected results, use a pkl output'
+    metrics = eval_cfg.get('metrics', ['top_k_accuracy', 'mean_class_accuracy'])
+    unsupported = set(metrics) - {'top_k_accuracy', 'mean_class_accuracy'}
+    assert not unsupported, f'Streaming evaluation does not support {unsupported}, use a pkl output'
+    topk = eval_cfg.get('metric_options', {}).get('top_k_accuracy', {}).get('topk', (1, 5))
+    topk = (topk, ) if isinstance(topk, int) else topk
+    num_classes = cfg.model.cls_head.get('num_classes', None) or dataset.num_classes
+    labels = [ann['label'] for ann in dataset.video_infos]
+    sink = ScoreSink(out, labels, num_classes, topk)
+
+    dist.barrier()
+    inference_pytorch(args, cfg, data_loader, sink)
+    eval_res = sink.evaluate()
+    rank, _ = get_dist_info()
+    if rank == 0:
+        print(f'\nscores written to {out}')
+        for name, val in eval_res.items():
+            if name == 'mean_class_accuracy' and 'mean_class_accuracy' not in metrics:
+                continue
+            if name.startswith('top') and 'top_k_accuracy' not in metrics:
+                continue
+            print(f'{name}: {val:.04f}')
+    dist.barrier()
+
+
 def main():
     args = parse_args()
 
@@ -184,7 +294,7 @@ def main():
 
     # Load eval_config from cfg
     eval_cfg = cfg.get('evaluation', {})
-    keys = ['interval', 'tmpdir', 'start', 'save_best', 'rule', 'by_epoch', 'broadcast_bn_buffers']
+    keys = ['interval', 'tmpdir', 'start', 'save_best', 'rule', 'by_epoch', 'broadcast_bn_buffers', 'async_eval']
     for key in keys:
         eval_cfg.pop(key, None)
     if args.eval:
@@ -192,27 +302,34 @@ def main():
 
     mmcv.mkdir_or_exist(osp.dirname(out))
     _, suffix = osp.splitext(out)
-    assert suffix[1:] in file_handlers, ('The format of the output file should be json, pickle or yaml')
+    assert suffix[1:] in file_handlers or suffix == '.npy', (
+        'The format of the output file should be json, pickle, yaml or npy')
 
     # set cudnn benchmark
     if cfg.get('cudnn_benchmark', False):
         torch.backends.cudnn.benchmark = True
     cfg.data.test.test_mode = True
 
+    cfg.device = get_device(cfg.get('device', None))
     if not hasattr(cfg, 'dist_params'):
-        cfg.dist_params = dict(backend='nccl')
+        cfg.dist_params = dict(backend='nccl' if cfg.device == 'cuda' else 'gloo')
 
     init_dist(args.launcher, **cfg.dist_params)
     rank, world_size = get_dist_info()
     cfg.gpu_ids = range(world_size)
+    if cfg.device == 'cpu':
+        setup_cpu_threads(cfg.data.get('workers_per_gpu', 1), cfg.get('cpu_threads', None))
 
     # build the dataloader
     dataset = build_dataset(cfg.data.test, dict(test_mode=True))
     dataloader_setting = dict(
         videos_per_gpu=cfg.data.get('videos_per_gpu', 1),
         workers_per_gpu=cfg.data.get('workers_per_gpu', 1),
+        pin_memory=cfg.device == 'cuda',
         shuffle=False)
     dataloader_setting = dict(dataloader_setting, **cfg.data.get('test_dataloader', {}))
+    if args.videos_per_gpu is not None:
+        dataloader_setting['videos_per_gpu'] = args.videos_per_gpu
     data_loader = build_dataloader(dataset, **dataloader_setting)
 
     default_mc_cfg = ('localhost', 22077)
@@ -231,6 +348,12 @@ def main():
             retry -= 1
         assert retry >= 0, 'Failed to launch memcached. '
 
+    if suffix == '.npy':
+        stream_test(args, cfg, dataset, data_loader, out, eval_cfg)
+        if rank == 0 and memcached:
+            mc_off()
+        return
+
     dist.barrier()
     outputs = inference_pytorch(args, cfg, data_loader)
 
@@ -0,0 +1,177 @@
+import argparse
+import copy
+import mmcv
+import numpy as np
+import os
+import os.path as osp
+import time
+import torch
+import torch.distributed as dist
+from mmcv import Config
+from mmcv.parallel import MMDataParallel, MMDistributedDataParallel
+from mmcv.runner import get_dist_info, load_checkpoint
+
+from protogcn.apis import multi_gpu_test
+from protogcn.core import load_fusion_weights
+from protogcn.datasets import build_dataloader, build_dataset
+from protogcn.models import build_model
+from protogcn.utils import cache_checkpoint, get_device, init_dist, setup_cpu_threads
+
+"""
+Test an ensemble of single-modality models in one pass.
+
+The models (one config and checkpoint each) share the test data: every test sample is decoded once with the test
+pipeline of the first config, in which `GenSkeFeat` generates the modalities of all the models (the `modality` of
+every config). The models are run together as the streams of a `RecognizerMultiStream`, and the clip-averaged score
+of every model and the fused score (the weighted sum, as `protogcn.smp.comb`, with `--weights` or the weights searched
+by `tools/ensemble.py`) are written in one run:
+
+    python tools/test_ensemble.py configs/ntu60_xsub/{j,b,jm,bm}.py \
+        -C work_dirs/ntu60_xsub/{j,b,jm,bm}/best.pth --weights 2 2 1 1 --out-dir work_dirs/ntu60_xsub/ensemble
+
+writes {out_dir}/{name}.pkl for every model (the format of `tools/test.py --out`, named after the config file) and
+{out_dir}/fusion.pkl, and prints the metrics of all of them. `--launcher pytorch` with `torch.distributed.launch`
+splits the test set as in `tools/test.py`.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='protogcn one-pass ensemble test')
+    parser.add_argument('configs', nargs='+', help='config file of every model')
+    parser.add_argument('-C', '--checkpoints', nargs='+', required=True, help='checkpoint of every model')
+    parser.add_argument(
+        '--weights', type=float, nargs='+', default=None, help='fusion weight of every model, default: 1 for all')
+    parser.add_argument(
+        '--weights-file', default=None, help='fusion weights saved by tools/ensemble.py --out, matched by name')
+    parser.add_argument('--names', nargs='+', default=None, help='name of every model, default: the config names')
+    parser.add_argument('--out-dir', default=None, help='output directory, default: {work_dir of the first}/ensemble')
+    parser.add_argument(
+        '--eval',
+        type=str,
+        nargs='+',
+        default=['top_k_accuracy', 'mean_class_accuracy'],
+        help='evaluation metrics')
+    parser.add_argument('--tmpdir', help='tmp directory used for collecting results from multiple workers')
+    parser.add_argument(
+        '--average-clips', choices=['score', 'prob'], default=None, help='average type when averaging test clips')
+    parser.add_argument(
+        '--videos-per-gpu', type=int, default=None, help='number of test videos per batch on each gpu')
+    parser.add_argument(
+        '--max-testing-views', type=int, default=None, help='max number of clips the backbones process at once')
+    parser.add_argument('--launcher', choices=['pytorch', 'slurm'], default='pytorch', help='job launcher')
+    parser.add_argument('--local_rank', type=int, default=-1)
+    parser.add_argument('--local-rank', type=int, default=-1)
+    args = parser.parse_args()
+    if 'LOCAL_RANK' not in os.environ:
+        os.environ['LOCAL_RANK'] = str(args.local_rank)
+    assert len(args.checkpoints) == len(args.configs), 'Give one checkpoint per config'
+    assert args.weights is None or len(args.weights) == len(args.configs), 'Give one weight per config'
+    return args
+
+
+def default_names(configs):
+    names = [osp.splitext(osp.basename(c))[0] for c in configs]
+    if len(set(names)) < len(names):
+        names = [f'{name}_{i}' for i, name in enumerate(names)]
+    return names
+
+
+def shared_test_data(cfgs, feats):
+    """The test data of the first config, with ``GenSkeFeat`` generating the modalities ``feats``."""
+    data_cfg = copy.deepcopy(cfgs[0].data.test)
+    for cfg in cfgs[1:]:
+        assert (cfg.data.test.ann_file, cfg.data.test.get('split')) == (data_cfg.ann_file, data_cfg.get('split')), \
+            'The models should be tested on the same data'
+        other = [step for step in cfg.data.test.pipeline if step['type'] != 'GenSkeFeat']
+        if other != [step for step in data_cfg.pipeline if step['type'] != 'GenSkeFeat']:
+            mmcv.print_log('The test pipelines differ, the one of the first config is used', 'protogcn')
+    for step in data_cfg.pipeline:
+        if step['type'] == 'GenSkeFeat':
+            step['feats'] = feats
+    data_cfg.test_mode = True
+    return data_cfg
+
+
+def build_ensemble(cfgs, args, names):
+    """Build the models as the streams of a RecognizerMultiStream and load their checkpoints."""
+    test_cfg = dict(cfgs[0].model.get('test_cfg', None) or {})
+    if args.average_clips is not None:
+        test_cfg['average_clips'] = args.average_clips
+    if args.max_testing_views is not None:
+        test_cfg['max_testing_views'] = args.max_testing_views
+    model = build_model(
+        dict(
+            type='RecognizerMultiStream',
+            feats=[cfg.get('modality', 'j') for cfg in cfgs],
+            names=names,
+            fusion_weights=args.weights,
+            backbone=[cfg.model.backbone for cfg in cfgs],
+            cls_head=[cfg.model.cls_head for cfg in cfgs],
+            test_cfg=test_cfg))
+    for stream, checkpoint in zip(model.streams, args.checkpoints):
+        load_checkpoint(stream, cache_checkpoint(checkpoint), map_location='cpu')
+    return model
+
+
+def main():
+    args = parse_args()
+    cfgs = [Config.fromfile(c) for c in args.configs]
+    names = args.names or default_names(args.configs)
+    if args.weights_file is not None:
+        args.weights = load_fusion_weights(args.weights_file, names)
+    out_dir = args.out_dir or osp.join(cfgs[0].work_dir, 'ensemble')
+
+    device = get_device(cfgs[0].get('device', None))
+    dist_params = cfgs[0].get('dist_params', dict(backend='nccl' if device == 'cuda' else 'gloo'))
+    init_dist(args.launcher, **dist_params)
+    rank, _ = get_dist_info()
+    if device == 'cpu':
+        setup_cpu_threads(cfgs[0].data.get('workers_per_gpu', 1), cfgs[0].get('cpu_threads', None))
+
+    model = build_ensemble(cfgs, args, names)
+    dataset = build_dataset(shared_test_data(cfgs, model.input_feats), dict(test_mode=True))
+    dataloader_setting = dict(
+        videos_per_gpu=cfgs[0].data.get('videos_per_gpu', 1),
+        workers_per_gpu=cfgs[0].data.get('workers_per_gpu', 1),
+        pin_memory=device == 'cuda',
+        shuffle=False)
+    dataloader_setting = dict(dataloader_setting, **cfgs[0].data.get('test_dataloader', {}))
+    if args.videos_per_gpu is not None:
+        dataloader_setting['videos_per_gpu'] = args.videos_per_gpu
+    data_loader = build_dataloader(dataset, **dataloader_setting)
+
+    if device == 'cuda':
+        model = MMDistributedDataParallel(
+            model.cuda(), device_ids=[torch.cuda.current_device()], broadcast_buffers=False)
+    else:
+        model = MMDataParallel(model.cpu())
+        if args.tmpdir is None:
+            args.tmpdir = osp.join(out_dir, '.test_tmp')
+
+    dist.barrier()
+    tic = time.time()
+    outputs = multi_gpu_test(model, data_loader, args.tmpdir)
+    elapsed = time.time() - tic
+
+    if rank == 0:
+        mmcv.mkdir_or_exist(out_dir)
+        print(f'\n{len(names)} models on {len(dataset)} samples in {elapsed:.1f}s, modalities decoded once: '
+              f'{", ".join(model.module.input_feats)}')
+        eval_res = dict()
+        for name in ['fusion'] + names:
+            scores = [np.asarray(x[name]) for x in outputs]
+            dataset.dump_results(scores, out=osp.join(out_dir, f'{name}.pkl'))
+            eval_res[name] = dataset.evaluate(scores, metrics=args.eval) if args.eval else dict()
+
+        weights = model.module.fusion_weights
+        metric_names = list(eval_res['fusion'])
+        print(f'\n{"model":<16}{"weight":>8}' + ''.join(f'{m:>22}' for m in metric_names))
+        for name in names + ['fusion']:
+            weight = '' if name == 'fusion' else f'{weights[names.index(name)]:g}'
+            print(f'{name:<16}{weight:>8}' + ''.join(f'{eval_res[name][m]:>22.4f}' for m in metric_names))
+        print(f'\nscores written to {out_dir}')
+    dist.barrier()
+
+
+if __name__ == '__main__':
+    main()
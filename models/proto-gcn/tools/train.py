@@ -7,14 +7,15 @@ import torch
 import torch.distributed as dist
 from mmcv import Config
 from mmcv import digit_version as dv
-from mmcv.runner import get_dist_info, init_dist, set_random_seed
+from mmcv.runner import get_dist_info, set_random_seed
 from mmcv.utils import get_git_hash
 
 from protogcn import __version__
 from protogcn.apis import init_random_seed, train_model
 from protogcn.datasets import build_dataset
 from protogcn.models import build_model
-from protogcn.utils import collect_env, get_root_logger, mc_off, mc_on, test_port
+from protogcn.utils import (collect_env, get_device, get_root_logger, init_dist, mc_off, mc_on, setup_cpu_threads,
+                            test_port)
 
 
 def parse_args():
@@ -70,12 +71,15 @@ def main():
         # use config filename as default work_dir if cfg.work_dir is None
         cfg.work_dir = osp.join('./work_dirs', osp.splitext(osp.basename(args.config))[0])
 
+    cfg.device = get_device(cfg.get('device', None))
     if not hasattr(cfg, 'dist_params'):
-        cfg.dist_params = dict(backend='nccl')
+        cfg.dist_params = dict(backend='nccl' if cfg.device == 'cuda' else 'gloo')
 
     init_dist(args.launcher, **cfg.dist_params)
     rank, world_size = get_dist_info()
     cfg.gpu_ids = range(world_size)
+    if cfg.device == 'cpu':
+        num_threads = setup_cpu_threads(cfg.data.get('workers_per_gpu', 1), cfg.get('cpu_threads', None))
 
     auto_resume = cfg.get('auto_resume', True)
     if auto_resume and cfg.get('resume_from', None) is None:
@@ -105,9 +109,11 @@ def main():
 
     # log some basic info
     logger.info(f'Config: {cfg.pretty_text}')
+    if cfg.device == 'cpu':
+        logger.info(f'Running on CPU with {world_size} processes, {num_threads} threads per process')
 
     # set random seeds
-    seed = init_random_seed(args.seed)
+    seed = init_random_seed(args.seed, device=cfg.device)
     logger.info(f'Set random seed to {seed}, deterministic: {args.deterministic}')
     set_random_seed(seed, deterministic=args.deterministic)
 
@@ -0,0 +1,163 @@
+import argparse
+import os
+import os.path as osp
+import socket
+import time
+import torch
+from mmcv import Config
+
+from protogcn.datasets import build_dataloader, build_dataset
+from protogcn.utils import process_memory, process_tree
+
+"""
+Tune the training DataLoader of a config for the current node.
+
+    python tools/tune_dataloader.py configs/ntu60_xsub/bm_npy.py --ranks 1
+
+The train dataset and pipeline of the config are built, and short probes (without the model) measure the samples/s,
+the time to the first batch (the cost of starting the workers, paid at every epoch without persistent workers) and
+the RSS / PSS of the loader process tree, for the candidate worker counts, prefetch factors, pin memory and
+multiprocessing contexts. The search goes one setting at a time: the worker count first, then the others at the best
+worker count. Every rank of a node gets ``cores / ranks`` cores (as in training, see ``setup_cpu_threads``), the
+probes run on such a slice of the cores. The cheapest setting (fewest workers, then lowest memory) within
+``--tolerance`` of the best samples/s is written as a config override, which inherits the config:
+
+    python tools/train.py configs/ntu60_xsub/bm_npy_loader_8c.py
+
+As the model is not run, the best samples/s is an upper bound of the training speed. On a CPU node the workers take
+cores from the model: give the samples/s of the model as ``--target``, and the fewest workers that reach it are
+chosen. The batch size is the one of the config (``--videos-per-gpu`` probes another one, and writes it).
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Tune the training DataLoader of a config for the current node')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--ranks', type=int, default=None, help='ranks of the node, default: the number of GPUs or 1')
+    parser.add_argument('--videos-per-gpu', type=int, default=None, help='batch size, default: the one of the config')
+    parser.add_argument('--workers', type=int, nargs='+', default=None, help='candidate worker counts')
+    parser.add_argument('--prefetch', type=int, nargs='+', default=[2, 4, 8], help='candidate prefetch factors')
+    parser.add_argument(
+        '--contexts', nargs='+', default=['fork', 'forkserver', 'spawn'], help='candidate multiprocessing contexts')
+    parser.add_argument('--batches', type=int, default=50, help='measured batches of every probe')
+    parser.add_argument('--warmup', type=int, default=5, help='batches before the measure')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='relative samples/s loss allowed to save workers')
+    parser.add_argument('--target', type=float, default=None, help='samples/s of the model, enough for the loader')
+    parser.add_argument('--out', default=None, help='config override to write, default: {config}_loader_{cores}c.py')
+    return parser.parse_args()
+
+
+def default_workers(cores):
+    workers = [0, 1, 2] + list(range(4, cores + 1, 2))
+    return sorted(set(w for w in workers if w <= cores) | {cores})
+
+
+def probe(dataset, videos_per_gpu, setting, batches, warmup):
+    """Measure the DataLoader of ``setting``, over ``batches`` batches after ``warmup`` ones."""
+    kwargs = dict(setting)
+    workers = kwargs.pop('workers')
+    if workers == 0:
+        kwargs.pop('prefetch_factor', None)
+        kwargs.pop('multiprocessing_context', None)
+    # endless, the probe may be longer than an epoch
+    data_loader = build_dataloader(
+        dataset, videos_per_gpu, workers, seed=0, infinite_sampler=True, **kwargs).data_loader
+    tic = time.perf_counter()
+    iterator = iter(data_loader)
+    next(iterator)
+    startup = time.perf_counter() - tic
+    for _ in range(warmup - 1):
+        next(iterator)
+    rss = pss = 0
+    samples = 0
+    tic = time.perf_counter()
+    for i in range(batches):
+        batch = next(iterator)
+        samples += len(next(v for v in batch.values() if isinstance(v, torch.Tensor)))
+        if i % 10 == 0:
+            rss, pss = map(max, zip((rss, pss), process_memory(process_tree())))
+    elapsed = time.perf_counter() - tic
+    del iterator
+    return dict(startup=startup, throughput=samples / elapsed, rss=rss, pss=pss)
+
+
+def describe(setting):
+    workers = setting['workers']
+    prefetch, context = (setting['prefetch_factor'], setting['multiprocessing_context']) if workers else ('-', '-')
+    return f'{workers:>8}{prefetch:>10}{str(setting["pin_memory"]):>6}{context:>12}'
+
+
+def to_dict_str(d):
+    """Format a dict as in the configs: dict(key=value, ...)."""
+    items = (f'{k}={to_dict_str(v) if isinstance(v, dict) else repr(v)}' for k, v in d.items())
+    return f'dict({", ".join(items)})'
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    ranks = args.ranks or max(torch.cuda.device_count(), 1)
+    cores = sorted(os.sched_getaffinity(0))
+    per_rank = max(len(cores) // ranks, 1)
+    # the probes use the cores of one rank, their workers inherit the affinity
+    os.sched_setaffinity(0, cores[:per_rank])
+    torch.set_num_threads(1)
+    videos_per_gpu = args.videos_per_gpu or cfg.data.get('videos_per_gpu', 1)
+    dataset = build_dataset(cfg.data.train)
+    print(f'{socket.gethostname()}: {len(cores)} cores, {ranks} ranks, {per_rank} cores per rank; '
+          f'{len(dataset)} samples, {videos_per_gpu} videos per gpu')
+
+    print(f'\n{"workers":>8}{"prefetch":>10}{"pin":>6}{"context":>12}{"startup":>10}{"samples/s":>11}'
+          f'{"rss MB":>9}{"pss MB":>9}')
+    results = []
+
+    def run(setting):
+        for done, result in results:
+            if done == setting:
+                return result
+        result = probe(dataset, videos_per_gpu, setting, args.batches, args.warmup)
+        results.append((setting, result))
+        print(f'{describe(setting)}{result["startup"]:>9.2f}s{result["throughput"]:>11.1f}'
+              f'{result["rss"] / 2**20:>9.0f}{result["pss"] / 2**20:>9.0f}', flush=True)
+        return result
+
+    def best(settings):
+        return max(settings, key=lambda s: run(s)['throughput'])
+
+    setting = dict(
+        workers=0, prefetch_factor=args.prefetch[0], pin_memory=False, multiprocessing_context=args.contexts[0])
+    setting = best([dict(setting, workers=w) for w in (args.workers or default_workers(per_rank))])
+    if setting['workers'] > 0:
+        setting = best([dict(setting, prefetch_factor=p) for p in args.prefetch])
+        if torch.cuda.is_available():
+            setting = best([dict(setting, pin_memory=p) for p in (False, True)])
+        setting = best([dict(setting, multiprocessing_context=c) for c in args.contexts])
+
+    # the cheapest setting that is fast enough
+    top = max(result['throughput'] for _, result in results)
+    enough = args.target if args.target is not None else top * (1 - args.tolerance)
+    candidates = [(s, r) for s, r in results if r['throughput'] >= min(enough, top)]
+    setting, result = min(candidates, key=lambda x: (x[0]['workers'], x[1]['pss'] or x[1]['rss']))
+    print(f'\nchosen:\n{describe(setting)}{result["startup"]:>9.2f}s{result["throughput"]:>11.1f}'
+          f'{result["rss"] / 2**20:>9.0f}{result["pss"] / 2**20:>9.0f}')
+
+    workers = setting['workers']
+    train_dataloader = dict(pin_memory=setting['pin_memory'])
+    if workers > 0:
+        train_dataloader.update(
+            prefetch_factor=setting['prefetch_factor'], multiprocessing_context=setting['multiprocessing_context'])
+    data = dict(workers_per_gpu=workers, persistent_workers=workers > 0, train_dataloader=train_dataloader)
+    if args.videos_per_gpu is not None:
+        data['videos_per_gpu'] = args.videos_per_gpu
+    out = args.out or f'{osp.splitext(args.config)[0]}_loader_{len(cores)}c.py'
+    base = osp.relpath(osp.abspath(args.config), osp.dirname(osp.abspath(out)))
+    with open(out, 'w') as f:
+        f.write(f'# tools/tune_dataloader.py on {socket.gethostname()} ({len(cores)} cores, {ranks} ranks), '
+                f'{time.strftime("%Y-%m-%d %H:%M")}: {result["throughput"]:.1f} samples/s per rank\n')
+        f.write(f"_base_ = ['./{base}']\n" if not base.startswith('..') else f"_base_ = ['{base}']\n")
+        f.write(f'data = {to_dict_str(data)}\n')
+    print(f'written to {out}')
+
+
+if __name__ == '__main__':
+    main()